@@ -1,16 +1,18 @@
 import logging
 from typing import Any
 
-from fastapi import APIRouter, Depends, WebSocket
+from fastapi import APIRouter, Depends, Query, WebSocket
 from fastapi.encoders import jsonable_encoder
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from cache.redis import redis_connect_async
+from cache.broadcast import broadcast
+from app.schemas.stream import EVENTS_CHANNELS, events_channel
 
 from app import crud, models, schemas, utils
 from app.api import deps
 from app.core import exceptions as exc
 from app.core.celery_app import celery_app
+from app.core.config import settings
 from app.utils import APIResponse, APIResponseType
 from app.parking.repo import equipment_repo
 from app.utils import PaginatedContent
@@ -69,21 +71,26 @@ async def read_events(
 
 
 @router.websocket("/events")
-async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
-    connection = await redis_connect_async(240)  # 3 mins
-    async with connection.pubsub() as channel:
-        await channel.subscribe("events:1")
-        try:
-            while True:
-                data = await channel.get_message(
-                    ignore_subscribe_messages=True, timeout=240
-                )
-                if data and "data" in data:
-                    print(data["data"])
-                    await websocket.send_text(data["data"])
-        finally:
-            channel.unsubscribe("events:1")
+async def websocket_endpoint(
+    websocket: WebSocket,
+    camera_ids: list[int] | None = Query(None),
+    zone_ids: list[int] | None = Query(None),
+    plate_prefix: str | None = None,
+    type_events: list[schemas.TypeEvent] | None = Query(None),
+):
+    """
+    events of camera_ids (all by default), in zone_ids, with plate_prefix
+    and of type_events, as MessagePack frames when the msgpack subprotocol
+    is offered
+    """
+    binary = await broadcast.accept(websocket)
+    channels, match = schemas.StreamFilter(
+        zone_ids=zone_ids,
+        camera_ids=camera_ids,
+        plate_prefix=plate_prefix,
+        type_events=type_events,
+    ).subscription("camera_ids", events_channel, EVENTS_CHANNELS)
+    await broadcast.stream(websocket, channels, match=match, binary=binary)
 
 
 @router.post("/")
@@ -121,6 +128,42 @@ async def create_event(
     return APIResponse(f"This id task => {result.task_id}")
 
 
+@router.post("/bulk")
+async def create_events_bulk(
+    *,
+    _: Annotated[
+        bool,
+        Depends(
+            RoleChecker(
+                allowed_roles=[
+                    UserRoles.ADMINISTRATOR,
+                    UserRoles.PARKING_MANAGER,
+                ]
+            )
+        ),
+    ],
+    events_in: list[schemas.EventCreate],
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> APIResponseType[Any]:
+    """
+    Create new items in one batch.
+    user access to this [ ADMINISTRATOR , PARKING_MANAGER ] \n
+    used by edge controllers to replay the reads buffered while offline,
+    at most EVENTS_BULK_MAX_SIZE events per call
+    """
+    if not events_in or len(events_in) > settings.EVENTS_BULK_MAX_SIZE:
+        raise exc.ServiceFailure(
+            detail=f"send between 1 and {settings.EVENTS_BULK_MAX_SIZE} events",
+            msg_code=utils.MessageCodes.invalid_input,
+        )
+    result = celery_app.send_task(
+        "add_events_bulk",
+        args=[jsonable_encoder(events_in)],
+    )
+
+    return APIResponse(f"This id task => {result.task_id}")
+
+
 @router.get("/{id}")
 async def read_event(
     *,
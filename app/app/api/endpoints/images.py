@@ -1,18 +1,28 @@
-import io
 import logging
 import base64
 import json
+import mimetypes
+import re
+from email.utils import format_datetime
 from typing import Any, Annotated
 
 from fastapi import APIRouter, Depends, Query, UploadFile, HTTPException
+from minio.datatypes import Object
+from minio.error import S3Error
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from starlette.responses import StreamingResponse
+from starlette.requests import Request
+from starlette.responses import RedirectResponse, Response, StreamingResponse
 
 from app import crud, schemas, utils
 from app.api import deps
+from app.api.services import images_services
 from app.core import exceptions as exc
+from app.core.celery_app import celery_app
+from app.core.config import ThumbnailFormat, settings
 from app.utils import APIResponse, APIResponseType, storage
+from app.utils.image_urls import image_urls
+from cache.cache import single_flight
 from app.acl.role_checker import RoleChecker
 from app.acl.role import UserRoles
 from app.parking.repo import equipment_repo
@@ -22,6 +32,8 @@ logger = logging.getLogger(__name__)
 
 namespace = "images"
 
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)")
+
 
 def validate_camera(db: AsyncSession, camera_id: int) -> None:
     """Check if the camera exists."""
@@ -37,6 +49,119 @@ def parse_metadata(metadata: str | None) -> dict | None:
     return json.loads(metadata) if metadata else None
 
 
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """
+    First and last byte of a single range, None to send the whole file.
+
+    Malformed and multiple ranges are ignored, raises ValueError when the
+    range is outside the file.
+    """
+    match = RANGE_PATTERN.fullmatch(header.strip()) if header else None
+    if match is None or match.group(1) == match.group(2) == "":
+        return None
+    start, end = match.groups()
+    if not start:
+        # suffix, the last `end` bytes
+        if int(end) == 0 or size == 0:
+            raise ValueError(header)
+        return max(size - int(end), 0), size - 1
+    first = int(start)
+    last = min(int(end), size - 1) if end else size - 1
+    if end and int(end) < first:
+        return None
+    if first >= size:
+        raise ValueError(header)
+    return first, last
+
+
+async def stat_minio(bucket_name: str, file_name: str) -> Object | None:
+    """Metadata of a file of MinIO, None when it doesn't exist."""
+    try:
+        return await storage.get_minio().stat_file(bucket_name, file_name)
+    except S3Error as e:
+        if e.code not in ("NoSuchKey", "NoSuchBucket"):
+            raise
+        return None
+
+
+async def stream_minio(
+    request: Request,
+    bucket_name: str,
+    file_name: str,
+    stat: Object | None = None,
+    headers: dict | None = None,
+) -> Response:
+    """
+    Stream a file of MinIO as it is read, or the part of it asked with a
+    Range header.
+    """
+    client = storage.get_minio()
+    if stat is None:
+        stat = await stat_minio(bucket_name, file_name)
+    if stat is None:
+        raise exc.ServiceFailure(
+            detail="Image Not Found",
+            msg_code=utils.MessageCodes.not_found,
+        )
+    headers = {
+        **(headers or {}),
+        "Accept-Ranges": "bytes",
+        "ETag": f'"{stat.etag}"',
+    }
+    if stat.last_modified is not None:
+        headers["Last-Modified"] = format_datetime(
+            stat.last_modified, usegmt=True
+        )
+    # weak comparison, W/"x" matches "x"
+    if_none_match = [
+        tag.strip().removeprefix("W/")
+        for tag in request.headers.get("if-none-match", "").split(",")
+    ]
+    if headers["ETag"] in if_none_match or if_none_match == ["*"]:
+        return Response(status_code=304, headers=headers)
+    content_type = stat.content_type
+    if not content_type or content_type == "application/octet-stream":
+        # uploads don't set one
+        content_type = mimetypes.guess_type(file_name)[0] or "image/png"
+    try:
+        byte_range = parse_range(request.headers.get("range"), stat.size)
+    except ValueError:
+        return Response(
+            status_code=416,
+            headers={**headers, "Content-Range": f"bytes */{stat.size}"},
+        )
+    status_code, offset, length = 200, 0, stat.size
+    if byte_range is not None:
+        first, last = byte_range
+        status_code, offset, length = 206, first, last - first + 1
+        headers["Content-Range"] = f"bytes {first}-{last}/{stat.size}"
+    headers["Content-Length"] = str(length)
+    response = await client.open_file(bucket_name, file_name, offset, length)
+    return StreamingResponse(
+        client.iter_file(response),
+        status_code=status_code,
+        headers=headers,
+        media_type=content_type,
+    )
+
+
+async def serve_image(request: Request, image: Any) -> Response:
+    """
+    Serve an image from MinIO or from the database, wherever its bytes are
+    while images are being moved to MinIO.
+    """
+    if image is not None and image.path_image:
+        bucket_name, path_image = image.path_image.split("/", 1)
+        return await stream_minio(request, bucket_name, path_image)
+    if image is not None and image.image is not None:
+        _, content_type = images_services.guess_image_type(image.image)
+        return Response(image.image, media_type=content_type or "image/png")
+    raise exc.ServiceFailure(
+        detail="Image Not Found",
+        msg_code=utils.MessageCodes.not_found,
+    )
+
+
 async def handle_image_storage(
     save_as: schemas.image.ImageSaveAs,
     file_in: UploadFile,
@@ -45,16 +170,16 @@ async def handle_image_storage(
     camera_id: int | None,
 ) -> Any:
     """Handle image storage logic based on save_as type."""
-    file_content = await file_in.read()
-    
     if save_as == schemas.image.ImageSaveAs.minio:
-        file_bytes = io.BytesIO(file_content)
-        client = storage.get_client(name=save_as)
-        path_file = client.upload_file(
-            content=file_bytes,
+        # streamed from the spooled file, never read whole into memory
+        client = await storage.get_client(name=save_as)
+        await file_in.seek(0)
+        path_file = await client.upload_files(
+            content=file_in.file,
             name=file_in.filename,
             size=file_in.size,
             metadata=metadata,
+            content_type=file_in.content_type,
         )
         obj_in = schemas.image.ImageCreate(
             path_image=path_file, additional_data=metadata, camera_id=camera_id
@@ -62,6 +187,7 @@ async def handle_image_storage(
         return await crud.image.create_path(db, obj_in=obj_in.model_dump())
 
     elif save_as == schemas.image.ImageSaveAs.database:
+        file_content = await file_in.read()
         file_base64 = base64.b64encode(file_content).decode("utf-8")
         obj_in = schemas.image.ImageCreate(
             image=file_base64, additional_data=metadata, camera_id=camera_id
@@ -97,6 +223,8 @@ async def create_image(
 
     metadata_dict = parse_metadata(metadata)
     image = await handle_image_storage(save_as, file_in, metadata_dict, db, camera_id)
+    if settings.THUMBNAIL_EAGER:
+        celery_app.send_task("make_thumbnails", args=[image.id])
     return APIResponse(image)
 
 
@@ -129,6 +257,7 @@ async def read_image_binary(
         bool,
         Depends(RoleChecker(allowed_roles=[UserRoles.ADMINISTRATOR])),
     ],
+    request: Request,
     db: AsyncSession = Depends(deps.get_db_async),
     id: int = None,
 ) -> StreamingResponse:
@@ -138,12 +267,7 @@ async def read_image_binary(
     User access: [ADMINISTRATOR]
     """
     image = await crud.image.get(db=db, id=id)
-    if not image:
-        raise exc.ServiceFailure(
-            detail="Image Not Found",
-            msg_code=utils.MessageCodes.not_found,
-        )
-    return StreamingResponse(io.BytesIO(image.image), media_type="image/png")
+    return await serve_image(request, image)
 
 
 @router.get("/get-image-minio/{id}")
@@ -158,24 +282,84 @@ async def read_minio(
             ]
         )),
     ],
+    request: Request,
     db: AsyncSession = Depends(deps.get_db_async),
     id: int = None,
 ) -> StreamingResponse:
     """
-    Get an image stored in MinIO by ID.
+    Get an image stored in MinIO (or not moved from the database yet) by ID,
+    supports Range requests. Redirects to a presigned MinIO URL in
+    presigned image access mode.
 
     User access: [ADMINISTRATOR, PARKING_MANAGER, APPS]
     """
+    if image_urls.enabled:
+        url = await image_urls.get(db, id)
+        if url is not None:
+            return RedirectResponse(url, status_code=302)
     image = await crud.image.get(db=db, id=id)
-    if not image:
+    return await serve_image(request, image)
+
+
+@router.get("/thumbnail/{id}")
+async def read_thumbnail(
+    _: Annotated[
+        bool,
+        Depends(
+            RoleChecker(
+                allowed_roles=[
+                    UserRoles.ADMINISTRATOR,
+                    UserRoles.PARKING_MANAGER,
+                    UserRoles.APPS,
+                ]
+            )
+        ),
+    ],
+    request: Request,
+    db: AsyncSession = Depends(deps.get_db_async),
+    *,
+    id: int,
+    size: int = settings.THUMBNAIL_LIST_SIZE,
+    format: ThumbnailFormat = settings.THUMBNAIL_FORMAT,
+) -> StreamingResponse:
+    """
+    Get a thumbnail of an image by ID, made on its first request and kept
+    in MinIO. size is one of THUMBNAIL_SIZES.
+
+    User access: [ADMINISTRATOR, PARKING_MANAGER, APPS]
+    """
+    if size not in settings.THUMBNAIL_SIZES:
+        raise exc.ServiceFailure(
+            detail=f"size should be one of {settings.THUMBNAIL_SIZES}",
+            msg_code=utils.MessageCodes.invalid_input,
+        )
+    # thumbnails of an image never change
+    headers = {
+        "Cache-Control": (
+            f"private, max-age={settings.THUMBNAIL_MAX_AGE}, immutable"
+        )
+    }
+    bucket_name = settings.MINIO_BUCKET_NAME
+    file_name = images_services.thumbnail_name(id, size, format)
+    stat = await stat_minio(bucket_name, file_name)
+    if stat is not None:
+        return await stream_minio(
+            request, bucket_name, file_name, stat=stat, headers=headers
+        )
+
+    async def create():
+        image = await crud.image.get(db=db, id=id)
+        return await images_services.create_thumbnail(image, size, format)
+
+    # concurrent first requests make it once
+    _, thumbnail = await single_flight(file_name, create)
+    if thumbnail is None:
         raise exc.ServiceFailure(
             detail="Image Not Found",
             msg_code=utils.MessageCodes.not_found,
         )
-    bucket_name, path_image = image.path_image.split("/", 1)
-    client = storage.get_client(name=schemas.image.ImageSaveAs.minio)
-    file = client.download_file(bucket_name=bucket_name, file_name=path_image)
-    return StreamingResponse(io.BytesIO(file.read()), media_type="image/png")
+    _, content_type = images_services.THUMBNAIL_TYPES[format]
+    return Response(thumbnail, media_type=content_type, headers=headers)
 
 
 @router.delete("/{id}")
@@ -198,5 +382,14 @@ async def delete_image(
             detail="Image Not Found",
             msg_code=utils.MessageCodes.not_found,
         )
+    path_image = image.path_image
     deleted_image = crud.image.remove_base64(db=db, id=id)
+    image_urls.forget(id)
+    # thumbnails are served as immutable, they go with their image
+    try:
+        await storage.get_minio().remove_files(
+            images_services.image_files(id, path_image)
+        )
+    except Exception as e:
+        logger.error(f"removing files of image {id} failed {e}")
     return APIResponse(deleted_image)
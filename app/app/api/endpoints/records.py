@@ -8,10 +8,12 @@ from app.api import deps
 from app.api.services import records_services
 from app.core import exceptions as exc
 from app.utils import APIResponse, APIResponseType
+from app.utils.image_urls import RECORD_IMAGE_FIELDS, image_urls
 from app.acl.role_checker import RoleChecker
 from app.acl.role import UserRoles
 from typing import Annotated, Optional, List, Any
-from cache.redis import redis_connect_async
+from app.schemas.stream import RECORDS_CHANNELS, records_channel
+from cache.broadcast import broadcast
 
 
 logger = logging.getLogger(__name__)
@@ -53,6 +55,7 @@ async def read_records(
         input_camera_entrance_id=input_camera_entrance_id,
         input_camera_exit_id=input_camera_exit_id,
     )
+    await image_urls.attach(db, records.items, RECORD_IMAGE_FIELDS)
 
     return APIResponse(records)
 
@@ -138,6 +141,7 @@ async def read_record(
         exc.ServiceFailure(
             detail="Record Not Found", msg_code=utils.MessageCodes.not_found
         )
+    await image_urls.attach(db, [record], RECORD_IMAGE_FIELDS)
     return APIResponse(record)
 
 
@@ -207,22 +211,21 @@ async def update_record(
 
 
 @router.websocket("/records")
-async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
-    connection = await redis_connect_async(240)  # 3 mins
-    async with connection.pubsub() as channel:
-        await channel.subscribe("records:1")
-        try:
-            while True:
-                data = await channel.get_message(
-                    ignore_subscribe_messages=True, timeout=240
-                )
-                # data = await websocket.receive_text()
-                if data and "data" in data:
-                    print(data["data"])
-                    await websocket.send_text(data["data"])
-        except:
-            channel.unsubscribe("records:1")
+async def websocket_endpoint(
+    websocket: WebSocket,
+    zone_ids: list[int] | None = Query(None),
+    camera_ids: list[int] | None = Query(None),
+    plate_prefix: str | None = None,
+):
+    """
+    records of zone_ids (all by default), on camera_ids, with plate_prefix,
+    as MessagePack frames when the msgpack subprotocol is offered
+    """
+    binary = await broadcast.accept(websocket)
+    channels, match = schemas.StreamFilter(
+        zone_ids=zone_ids, camera_ids=camera_ids, plate_prefix=plate_prefix
+    ).subscription("zone_ids", records_channel, RECORDS_CHANNELS)
+    await broadcast.stream(websocket, channels, match=match, binary=binary)
 
 
 @router.post("/excel")
@@ -10,9 +10,12 @@ from sqlalchemy.orm import Session
 from app import models, schemas
 from app.api import deps
 from app.core.config import settings
+from app.db.outbox import publisher
 from app.jobs.celery.worker import test_celery as test_celery_task
+from app.plate.cache import plate_list_cache
 from app.utils import APIResponse, APIResponseType
 from cache import Cache
+from cache.broadcast import broadcast
 
 router = APIRouter()
 namespace = "utils"
@@ -51,6 +54,40 @@ async def test_redis() -> Any:
         return {"msg": f"ERROR: {str(e)}"}
 
 
+@router.get(
+    "/cache-stats/",
+    dependencies=[Depends(deps.get_current_active_superuser)],
+)
+async def cache_stats() -> Any:
+    """
+    Per namespace hits, misses and evictions of this process' api cache.
+    """
+    return Cache().local.stats()
+
+
+@router.get(
+    "/plate-cache-stats/",
+    dependencies=[Depends(deps.get_current_active_superuser)],
+)
+async def plate_cache_stats() -> Any:
+    """
+    Size, hits, misses and invalidations of this process' plate list cache.
+    """
+    return plate_list_cache.stats()
+
+
+@router.get(
+    "/ws-stats/",
+    dependencies=[Depends(deps.get_current_active_superuser)],
+)
+async def ws_stats() -> Any:
+    """
+    Per channel websocket subscribers, messages and drops of this process,
+    and what its post-commit publisher sent.
+    """
+    return {**broadcast.stats(), "publisher": publisher.stats()}
+
+
 @router.websocket("/echo-client/")
 async def echo_client(
     websocket: WebSocket,
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image as PILImage
+from sqlalchemy.orm import Session
+
+from app import crud, models
+from app.core.config import ThumbnailFormat, settings
+from app.utils import storage
+from cache.redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+# folder of the bucket images moved out of the database are put in
+MIGRATED_FOLDER = "db-images"
+# id of the last image moved, images before it were all moved
+MIGRATED_UNTIL_KEY = "images:migrated_until"
+# folder of the bucket thumbnails are put in, one folder per image
+THUMBNAILS_FOLDER = "thumbnails"
+
+# extension and content type of each thumbnail format
+THUMBNAIL_TYPES = {
+    ThumbnailFormat.JPEG: ("jpg", "image/jpeg"),
+    ThumbnailFormat.WEBP: ("webp", "image/webp"),
+}
+
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "jpg", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png", "image/png"),
+    (b"GIF8", "gif", "image/gif"),
+    (b"BM", "bmp", "image/bmp"),
+)
+
+
+def guess_image_type(content: bytes) -> tuple[str | None, str | None]:
+    """Extension and content type of image bytes, from their signature."""
+    for signature, extension, content_type in IMAGE_SIGNATURES:
+        if content.startswith(signature):
+            return extension, content_type
+    if content[8:12] == b"WEBP":
+        return "webp", "image/webp"
+    return None, None
+
+
+def upload_blob(client: storage.MinIOAsync, image: models.Image) -> str:
+    if image.path_image:
+        # already there, only the bytes are left to drop
+        return image.path_image
+    extension, content_type = guess_image_type(image.image)
+    name = f"{MIGRATED_FOLDER}/{image.id}"
+    if extension:
+        name = f"{name}.{extension}"
+    return client.upload_file_sync(
+        BytesIO(image.image),
+        name=name,
+        size=len(image.image),
+        metadata=None,
+        content_type=content_type,
+    )
+
+
+def migrate_blobs(
+    db: Session, batch_size: int, after_id: int = 0
+) -> tuple[int, int | None]:
+    """
+    Move the bytes of one batch of images after `after_id` from the
+    database to minio, returns their count and the last id.
+
+    Uploads run in parallel, and the images are pointed at their copies
+    and their bytes dropped in the same transaction, so a failed batch is
+    simply uploaded again by the next run.
+    """
+    images = crud.image.get_blobs(db, limit=batch_size, after_id=after_id)
+    if not images:
+        db.commit()
+        return 0, None
+    client = storage.get_minio()
+    with ThreadPoolExecutor(
+        max_workers=settings.MINIO_MAX_CONNECTIONS
+    ) as executor:
+        paths = list(
+            executor.map(lambda image: upload_blob(client, image), images)
+        )
+    crud.image.set_paths(db, images=images, paths=paths)
+    db.commit()
+    return len(images), images[-1].id
+
+
+def migrate_to_minio(db: Session, batch_size: int, duration: float) -> str:
+    """
+    Move images to minio batch by batch, for up to `duration` seconds.
+
+    Each batch starts after the last image moved, kept across runs, so the
+    images moved already are not scanned again. Deleting the key starts
+    over from the first image.
+    """
+    deadline = time.monotonic() + duration
+    after_id = int(redis_client.get(MIGRATED_UNTIL_KEY) or 0)
+    moved = 0
+    while time.monotonic() < deadline:
+        count, last_id = migrate_blobs(db, batch_size, after_id)
+        moved += count
+        if last_id is not None:
+            after_id = last_id
+            redis_client.set(MIGRATED_UNTIL_KEY, after_id)
+        if count < batch_size:
+            break
+    return f"moved {moved} images from the database to minio"
+
+
+def image_files(image_id: int, path_image: str | None) -> list[str]:
+    """`bucket/name` of the minio files of an image, thumbnails included."""
+    bucket_name = settings.MINIO_BUCKET_NAME
+    files = [
+        f"{bucket_name}/{thumbnail_name(image_id, size, format)}"
+        for size in settings.THUMBNAIL_SIZES
+        for format in ThumbnailFormat
+    ]
+    if path_image:
+        files.append(path_image)
+    return files
+
+
+def thumbnail_name(image_id: int, size: int, format: ThumbnailFormat) -> str:
+    extension, _ = THUMBNAIL_TYPES[format]
+    return f"{THUMBNAILS_FOLDER}/{image_id}/{size}.{extension}"
+
+
+def make_thumbnail(
+    content: bytes, size: int, format: ThumbnailFormat
+) -> bytes:
+    """Shrink an image to fit in `size` pixels, never enlarges it."""
+    with PILImage.open(BytesIO(content)) as image:
+        # jpeg frames are decoded at the smallest scale still large enough
+        image.draft("RGB", (size, size))
+        image = image.convert("RGB")
+    image.thumbnail((size, size), PILImage.Resampling.BILINEAR, reducing_gap=2)
+    output = BytesIO()
+    image.save(
+        output, format=format.value.upper(), quality=settings.THUMBNAIL_QUALITY
+    )
+    return output.getvalue()
+
+
+async def read_image(image: models.Image | None) -> bytes | None:
+    """Bytes of an image, from minio or from the database."""
+    if image is None:
+        return None
+    if image.path_image:
+        bucket_name, file_name = image.path_image.split("/", 1)
+        file = await storage.get_minio().download_file(bucket_name, file_name)
+        return file.getvalue()
+    return image.image
+
+
+async def create_thumbnail(
+    image: models.Image, size: int, format: ThumbnailFormat
+) -> bytes | None:
+    """Make a thumbnail of an image and store it for the next requests."""
+    content = await read_image(image)
+    if content is None:
+        return None
+    thumbnail = await asyncio.to_thread(make_thumbnail, content, size, format)
+    _, content_type = THUMBNAIL_TYPES[format]
+    await storage.get_minio().upload_files(
+        BytesIO(thumbnail),
+        name=thumbnail_name(image.id, size, format),
+        size=len(thumbnail),
+        metadata=None,
+        content_type=content_type,
+    )
+    return thumbnail
+
+
+def create_thumbnails(db: Session, image_id: int) -> str:
+    """Make every thumbnail size of an image, in the default format."""
+    content = crud.image.get_image(db, id=image_id)
+    if content is None:
+        return f"image {image_id} has no bytes"
+    format = settings.THUMBNAIL_FORMAT
+    _, content_type = THUMBNAIL_TYPES[format]
+    client = storage.get_minio()
+    for size in settings.THUMBNAIL_SIZES:
+        thumbnail = make_thumbnail(content, size, format)
+        client.upload_file_sync(
+            BytesIO(thumbnail),
+            name=thumbnail_name(image_id, size, format),
+            size=len(thumbnail),
+            metadata=None,
+            content_type=content_type,
+        )
+    return (
+        f"made {len(settings.THUMBNAIL_SIZES)} thumbnails of image {image_id}"
+    )
@@ -1,6 +1,11 @@
-from fastapi import APIRouter, Depends, WebSocket
+from fastapi import APIRouter, Depends, Query, WebSocket
 from sqlalchemy.ext.asyncio import AsyncSession
-from cache.redis import redis_connect_async
+from cache.broadcast import broadcast
+from app.schemas.stream import (
+    BILLS_CHANNELS,
+    StreamFilter,
+    bills_channel,
+)
 from datetime import datetime
 from app import models
 from app.api import deps
@@ -17,6 +22,13 @@ from app.acl.role import UserRoles
 from typing import Annotated, Any
 from app.plate.repo import plate_repo
 from app.plate.schemas import PlateType
+from app.report.cache import ReportCachePolicy
+from app.utils.image_urls import (
+    BILL_IMAGE_FIELDS,
+    RECORD_IMAGE_FIELDS,
+    image_urls,
+)
+from cache import cache
 import logging
 from fastapi.responses import StreamingResponse
 
@@ -25,7 +37,37 @@ namespace = "bill"
 logger = logging.getLogger(__name__)
 
 
+def _bills_end_time(kwargs: dict) -> datetime | None:
+    # jalali ranges are parsed by the repo, those are left live
+    jalali_date = kwargs.get("jalali_date")
+    if jalali_date is not None and jalali_date.end_jalali_date:
+        return None
+    return kwargs["params"].input_end_time
+
+
+bills_by_range = ReportCachePolicy(
+    end_time=_bills_end_time,
+    zone_id=lambda kwargs: kwargs["params"].input_zone_id,
+)
+
+
+def _bills_expire(kwargs: dict) -> int:
+    expire = bills_by_range.expire(kwargs)
+    if image_urls.enabled:
+        # cached bills carry presigned urls, keep them short of expiring
+        return min(expire, image_urls.margin // 2)
+    return expire
+
+
+async def _attach_image_urls(db: AsyncSession, bills: list) -> None:
+    await image_urls.attach(db, bills, BILL_IMAGE_FIELDS)
+    await image_urls.attach(
+        db, [bill.record for bill in bills], RECORD_IMAGE_FIELDS
+    )
+
+
 @router.get("/")
+@cache(namespace=bills_by_range.namespace, expire=_bills_expire)
 async def read_bill(
     _: Annotated[
         bool,
@@ -51,6 +93,7 @@ async def read_bill(
     bills, count = await services.get_multi_by_filters(
         db, params=params, jalali_date=jalali_date
     )
+    await _attach_image_urls(db, bills)
     return APIResponse(
         PaginatedContent(
             data=bills,
@@ -89,6 +132,7 @@ async def get_bill(
             detail="bill not found",
             msg_code=MessageCodes.not_found,
         )
+    await _attach_image_urls(db, bill)
     return APIResponse(bill[0])
 
 
@@ -347,20 +391,22 @@ async def download_excel(
 
 
 @router.websocket("/bills")
-async def websocket_endpoint(websocket: WebSocket, camera_id: int):
-    await websocket.accept()
-    connection = await redis_connect_async(240)  # 3 mins
-    async with connection.pubsub() as channel:
-        await channel.subscribe(f"bills:camera_{camera_id}")
-
-        try:
-            while True:
-                data = await channel.get_message(
-                    ignore_subscribe_messages=True, timeout=240
-                )
-                # data = await websocket.receive_text()
-                if data and "data" in data:
-                    print(data["data"])
-                    await websocket.send_text(data["data"])
-        except:
-            channel.unsubscribe(f"bills:camera_{camera_id}")
+async def websocket_endpoint(
+    websocket: WebSocket,
+    camera_id: int | None = None,
+    camera_ids: list[int] | None = Query(None),
+    zone_ids: list[int] | None = Query(None),
+    plate_prefix: str | None = None,
+):
+    """
+    bills of camera_id or camera_ids (all by default), in zone_ids, with
+    plate_prefix, as MessagePack frames when the msgpack subprotocol is
+    offered
+    """
+    binary = await broadcast.accept(websocket)
+    if camera_id is not None:
+        camera_ids = [camera_id, *(camera_ids or [])]
+    channels, match = StreamFilter(
+        zone_ids=zone_ids, camera_ids=camera_ids, plate_prefix=plate_prefix
+    ).subscription("camera_ids", bills_channel, BILLS_CHANNELS)
+    await broadcast.stream(websocket, channels, match=match, binary=binary)
@@ -11,12 +11,11 @@ from .schemas.bill import (
     OrderByBill,
 )
 from app.parking.models import Zone
-from app.report.schemas import Timing
 from sqlalchemy import false
 from sqlalchemy.orm import aliased
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import func, and_
+from sqlalchemy import func
 from datetime import datetime, UTC
 from typing import Awaitable
 from app.models import Record, Image
@@ -240,59 +239,6 @@ class BillRepository(CRUDBase[Bill, BillCreate, BillUpdate]):
 
         return [items, count]
 
-    async def get_price_income(
-        self,
-        db: AsyncSession,
-        *,
-        start_time_in: datetime = None,
-        end_time_in: datetime = None,
-        zone_id: int = None,
-    ):
-        filters = [Bill.is_deleted == false()]
-
-        if start_time_in is not None and end_time_in is not None:
-            filters.append(Bill.created.between(start_time_in, end_time_in))
-
-        if zone_id is not None:
-            filters.append(Bill.zone_id.in_(zone_id))
-
-        query_sum_price_bill = select(
-            func.count(), func.sum(Bill.price)
-        ).filter(*filters)
-
-        filters_income = filters
-
-        filters_income.append(Bill.status == StatusBill.paid)
-
-        query_sum_income_bill = select(func.sum(Bill.price)).filter(
-            *filters_income
-        )
-
-        total_income = await db.scalar(query_sum_income_bill)
-
-        if total_income == None or total_income == 0:
-            total_income = 0
-
-        count, total_price = (
-            await db.execute(query_sum_price_bill)
-        ).fetchone()
-
-        if total_price is None or total_price == 0:
-            total_price = 0
-
-        return total_price, total_income
-
-    async def get_total_amount_bill(
-        self, db: AsyncSession, start_time: datetime | None = None
-    ):
-
-        return await db.scalar(
-            select(func.sum(Bill.price)).filter(
-                Bill.is_deleted == False,
-                Bill.created >= start_time,
-            )
-        )
-
     async def get_camera_by_image_id(self, db: AsyncSession, img_id: int):
 
         query = (
@@ -304,97 +250,6 @@ class BillRepository(CRUDBase[Bill, BillCreate, BillUpdate]):
 
         return await db.scalar(query.filter(*[Bill.is_deleted == False]))
 
-    async def get_total_price_count(
-        self,
-        db: AsyncSession,
-        *,
-        zone_id: int,
-        start_time_in: datetime,
-        end_time_in: datetime,
-    ):
-
-        filters = [Bill.is_deleted == False]
-
-        if zone_id is not None:
-            filters.append(Bill.zone_id == zone_id)
-        if start_time_in is not None:
-            filters.append(Bill.created >= start_time_in)
-        if end_time_in is not None:
-            filters.append(Bill.created <= end_time_in)
-
-        query_total_count_price = select(
-            func.sum(Bill.price),
-            func.count(),
-        ).filter(*filters)
-
-        excute_query_total_count_price = await db.execute(
-            query_total_count_price
-        )
-        fetch_query_total_count_price = (
-            excute_query_total_count_price.fetchone()
-        )
-
-        query_get_paid_price_count = select(
-            func.sum(Bill.price), func.count()
-        ).filter(*filters, Bill.status == StatusBill.paid)
-
-        excute_query_get_paid_price_count = await db.execute(
-            query_get_paid_price_count
-        )
-        fetch_query_get_paid_price_count = (
-            excute_query_get_paid_price_count.fetchone()
-        )
-
-        query_get_unpaid_price_count = select(
-            func.sum(Bill.price), func.count()
-        ).filter(*filters, Bill.status == StatusBill.unpaid)
-
-        excute_query_get_unpaid_price_count = await db.execute(
-            query_get_unpaid_price_count
-        )
-        fetch_query_get_unpaid_price_count = (
-            excute_query_get_unpaid_price_count.fetchone()
-        )
-
-        return (
-            fetch_query_total_count_price,
-            fetch_query_get_paid_price_count,
-            fetch_query_get_unpaid_price_count,
-        )
-
-    async def get_total_price_by_timing(
-        self,
-        db: AsyncSession,
-        *,
-        timing: Timing,
-        zone_id: int,
-        start_time_in: datetime,
-        end_time_in: datetime,
-    ):
-
-        filters = [Bill.is_deleted == False]
-
-        if zone_id is not None:
-            filters.append(Bill.zone_id == zone_id)
-        if start_time_in is not None:
-            filters.append(Bill.created >= start_time_in)
-        if end_time_in is not None:
-            filters.append(Bill.created <= end_time_in)
-
-        query = (
-            select(
-                func.date_trunc(timing, Bill.created).label(timing),
-                func.sum(Bill.price),
-            )
-            .filter(*filters)
-            .group_by(timing)
-        )
-
-        excute_query_total_count_price = await db.execute(query)
-        fetch_query_total_price = excute_query_total_count_price.fetchall()
-
-        return fetch_query_total_price
-
     async def get(
         self, db: AsyncSession, id: int, for_update: bool = False
     ) -> Bill | Awaitable[Bill]:
@@ -407,44 +262,6 @@ class BillRepository(CRUDBase[Bill, BillCreate, BillUpdate]):
 
         return await self._first(db.scalars(query))
 
-    async def avg_price_per_referred(
-        self,
-        db: AsyncSession,
-        start_time_in: datetime,
-        end_time_in: datetime,
-        zone_id: int,
-    ):
-
-        filters = [Bill.is_deleted == False]
-
-        if start_time_in is not None and end_time_in is not None:
-            filters.append(
-                and_(
-                    Bill.created.between(start_time_in, end_time_in),
-                    Record.start_time.between(start_time_in, end_time_in),
-                )
-            )
-        if zone_id is not None:
-            filters.append(Bill.zone_id == zone_id)
-            filters.append(Record.zone_id == zone_id)
-        query = (
-            select(
-                func.count(Record.id).label("count"),
-                func.sum(Bill.price).label("price"),
-            )
-            .where(and_(*filters))
-            .join(Record)
-        )
-
-        execute = await db.execute(query)
-
-        count, total_price = execute.fetchone()
-
-        if count is None or count == 0:
-            return 0
-
-        return round(total_price / count)
-
     async def get_and_lock(
         self, db: AsyncSession, id: int, for_update: bool = False
     ) -> Bill | Awaitable[Bill]:
@@ -156,6 +156,12 @@ class Bill(BillInDBBase):
     camera_exit: str | None = None
     user_paid_name: str | None = None
     record: schemas.Record | None = None
+    # presigned image urls, see IMAGE_ACCESS_MODE
+    img_entrance_url: str | None = None
+    img_exit_url: str | None = None
+    # list size thumbnails, see THUMBNAIL_LIST_SIZE
+    img_entrance_thumbnail_url: str | None = None
+    img_exit_thumbnail_url: str | None = None
 
 
 class BillB2B(BaseModel):
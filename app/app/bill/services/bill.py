@@ -1,24 +1,26 @@
 from datetime import datetime, UTC
-from fastapi.encoders import jsonable_encoder
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.bill.schemas import bill as billSchemas
 from app.bill.repo import bill_repo
 from app.core.exceptions import ServiceFailure
 from app.utils import MessageCodes, generate_excel
-from app.parking.repo import zone_repo
-from cache.redis import redis_client
+from app.parking.cache import metadata_cache
+from app.db.outbox import outbox
+from app.schemas.stream import WireSchema, bills_channel
+from app.bill.models import Bill
 from app.plate.repo import plate_repo
 from app.models.base import plate_alphabet_reverse
 from app.core.config import settings
 from app.users.repo import user
 from app.payment.repo import transaction_repo
-import rapidjson
 import pytz
 from typing import List, Tuple
 import math
 
 
+BILL_WIRE = WireSchema(Bill)
+
 
 def convert_to_timezone_iran(time: datetime):
     if isinstance(time, str):
@@ -50,7 +52,7 @@ def _calculate_price_logic(get_price, duration_time):
 
 
 async def calculate_price_async(db: AsyncSession, *, zone_id: int, start_time_in: datetime, end_time_in: datetime):
-    get_price = await zone_repo.get_price_zone_async(db, zone_id=zone_id)
+    get_price = await metadata_cache.get_price_zone_async(db, zone_id=zone_id)
     if not get_price:
         raise ServiceFailure(detail="Model price not set for this zone", msg_code=MessageCodes.not_found)
     duration_time = convert_time_to_hour_and_ceil(start_time_in, end_time_in)
@@ -66,7 +68,7 @@ def calculate_price(db: Session, *, zone_id: int, start_time_in: datetime, end_t
     :param end_time_in: End time of the session
     :return: Total price and price model
     """
-    get_price = zone_repo.get_price_zone(db, zone_id=zone_id)
+    get_price = metadata_cache.get_price_zone(db, zone_id=zone_id)
     if not get_price:
         raise ServiceFailure(detail="Model price not set for this zone", msg_code=MessageCodes.not_found)
     duration_time = convert_time_to_hour_and_ceil(start_time_in, end_time_in)
@@ -97,14 +99,14 @@ async def create(
     bill_ws.end_time = convert_to_timezone_iran(bill_ws.end_time)
     bill_ws.created = convert_to_timezone_iran(bill_ws.created)
     if bill_ws.camera_entrance_id:
-        redis_client.publish(
-            f"bills:camera_{bill_ws.camera_entrance_id}",
-            rapidjson.dumps(jsonable_encoder(bill_ws)),
+        outbox.publish(
+            bills_channel(bill_ws.camera_entrance_id),
+            BILL_WIRE.dumps(bill_ws),
         )
     if bill_ws.camera_exit_id:
-        redis_client.publish(
-            f"bills:camera_{bill_ws.camera_exit_id}",
-            rapidjson.dumps(jsonable_encoder(bill_ws)),
+        outbox.publish(
+            bills_channel(bill_ws.camera_exit_id),
+            BILL_WIRE.dumps(bill_ws),
         )
     return bill
 
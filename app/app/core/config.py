@@ -34,6 +34,21 @@ class AuthMethod(str, enum.Enum):
     JWT = "jwt"
 
 
+class RecordLockMode(str, enum.Enum):
+    TABLE = "table"
+    PLATE = "plate"
+
+
+class ImageAccessMode(str, enum.Enum):
+    PROXY = "proxy"
+    PRESIGNED = "presigned"
+
+
+class ThumbnailFormat(str, enum.Enum):
+    JPEG = "jpeg"
+    WEBP = "webp"
+
+
 class SettingsBase(BaseSettings):
     PROJECT_NAME: str
     API_V1_STR: str = "/api/v1"
@@ -85,6 +100,10 @@ class SettingsBase(BaseSettings):
     def store_prefix(self) -> str:
         return self.PROJECT_NAME.lower().replace(" ", "-") + "-"
 
+    @property
+    def api_cache_prefix(self) -> str:
+        return self.store_prefix + "api-cache"
+
     model_config = SettingsConfigDict(env_file=".env", extra="allow")
 
 
@@ -98,6 +117,65 @@ class StorageSettings(SettingsBase):
     CHECKING_FREE_TIME_BETWEEN_RECORDS_ENTRANCEDOOR_EXITDOOR: int | None = None
     FREE_TIME_BETWEEN_RECORDS_ENTRANCEDOOR_EXITDOOR: int | None = None
 
+    # "plate" serializes update_record per plate with an advisory lock,
+    # "table" falls back to locking the whole event table
+    RECORD_LOCK_MODE: RecordLockMode = RecordLockMode.PLATE
+
+    # max events accepted by one POST /events/bulk call
+    EVENTS_BULK_MAX_SIZE: int = 500
+
+    # seconds between full reloads of the in-process white/black/phone
+    # plate list cache, changes arrive through redis in between, 0 disables
+    PLATE_LIST_CACHE_TTL: int = 600
+
+    # seconds the metadata cache trusts its copy of the redis version, a
+    # zone, price or equipment change made by another process is seen
+    # that late, 0 reads the version on every lookup
+    METADATA_CACHE_VERSION_TTL: float = 1.0
+
+    # seconds between rebuilds of the hourly report rollups for the rows
+    # changed since the last run, 0 keeps the reports on the raw tables
+    ROLLUP_PERIOD: int = 300
+
+    # seconds the rollup watermark lags behind each run, rows flushed
+    # before a run but committed after it are picked up by the next one
+    # as long as their transaction is shorter than this
+    ROLLUP_SYNC_MARGIN: int = 60
+
+    # seconds between corrections of the redis occupancy counters from the
+    # record table, the counters are not used until the first one,
+    # 0 keeps full/unknown counts on database queries
+    OCCUPANCY_RECONCILE_PERIOD: int = 60
+
+    # seconds between SCAN sweeps deleting api cache entries of invalidated
+    # namespace versions before their TTL, 0 leaves them to expire
+    CACHE_SWEEP_PERIOD: int = 0
+
+    # byte budget of the per-process LRU in front of the redis api cache,
+    # 0 disables it, entries live at most CACHE_LOCAL_TTL seconds
+    CACHE_LOCAL_MAX_BYTES: int = 16 * 1024 * 1024
+    CACHE_LOCAL_TTL: int = 5
+
+    # report and bill responses are cached per zone, a range that ended more
+    # than REPORT_CACHE_CLOSED_GRACE seconds ago is "closed" and kept for
+    # REPORT_CACHE_CLOSED_TTL, anything else for REPORT_CACHE_LIVE_TTL
+    REPORT_CACHE_LIVE_TTL: int = 60
+    REPORT_CACHE_CLOSED_TTL: int = 24 * 60 * 60
+    REPORT_CACHE_CLOSED_GRACE: int = 60 * 60
+
+    # messages queued per websocket client, the oldest are dropped once it
+    # is full and a client that drops WS_MAX_DROPPED in a row is closed
+    WS_QUEUE_SIZE: int = 100
+    WS_MAX_DROPPED: int = 1000
+
+    # redis messages sent per pipeline by the post-commit publisher
+    OUTBOX_BATCH_SIZE: int = 100
+
+    # seconds between runs moving image bytes stored in the database to
+    # minio, IMAGE_MIGRATION_BATCH_SIZE per transaction, 0 disables
+    IMAGE_MIGRATION_PERIOD: int = 0
+    IMAGE_MIGRATION_BATCH_SIZE: int = 100
+
     CLEANUP_COUNT: Optional[int] = 1000  # cleanup 1000 images
     CLEANUP_PERIOD: Optional[int] = 30  # every 30 seconds
     CLEANUP_AGE: Optional[float] = 2.5  # which are older than 2.5 days
@@ -152,6 +230,37 @@ class StorageSettings(SettingsBase):
     MINIO_SECRET_KEY: str
     MINIO_SECURE: bool
     MINIO_BUCKET_NAME: str
+    # bytes read from minio per chunk when streaming an object
+    MINIO_CHUNK_SIZE: int = 256 * 1024
+    # bytes per part of multipart uploads, 5 MiB at least
+    MINIO_PART_SIZE: int = 10 * 1024 * 1024
+    # concurrent minio calls per process, and pooled connections
+    MINIO_MAX_CONNECTIONS: int = 16
+    # scheme and host clients reach minio at, MINIO_URL by default, and the
+    # region presigned urls are signed for
+    MINIO_PUBLIC_URL: str | None = None
+    MINIO_REGION: str = "us-east-1"
+
+    # "proxy" streams images through the api, "presigned" redirects image
+    # requests to short-lived minio urls and lists them in record and bill
+    # views
+    IMAGE_ACCESS_MODE: ImageAccessMode = ImageAccessMode.PROXY
+    # seconds a presigned url is valid, reused until the last margin seconds
+    IMAGE_URL_EXPIRY: int = 900
+    IMAGE_URL_MARGIN: int = 120
+    IMAGE_URL_CACHE_SIZE: int = 10000
+
+    # longest edges in pixels thumbnails are made in, record and bill views
+    # link the THUMBNAIL_LIST_SIZE ones, 0 leaves them out
+    THUMBNAIL_SIZES: list[int] = [160, 320, 640]
+    THUMBNAIL_LIST_SIZE: int = 320
+    THUMBNAIL_FORMAT: ThumbnailFormat = ThumbnailFormat.WEBP
+    THUMBNAIL_QUALITY: int = 75
+    # seconds clients may keep a thumbnail, they never change
+    THUMBNAIL_MAX_AGE: int = 30 * 24 * 60 * 60
+    # make the thumbnails of uploaded images right away in the worker,
+    # instead of on their first request
+    THUMBNAIL_EAGER: bool = False
 
     # health check
     PHONE_LIST_REPORT_HEALTH_CHECK_EQUIPMENT: list
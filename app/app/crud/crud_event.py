@@ -1,9 +1,8 @@
 from datetime import datetime, UTC
 from typing import Awaitable
 
-import rapidjson
 from fastapi.encoders import jsonable_encoder
-from sqlalchemy import text
+from sqlalchemy import insert, text
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import Session
@@ -17,10 +16,14 @@ from app.schemas.event import (
     ParamsEvents,
     ReportDoor,
 )
-from cache.redis import redis_client
+from app.schemas.stream import WireSchema, events_channel
+from app.db.outbox import outbox
 import re
 
 
+EVENT_WIRE = WireSchema(Event)
+
+
 class CRUDEvent(CRUDBase[Event, EventCreate, EventUpdate]):
     def create(
         self,
@@ -38,11 +41,46 @@ class CRUDEvent(CRUDBase[Event, EventCreate, EventUpdate]):
             obj_in_data = jsonable_encoder(obj_in)
         db_obj = self.model(**obj_in_data)  # type: ignore
         db.add(db_obj)
-        redis_client.publish(
-            "events:1", rapidjson.dumps(jsonable_encoder(db_obj))
+        outbox.add(
+            db,
+            events_channel(db_obj.camera_id),
+            lambda: EVENT_WIRE.dumps(db_obj),
         )
         return self._commit_refresh(db=db, db_obj=db_obj, commit=commit)
 
+    def create_bulk(
+        self,
+        db: Session,
+        *,
+        objs_in: list[EventCreate | dict],
+        commit: bool = True,
+    ) -> list[Event]:
+        """Insert many events with a single multi-row INSERT ... RETURNING.
+
+        events are detached before the commit so their loaded attributes
+        stay readable without a refresh query per event.
+        """
+        objs_in_data = [
+            obj_in if isinstance(obj_in, dict) else jsonable_encoder(obj_in)
+            for obj_in in objs_in
+        ]
+        if not objs_in_data:
+            return []
+        db_objs = db.scalars(
+            insert(self.model).returning(self.model), objs_in_data
+        ).all()
+        for db_obj in db_objs:
+            outbox.add(
+                db,
+                events_channel(db_obj.camera_id),
+                EVENT_WIRE.dumps(db_obj),
+            )
+        if commit:
+            for db_obj in db_objs:
+                db.expunge(db_obj)
+            db.commit()
+        return db_objs
+
     async def find_events(
         self, db: Session | AsyncSession, *, params: ParamsEvents
     ) -> list[Event] | Awaitable[list[Event]]:
@@ -2,6 +2,7 @@ import base64
 from typing import Any, Awaitable, Dict, List, Optional, Union
 
 from fastapi.encoders import jsonable_encoder
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
@@ -15,6 +16,7 @@ from app.schemas.image import (
     ImageUpdateBinary,
     ImageCreate,
 )
+from app.utils import storage
 
 
 class CRUDImage(
@@ -65,7 +67,58 @@ class CRUDImage(
         return obj
 
     def get_image(self, db: Session, *, id: int) -> bytes:
-        return db.query(self.model).get(id).image
+        image = db.query(self.model).get(id)
+        if image is None:
+            return None
+        if image.image is None and image.path_image:
+            # moved to minio, see migrate_blobs
+            bucket_name, file_name = image.path_image.split("/", 1)
+            return (
+                storage.get_minio()
+                .download_file_sync(bucket_name, file_name)
+                .getvalue()
+            )
+        return image.image
+
+    def get_blobs(
+        self, db: Session, *, limit: int, after_id: int = 0
+    ) -> List[Image]:
+        """
+        Images after `after_id` whose bytes are still in the database,
+        oldest first, locked until the caller commits.
+
+        Rows locked by others are waited for, not skipped, the caller moves
+        its watermark past the whole batch and would never come back to
+        them. Migrations don't run concurrently, see `migrate_images`.
+        """
+        return (
+            db.query(self.model)
+            .filter(self.model.id > after_id, self.model.image.isnot(None))
+            .order_by(self.model.id)
+            .limit(limit)
+            .with_for_update()
+            .all()
+        )
+
+    def set_paths(
+        self, db: Session, *, images: List[Image], paths: List[str]
+    ) -> None:
+        """
+        Point images at their minio copies and drop their bytes, `modified`
+        is kept so the cleanup age of the images doesn't change.
+        """
+        db.execute(
+            update(self.model),
+            [
+                {
+                    "id": image.id,
+                    "path_image": path,
+                    "image": None,
+                    "modified": image.modified,
+                }
+                for image, path in zip(images, paths)
+            ],
+        )
 
     async def get_base64(
         self, db: AsyncSession, id: int
@@ -166,7 +219,7 @@ class CRUDImage(
         img = obj.image
         del obj.image
         obj = jsonable_encoder(obj)
-        if obj:
+        if obj and img is not None:
             obj["image"] = base64.b64encode(img).decode()
 
         obj = ImageBase64InDB(**obj)
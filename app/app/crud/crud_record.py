@@ -1,8 +1,6 @@
 from datetime import datetime, timedelta, UTC
 from typing import Awaitable, Optional, List
 
-import rapidjson
-from fastapi.encoders import jsonable_encoder
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import Session, aliased
@@ -13,15 +11,20 @@ from app.crud.base import CRUDBase
 from app.models.record import Record
 from app.models.event import Event
 from app.schemas.record import RecordCreate, RecordUpdate, StatusRecord
-from cache.redis import redis_client
+from app.schemas.stream import WireSchema, records_channel
+from app.db.outbox import outbox
 from app.schemas import RecordUpdate, StatusRecord
 from app.parking.models import Zone, Equipment
+from app.parking.cache import metadata_cache
 from app.report import schemas as ReportSchemas
 from app import models
 from app.bill.services import convert_to_timezone_iran
 import re
 
 
+RECORD_WIRE = WireSchema(Record)
+
+
 class CRUDRecord(CRUDBase[Record, RecordCreate, RecordUpdate]):
 
     def create(
@@ -33,33 +36,34 @@ class CRUDRecord(CRUDBase[Record, RecordCreate, RecordUpdate]):
         obj_in_data = obj_in.model_dump()
         db_obj = self.model(**obj_in_data)
         db.add(db_obj)
-        data_ws = db_obj
-        data_ws.start_time = convert_to_timezone_iran(data_ws.start_time)
-        data_ws.end_time = convert_to_timezone_iran(data_ws.end_time)
-        data_ws = jsonable_encoder(data_ws)
-        camera_entry_name = (
-            db.query(models.Equipment.tag)
-            .filter(obj_in.camera_entrance_id == models.Equipment.id)
-            .first()
+        db_obj.start_time = convert_to_timezone_iran(db_obj.start_time)
+        db_obj.end_time = convert_to_timezone_iran(db_obj.end_time)
+        camera_entry = (
+            metadata_cache.get_equipment(db, id=obj_in.camera_entrance_id)
+            if obj_in.camera_entrance_id
+            else None
         )
-        data_ws["camera_entry_name"] = (
-            camera_entry_name[0] if camera_entry_name else None
+        camera_leveing = (
+            metadata_cache.get_equipment(db, id=obj_in.camera_exit_id)
+            if obj_in.camera_exit_id
+            else None
         )
-        camera_leveing_name = (
-            db.query(models.Equipment.tag)
-            .filter(obj_in.camera_exit_id == models.Equipment.id)
-            .first()
+        zone = (
+            metadata_cache.get_zone(db, id=obj_in.zone_id)
+            if obj_in.zone_id
+            else None
         )
-        data_ws["camera_leveing_name"] = (
-            camera_leveing_name[0] if camera_leveing_name else None
+        names = dict(
+            camera_entry_name=camera_entry.tag if camera_entry else None,
+            camera_leveing_name=camera_leveing.tag if camera_leveing else None,
+            zone_name=zone.name if zone else None,
         )
-        zone_name = (
-            db.query(models.Zone.name)
-            .filter(obj_in.zone_id == models.Zone.id)
-            .first()
+        # rendered on flush, with the record id
+        outbox.add(
+            db,
+            records_channel(obj_in.zone_id),
+            lambda: RECORD_WIRE.dumps(db_obj, **names),
         )
-        data_ws["zone_name"] = zone_name[0] if zone_name else None
-        redis_client.publish("records:1", rapidjson.dumps(data_ws))
         return self._commit_refresh(db=db, db_obj=db_obj)
 
     def get_by_event(
@@ -118,7 +122,10 @@ class CRUDRecord(CRUDBase[Record, RecordCreate, RecordUpdate]):
         return await db.scalar(
             select(Record)
             .with_only_columns(func.count())
-            .filter((Record.latest_status == StatusRecord.unfinished.value))
+            .filter(
+                Record.is_deleted == False,
+                Record.latest_status == StatusRecord.unfinished.value,
+            )
         )
 
     async def get_count_referred(
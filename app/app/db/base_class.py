@@ -36,7 +36,7 @@ class Base(DeclarativeBase):
         DateTime(timezone=False),
         default=get_now_datetime_utc,
         index=True,
-        onupdate=datetime.now(UTC).replace(tzinfo=None),
+        onupdate=get_now_datetime_utc,
     )
 
     def __str__(self):
@@ -12,7 +12,8 @@ import random
 import string
 from app.core.celery_app import celery_app
 from fastapi.encoders import jsonable_encoder
-from cache.redis import redis_client
+from app.db.outbox import outbox
+from app.schemas.stream import records_channel
 import rapidjson
 from datetime import datetime, timedelta, timezone
 import time
@@ -302,8 +303,10 @@ async def create_records_past(db: AsyncSession):
             db.add(bill)
 
         # Publish the record data to Redis
-        redis_client.publish(
-            "records:1", rapidjson.dumps(jsonable_encoder(record))
+        outbox.add(
+            db,
+            records_channel(record.zone_id),
+            rapidjson.dumps(jsonable_encoder(record)),
         )
 
         # Use async commit/refresh
@@ -0,0 +1,173 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+from collections import Counter
+from typing import Callable
+
+from redis.exceptions import RedisError
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from cache.redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+Message = str | bytes | Callable[[], str | bytes]
+
+
+class Publisher:
+    """Publish messages to redis from a background thread, in batches.
+
+    Callers only enqueue, the thread takes whatever piled up (up to
+    `batch_size`) and sends it in one pipeline, so a slow redis delays the
+    feeds but never the caller. The thread is started on first use in each
+    process, celery forks after import.
+    """
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self._queue: queue.Queue | None = None
+        self._pid: int | None = None
+        self._lock = threading.Lock()
+        self._stats = Counter()
+
+    def put(self, messages: list[tuple[str, str | bytes]]) -> None:
+        if not messages:
+            return
+        if self._pid != os.getpid():
+            self._start()
+        for message in messages:
+            self._queue.put(message)
+
+    def flush(self, timeout: float | None = None) -> None:
+        """Wait until everything queued so far has been sent."""
+        if self._queue is None or self._pid != os.getpid():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._stats = Counter()
+            threading.Thread(
+                target=self._run,
+                args=(self._queue,),
+                name="redis-publisher",
+                daemon=True,
+            ).start()
+            self._pid = os.getpid()
+
+    def _run(self, messages: queue.Queue) -> None:
+        while True:
+            batch = [messages.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(messages.get_nowait())
+                except queue.Empty:
+                    break
+            waiters = [
+                item for item in batch if isinstance(item, threading.Event)
+            ]
+            batch = [item for item in batch if isinstance(item, tuple)]
+            try:
+                with redis_client.pipeline(transaction=False) as pipe:
+                    for channel, message in batch:
+                        pipe.publish(channel, message)
+                    pipe.execute()
+                self._stats["published"] += len(batch)
+                self._stats["batches"] += 1
+            except RedisError as e:
+                self._stats["failed"] += len(batch)
+                logger.error(f"publishing {len(batch)} messages failed {e}")
+            for waiter in waiters:
+                waiter.set()
+
+
+class Outbox:
+    """Messages published once the transaction that produced them commits.
+
+    A message is encoded already or a callable rendering it, called at the
+    end of the next flush so it sees the generated ids, and at the latest
+    before commit, while the instances are still loaded. Messages of a
+    transaction that is rolled back or closed without a commit are dropped.
+    """
+
+    def __init__(self, publisher: Publisher):
+        self.publisher = publisher
+
+    def add(
+        self, db: Session | AsyncSession, channel: str, message: Message
+    ) -> None:
+        session = db.sync_session if isinstance(db, AsyncSession) else db
+        session.info.setdefault("outbox", []).append((channel, message))
+
+    def publish(self, channel: str, message: str | bytes) -> None:
+        """Publish now, for data committed already."""
+        self.publisher.put([(channel, message)])
+
+    @staticmethod
+    def render(session: Session) -> None:
+        messages = session.info.get("outbox")
+        if messages:
+            session.info["outbox"] = [
+                (channel, message() if callable(message) else message)
+                for channel, message in messages
+            ]
+
+    def prepare(self, session: Session) -> None:
+        if not session.info.get("outbox"):
+            return
+        # callables may wait for ids of objects not flushed yet, after the
+        # commit the instances are expired and can't be read without a
+        # query, which an AsyncSession can't make there
+        session.flush()
+        self.render(session)
+
+    def release(self, session: Session) -> None:
+        messages = session.info.pop("outbox", None)
+        if messages:
+            self.publisher.put(messages)
+
+    @staticmethod
+    def discard(session: Session) -> None:
+        session.info.pop("outbox", None)
+
+
+publisher = Publisher(batch_size=settings.OUTBOX_BATCH_SIZE)
+outbox = Outbox(publisher)
+atexit.register(publisher.flush, 5)
+
+
+@event.listens_for(Session, "after_flush")
+def _render_outbox(session, flush_context):
+    outbox.render(session)
+
+
+@event.listens_for(Session, "before_commit")
+def _prepare_outbox(session):
+    outbox.prepare(session)
+
+
+@event.listens_for(Session, "after_commit")
+def _release_outbox(session):
+    outbox.release(session)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_outbox(session, transaction):
+    if transaction.parent is None:
+        outbox.discard(session)
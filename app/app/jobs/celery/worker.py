@@ -1,33 +1,93 @@
 import logging
 import math
 import random
+from collections import defaultdict
 from datetime import datetime, timedelta, UTC
-from sqlalchemy import text
+from celery import chain
+from sqlalchemy import delete, text
 from fastapi.encoders import jsonable_encoder
 from app import crud, models, schemas
 from app.bill import repo
 from app.core.celery_app import DatabaseTask, celery_app
-from app.core.config import settings
+from app.core.config import RecordLockMode, settings
 from app.jobs.celery.celeryworker_pre_start import redis_client
 from app.schemas import TypeEvent, StatusRecord
 import rapidjson
 from app.models.base import EquipmentType, EquipmentStatus
-from app.bill.services.bill import calculate_price, convert_to_timezone_iran
+from app.bill.services.bill import (
+    BILL_WIRE,
+    calculate_price,
+    convert_to_timezone_iran,
+)
 from app.bill.repo import bill_repo
 from app.bill.schemas import bill as billSchemas
+from app.parking.cache import metadata_cache
+from app.parking.occupancy import occupancy
 from app.parking.repo import equipment_repo
 from app.db.init_data_fake import create_events
+from app.db.outbox import outbox
 from app.notifications.repo import notifications_repo, equipment_repo
 from app.notifications.schemas import NotificationsCreate, TypeNotice
-from app.plate.schemas import PlateType
-from app.plate.models import PlateList
+from app.plate.cache import plate_list_cache
+from app.plate.schemas import PlateList, PlateType
+from app.schemas.stream import bills_channel
+from app.report.cache import report_cache  # noqa: F401, invalidates on commit
+from app.report.services import rollup as rollup_services
+from app.api.services import images_services
+from app.utils import storage
 # import requests
 import requests
 
 namespace = "job worker"
 logger = logging.getLogger(__name__)
 
+# first key of the two-key advisory lock, keeps record locks apart
+# from any other advisory lock taken on the same database
+RECORD_LOCK_NAMESPACE = 1001
+
 def test_celery()->None:...
+
+
+def notify_black_list(session, black_list: PlateList, event) -> None:
+    notification = notifications_repo.create(
+        session,
+        obj_in=NotificationsCreate(
+            plate_list_id=black_list.id,
+            event_id=event.id,
+            type_notice=TypeNotice.black_list,
+            text=f"{black_list.plate}",
+        ),
+    )
+    logger.info(
+        f"found black listed plate {black_list.plate} in event id {event.id}, {notification}"
+    )
+    notice = jsonable_encoder(black_list)
+    zone_name = (
+        session.query(models.Zone.name)
+        .filter(event.zone_id == models.Zone.id)
+        .first()
+    )
+    notice["zone_name"] = zone_name[0] if zone_name else None
+
+    camera_name = (
+        session.query(models.Equipment.tag)
+        .filter(event.camera_id == models.Equipment.id)
+        .first()
+    )
+    notice["camera_name"] = camera_name[0] if camera_name else None
+    outbox.publish(
+        "notifications",
+        rapidjson.dumps(notice),
+    )
+
+
+def need_update_record(event) -> bool:
+    return event.invalid == False or (
+        (event.invalid == True and event.type_event == TypeEvent.exitDoor)
+        or (event.type_event == TypeEvent.approaching_leaving_unknown)
+    )
+
+
 @celery_app.task(
     base=DatabaseTask,
     bind=True,
@@ -41,56 +101,13 @@ def add_events(self, event: dict) -> str:
     try:
         create_event = crud.event.create(db=self.session, obj_in=event)
 
-        black_list = (
-            self.session.query(PlateList)
-            .filter(
-                PlateList.plate == create_event.plate,
-                PlateList.type == PlateType.black,
-            )
-            .first()
+        black_list = plate_list_cache.get(
+            self.session, plate=create_event.plate, type_list=PlateType.black
         )
 
         if black_list:
-            notification = notifications_repo.create(
-                self.session,
-                obj_in=NotificationsCreate(
-                    plate_list_id=black_list.id,
-                    event_id=create_event.id,
-                    type_notice=TypeNotice.black_list,
-                    text=f"{black_list.plate}",
-                ),
-            )
-            logger.info(
-                f"found black listed plate {black_list.plate} in event id {create_event.id}, {notification}"
-            )
-            notice = jsonable_encoder(black_list)
-            zone_name = (
-                self.session.query(models.Zone.name)
-                .filter(create_event.zone_id == models.Zone.id)
-                .first()
-            )
-            notice["zone_name"] = zone_name[0] if zone_name else None
-
-            camera_name = (
-                self.session.query(models.Equipment.tag)
-                .filter(create_event.camera_id == models.Equipment.id)
-                .first()
-            )
-            notice["camera_name"] = camera_name[0] if camera_name else None
-            redis_client.publish(
-                "notifications",
-                rapidjson.dumps(notice),
-            )
-        if create_event.invalid == False or (
-            (
-                create_event.invalid == True
-                and create_event.type_event == TypeEvent.exitDoor
-            )
-            or (
-                create_event.type_event
-                == TypeEvent.approaching_leaving_unknown
-            )
-        ):
+            notify_black_list(self.session, black_list, create_event)
+        if need_update_record(create_event):
             celery_app.send_task(
                 "update_record",
                 args=[create_event.id],
@@ -103,6 +120,75 @@ def add_events(self, event: dict) -> str:
         raise self.retry(exc=exc, countdown=countdown)
 
 
+@celery_app.task(
+    base=DatabaseTask,
+    bind=True,
+    acks_late=True,
+    max_retries=4,
+    soft_time_limit=240,
+    time_limit=360,
+    name="add_events_bulk",
+)
+def add_events_bulk(self, events: list[dict]) -> str:
+    try:
+        create_events = crud.event.create_bulk(self.session, objs_in=events)
+    except Exception as exc:
+        countdown = int(random.uniform(1, 2) ** self.request.retries)
+        logger.info(f"Error adding events:{exc} ,retrying in {countdown}s.")
+        logger.exception(exc)
+        raise self.retry(exc=exc, countdown=countdown)
+
+    # the batch is committed, retrying from here on would insert it again
+    plates = dispatch_events(self.session, create_events)
+    logger.info(
+        f"add_events_bulk: {len(create_events)} events, {plates} plates"
+    )
+
+
+def dispatch_events(session, create_events: list) -> int:
+    """Queue the record updates of events, then notify black listed plates.
+
+    one chain per plate keeps the events of a vehicle in order while
+    different vehicles are processed in parallel, the events are committed
+    already so a failing plate or notification is logged and the others go
+    on. returns the plate count.
+    """
+    events_by_plate = defaultdict(list)
+    for create_event in create_events:
+        if need_update_record(create_event):
+            events_by_plate[create_event.plate].append(create_event)
+
+    for plate, plate_events in events_by_plate.items():
+        plate_events.sort(key=lambda event: event.record_time)
+        try:
+            # immutable, the result of a task is not passed on as the event
+            # id of the next one
+            chain(
+                *(
+                    celery_app.signature(
+                        "update_record", args=[event.id], immutable=True
+                    )
+                    for event in plate_events
+                )
+            ).apply_async()
+        except Exception as exc:
+            logger.error(f"dispatching events of plate {plate} failed {exc}")
+
+    for create_event in create_events:
+        try:
+            black_list = plate_list_cache.get(
+                session, plate=create_event.plate, type_list=PlateType.black
+            )
+            if black_list:
+                notify_black_list(session, black_list, create_event)
+        except Exception as exc:
+            session.rollback()
+            logger.error(
+                f"black list notice of event {create_event.id} failed {exc}"
+            )
+    return len(events_by_plate)
+
+
 def send_sms(phone, text: str):
     params_sending = {
         "phoneNumber": phone,
@@ -114,6 +200,21 @@ def send_sms(phone, text: str):
     )
 
 
+def lock_record_processing(session, plate: str | None) -> None:
+    """Serialize record processing for one plate until the transaction ends.
+
+    events of different vehicles update their records in parallel while
+    events of the same plate are applied one at a time.
+    """
+    if settings.RECORD_LOCK_MODE == RecordLockMode.TABLE:
+        session.execute(text("LOCK TABLE event IN EXCLUSIVE MODE"))
+        return
+    session.execute(
+        text("SELECT pg_advisory_xact_lock(:namespace, hashtext(:plate))"),
+        {"namespace": RECORD_LOCK_NAMESPACE, "plate": plate or ""},
+    )
+
+
 @celery_app.task(
     base=DatabaseTask,
     bind=True,
@@ -136,11 +237,11 @@ def update_record(
         event_id = event_id["id"]
 
     try:
-        # lock events table to prevent multiple record insertion
-        self.session.execute(text("LOCK TABLE event IN EXCLUSIVE MODE"))
         event = crud.event.get(self.session, event_id)
-        payment_type = crud.parking_repo.get_main_parking_sync(db=self.session)
-        get_type_camera = crud.equipment_repo.get(
+        # lock the plate to prevent multiple record insertion
+        lock_record_processing(self.session, event.plate)
+        payment_type = metadata_cache.get_main_parking(self.session)
+        get_type_camera = metadata_cache.get_equipment(
             self.session, id=event.camera_id
         ).equipment_type
 
@@ -202,22 +303,12 @@ def update_record(
                 for_update=True,
             )
 
-        is_white_listed = (
-            self.session.query(PlateList)
-            .filter(
-                PlateList.plate == event.plate,
-                PlateList.type == PlateType.white,
-            )
-            .first()
+        is_white_listed = plate_list_cache.get(
+            self.session, plate=event.plate, type_list=PlateType.white
         )
 
-        is_phone_listed = (
-            self.session.query(PlateList)
-            .filter(
-                PlateList.plate == event.plate,
-                PlateList.type == PlateType.phone,
-            )
-            .first()
+        is_phone_listed = plate_list_cache.get(
+            self.session, plate=event.plate, type_list=PlateType.phone
         )
 
         logger.info(
@@ -352,9 +443,9 @@ def update_record(
                     bill.start_time = convert_to_timezone_iran(bill.start_time)
                     bill.end_time = convert_to_timezone_iran(bill.end_time)
                     bill.created = convert_to_timezone_iran(bill.created)
-                    redis_client.publish(
-                        f"bills:camera_{bill.camera_entrance_id}",
-                        rapidjson.dumps(jsonable_encoder(bill)),
+                    outbox.publish(
+                        bills_channel(bill.camera_entrance_id),
+                        BILL_WIRE.dumps(bill),
                     )
                     if is_phone_listed:
                         # send_sms(
@@ -468,9 +559,9 @@ def update_record(
                     bill.start_time = convert_to_timezone_iran(bill.start_time)
                     bill.end_time = convert_to_timezone_iran(bill.end_time)
                     bill.created = convert_to_timezone_iran(bill.created)
-                    redis_client.publish(
-                        f"bills:camera_{bill.camera_entrance_id}",
-                        rapidjson.dumps(jsonable_encoder(bill)),
+                    outbox.publish(
+                        bills_channel(bill.camera_entrance_id),
+                        BILL_WIRE.dumps(bill),
                     )
                     if is_phone_listed:
                         # send_sms(
@@ -516,6 +607,27 @@ def setup_periodic_tasks(sender, **kwargs):
             name=f"set fake data every {settings.AUTO_GEN_EVENT_FAKE}",
         )
 
+    if settings.OCCUPANCY_RECONCILE_PERIOD > 0:
+        sender.add_periodic_task(
+            settings.OCCUPANCY_RECONCILE_PERIOD,
+            reconcile_occupancy.s(),
+            name="reconcile occupancy counters",
+        )
+
+    if settings.ROLLUP_PERIOD > 0:
+        sender.add_periodic_task(
+            settings.ROLLUP_PERIOD,
+            update_rollups.s(),
+            name="update hourly report rollups",
+        )
+
+    if settings.IMAGE_MIGRATION_PERIOD > 0:
+        sender.add_periodic_task(
+            settings.IMAGE_MIGRATION_PERIOD,
+            migrate_images.s(),
+            name="move image bytes to minio",
+        )
+
     logger.info(
         f"cleanup {settings.CLEANUP_COUNT} images every {settings.CLEANUP_PERIOD} seconds "
         f"which are older than {settings.CLEANUP_AGE} days"
@@ -603,7 +715,7 @@ def health_check_equipment(self):
                         type_notice=TypeNotice.equipment,
                     ),
                 )
-                redis_client.publish(
+                outbox.publish(
                     "notifications",
                     rapidjson.dumps(f"دوربین {eq.tag} {status} است"),
                 )
@@ -651,6 +763,8 @@ def cleanup(self, table_name: str = "image"):
         lock_name, timedelta(seconds=60 * settings.CLEANUP_PERIOD), 1
     )
     result = None
+    # minio files of the deleted images, removed once the rows are gone
+    removed_files = []
     try:
         if table_name == "image":
             model_img = models.Image
@@ -669,11 +783,17 @@ def cleanup(self, table_name: str = "image"):
                     .limit(settings.CLEANUP_COUNT)
                     .subquery()
                 )
-                result = (
-                    self.session.query(model_img)
-                    .filter(model_img.id.in_(subquery))
-                    .delete(synchronize_session="fetch")
-                )
+                deleted = self.session.execute(
+                    delete(model_img)
+                    .where(model_img.id.in_(subquery))
+                    .returning(model_img.id, model_img.path_image),
+                    execution_options={"synchronize_session": "fetch"},
+                ).all()
+                result = len(deleted)
+                for id, path_image in deleted:
+                    removed_files.extend(
+                        images_services.image_files(id, path_image)
+                    )
         elif table_name == "event":
             limit = datetime.now(UTC).replace(tzinfo=None) - timedelta(
                 days=settings.CLEANUP_EVENTS_AGEq
@@ -704,6 +824,11 @@ def cleanup(self, table_name: str = "image"):
                 .delete(synchronize_session="fetch")
             )
         self.session.commit()
+        if removed_files:
+            try:
+                storage.get_minio().remove_files_sync(removed_files)
+            except Exception as e:
+                logger.error(f"removing files of deleted images failed {e}")
         redis_client.setex(
             lock_name, timedelta(seconds=settings.CLEANUP_PERIOD), 1
         )
@@ -714,6 +839,82 @@ def cleanup(self, table_name: str = "image"):
         )
 
 
+@celery_app.task(
+    base=DatabaseTask,
+    bind=True,
+    acks_late=True,
+    max_retries=1,
+    soft_time_limit=240,
+    time_limit=360,
+    name="update_rollups",
+)
+def update_rollups(self):
+    """rebuilds the hourly report rollups touched since the previous run"""
+    lock_name = "update_rollups_task_lock"
+    if redis_client.get(lock_name):
+        return "Update rollups canceled, another run in progress"
+    redis_client.setex(lock_name, timedelta(seconds=360), 1)
+    try:
+        return rollup_services.update_rollups(self.session)
+    finally:
+        redis_client.delete(lock_name)
+
+
+@celery_app.task(
+    base=DatabaseTask,
+    bind=True,
+    acks_late=True,
+    max_retries=1,
+    soft_time_limit=240,
+    time_limit=360,
+    name="migrate_images",
+)
+def migrate_images(self):
+    """moves image bytes from the database to minio, batch by batch"""
+    lock_name = "migrate_images_task_lock"
+    if redis_client.get(lock_name):
+        return "Migrate images canceled, another run in progress"
+    redis_client.setex(lock_name, timedelta(seconds=360), 1)
+    try:
+        # stop short of the soft time limit, the next run goes on
+        return images_services.migrate_to_minio(
+            self.session,
+            batch_size=settings.IMAGE_MIGRATION_BATCH_SIZE,
+            duration=180,
+        )
+    finally:
+        redis_client.delete(lock_name)
+
+
+@celery_app.task(
+    base=DatabaseTask,
+    bind=True,
+    acks_late=True,
+    max_retries=1,
+    soft_time_limit=240,
+    time_limit=360,
+    name="make_thumbnails",
+)
+def make_thumbnails(self, image_id: int):
+    """makes the thumbnails of an uploaded image ahead of their requests"""
+    return images_services.create_thumbnails(self.session, image_id)
+
+
+@celery_app.task(
+    base=DatabaseTask,
+    bind=True,
+    acks_late=True,
+    max_retries=1,
+    soft_time_limit=240,
+    time_limit=360,
+    name="reconcile_occupancy",
+)
+def reconcile_occupancy(self):
+    """corrects the redis occupancy counters from the record table"""
+    drift = occupancy.reconcile(self.session)
+    return f"Reconcile occupancy done, drift: {drift}"
+
+
 @celery_app.task(
     base=DatabaseTask,
     bind=True,
@@ -769,7 +970,7 @@ def check_health_ping_equipment(self):
                         case models.base.EquipmentStatus.BROKEN:
                             status = "خراب"
                     
-                    redis_client.publish(
+                    outbox.publish(
                         "notifications",
                         rapidjson.dumps(status),
                     )
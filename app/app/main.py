@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
@@ -17,6 +18,7 @@ from app.core.middleware.get_accept_language_middleware import (
 )
 from app.models import User
 from cache import Cache
+from cache.broadcast import broadcast
 
 
 @asynccontextmanager
@@ -24,11 +26,21 @@ async def lifespan(app: FastAPI):
     redis_cache = Cache()
     await redis_cache.init(
         host_url=str(settings.REDIS_URI),
-        prefix=settings.store_prefix + "api-cache",
+        prefix=settings.api_cache_prefix,
         response_header="X-API-Cache",
         ignore_arg_types=[Request, Response, Session, AsyncSession, User],
+        local_max_bytes=settings.CACHE_LOCAL_MAX_BYTES,
+        local_ttl=settings.CACHE_LOCAL_TTL,
     )
+    sweeper = None
+    if settings.CACHE_SWEEP_PERIOD > 0:
+        sweeper = asyncio.create_task(
+            redis_cache.run_sweeper(settings.CACHE_SWEEP_PERIOD)
+        )
     yield
+    if sweeper is not None:
+        sweeper.cancel()
+    await broadcast.close()
 
 
 openapi_url = f"{settings.API_V1_STR}/openapi.json"
@@ -13,3 +13,4 @@ from app.ticket.models.ticket import Ticket
 from app.plate.models.plate import PlateList,AuthOTP
 from app.notifications.models import Notifications
 from app.payment.models.bill_payments import Transaction
+from app.report.models import RecordHourly, BillHourly, RollupStaleHour
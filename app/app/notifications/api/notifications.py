@@ -8,7 +8,7 @@ from app.api import deps
 from app.core import exceptions as exc
 from app.utils import APIResponse, APIResponseType, PaginatedContent
 from app.notifications.services import notifications as ServiceNotifications
-from cache.redis import redis_connect_async
+from cache.broadcast import broadcast
 from app.acl.role_checker import RoleChecker
 from app.acl.role import UserRoles
 from typing import Annotated, Any
@@ -181,29 +181,22 @@ async def update_notifications(
 @router.websocket("/notifications")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    connection = await redis_connect_async(240)  # 3 mins
-    async with connection.pubsub() as channel:
-        await channel.subscribe("notifications")
+
+    async def send(data: str):
+        try:
+            # Decode JSON data if it’s a JSON string
+            message = rapidjson.loads(data)
+        except (rapidjson.JSONDecodeError, TypeError) as e:
+            logger.error(f"Error decoding message: {e}")
+            await websocket.send_text("Error: Invalid message format.")
+            return
+        # Send JSON data directly to WebSocket
+        await websocket.send_json(message)
+
+    try:
+        await broadcast.stream(websocket, "notifications", send=send)
+    finally:
         try:
-            while True:
-                data = await channel.get_message(
-                    ignore_subscribe_messages=True, timeout=240
-                )
-                # data = await websocket.receive_text()
-                if data and "data" in data:
-                    try:
-                        # Decode JSON data if it’s a JSON string
-                        message = rapidjson.loads(data["data"])
-                        await websocket.send_json(
-                            message
-                        )  # Send JSON data directly to WebSocket
-                    except (rapidjson.JSONDecodeError, TypeError) as e:
-                        logger(f"Error decoding message: {e}")
-                        await websocket.send_text(
-                            "Error: Invalid message format."
-                        )
-        except Exception as e:
-            logger(f"Exception in WebSocket connection: {e}")
-            await channel.unsubscribe("notifications")
-        finally:
             await websocket.close()
+        except RuntimeError:
+            pass
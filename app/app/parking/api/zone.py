@@ -55,7 +55,7 @@ async def read_zones(
 
 
 @router.patch("/")
-@cache(namespace=namespace, expire=ONE_DAY_IN_SECONDS)
+@invalidate(namespace=namespace)
 async def update_zone(
     *,
     _: Annotated[
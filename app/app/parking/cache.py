@@ -0,0 +1,270 @@
+import logging
+import threading
+import time
+from inspect import isawaitable
+
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.parking.models import Equipment, Parking, Zone
+from app.parking.schemas.equipment import Equipment as EquipmentSchema
+from app.parking.schemas.parking import Parking as ParkingSchema
+from app.parking.schemas.zone import Zone as ZoneSchema
+from app.pricing.models import Price
+from app.pricing.schemas import Price as PriceSchema
+from cache.redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "metadata:version"
+
+
+class ZoneTree:
+    """Descendants and ancestors of every zone, built from one query.
+
+    Walks the same (non deleted) parent links as `get_children` and
+    `get_ancestors` in the zone services, at most `max_depth` levels.
+    """
+
+    def __init__(self, rows: list[tuple[int, int | None]], max_depth: int = 8):
+        self.max_depth = max_depth
+        self.parents = {zone_id: parent_id for zone_id, parent_id in rows}
+        self.direct_children: dict[int, set[int]] = {}
+        for zone_id, parent_id in self.parents.items():
+            if parent_id is not None:
+                self.direct_children.setdefault(parent_id, set()).add(zone_id)
+        self.children_by_zone = {
+            zone_id: self._walk_children(zone_id) for zone_id in self.parents
+        }
+
+    @staticmethod
+    def query():
+        return select(Zone.id, Zone.parent_id).filter(Zone.is_deleted == False)
+
+    def children(self, zone_id: int) -> set[int]:
+        if zone_id in self.children_by_zone:
+            return set(self.children_by_zone[zone_id])
+        return self._walk_children(zone_id)
+
+    def ancestors(self, parent_id: int | None) -> set[int]:
+        ancestors = set()
+        for _ in range(self.max_depth + 1):
+            if parent_id is None or parent_id in ancestors:
+                break
+            ancestors.add(parent_id)
+            parent_id = self.parents.get(parent_id)
+        return ancestors
+
+    def _walk_children(self, zone_id: int) -> set[int]:
+        all_children = {zone_id}
+        to_search = {zone_id}
+        for _ in range(self.max_depth):
+            to_search = {
+                child
+                for parent in to_search
+                for child in self.direct_children.get(parent, ())
+                if child not in all_children
+            }
+            if not to_search:
+                break
+            all_children.update(to_search)
+        return all_children - {zone_id}
+
+
+class MetadataCache:
+    """Read-through cache of zone, price, equipment and parking metadata.
+
+    Rows are copied into schemas on first read and kept per process.
+    Every write to these tables bumps `VERSION_KEY` in redis (see
+    `MetadataCacheMixin`), a process that sees a new version drops its
+    copies, so the worker and the api share one invalidation. The version
+    is read at most once per `version_ttl` seconds, so a write made by
+    another process is seen that late. Missing rows are not cached and
+    when redis is down every read goes to the db.
+    """
+
+    def __init__(self, version_ttl: float):
+        self.version_ttl = version_ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._version: int | None = None
+        self._version_checked_at: float | None = None
+        self._items: dict[tuple, object] = {}
+
+    def get_zone(self, db: Session, *, id: int) -> ZoneSchema | None:
+        return self._get(
+            ("zone", id),
+            # no is_deleted filter, records keep the name of a removed zone
+            lambda: db.scalars(select(Zone).filter(Zone.id == id)).first(),
+            ZoneSchema,
+        )
+
+    def get_equipment(self, db: Session, *, id: int) -> EquipmentSchema | None:
+        return self._get(
+            ("equipment", id),
+            lambda: db.scalars(
+                select(Equipment).filter(
+                    Equipment.id == id, Equipment.is_deleted == False
+                )
+            ).first(),
+            EquipmentSchema,
+        )
+
+    def get_main_parking(self, db: Session) -> ParkingSchema | None:
+        return self._get(
+            ("parking",),
+            lambda: db.scalars(
+                select(Parking)
+                .filter(Parking.is_deleted == False)
+                .order_by(Parking.id)
+                .limit(1)
+            ).first(),
+            ParkingSchema,
+        )
+
+    def get_price_zone(
+        self, db: Session, *, zone_id: int
+    ) -> PriceSchema | None:
+        return self._get(
+            ("price_zone", zone_id),
+            lambda: db.scalars(self._price_zone_query(zone_id)).first(),
+            PriceSchema,
+        )
+
+    async def get_price_zone_async(
+        self, db: AsyncSession, *, zone_id: int
+    ) -> PriceSchema | None:
+        key = ("price_zone", zone_id)
+        price = self._lookup(key)
+        if price is None:
+            row = (await db.scalars(self._price_zone_query(zone_id))).first()
+            price = self._store(key, row, PriceSchema)
+        return price
+
+    async def get_zone_tree_async(self, db: AsyncSession) -> ZoneTree:
+        key = ("zone_tree",)
+        tree = self._lookup(key)
+        if tree is None:
+            tree = ZoneTree((await db.execute(ZoneTree.query())).all())
+            self._put(key, tree)
+        return tree
+
+    def invalidate(self) -> None:
+        try:
+            version = redis_client.incr(VERSION_KEY)
+        except RedisError as e:
+            logger.error(f"metadata cache invalidation failed {e}")
+            version = None
+        with self._lock:
+            # this process sees its own writes at once
+            self._items.clear()
+            self._version = version
+            self._version_checked_at = time.monotonic()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "version": self._version,
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+        }
+
+    @staticmethod
+    def _price_zone_query(zone_id: int):
+        return (
+            select(Price)
+            .join(Zone, Zone.id == zone_id)
+            .filter(Zone.is_deleted == False, Zone.price_id == Price.id)
+        )
+
+    def _get(self, key: tuple, load, schema):
+        item = self._lookup(key)
+        if item is None:
+            item = self._store(key, load(), schema)
+        return item
+
+    def _check_version(self) -> None:
+        now = time.monotonic()
+        if (
+            self._version_checked_at is not None
+            and now - self._version_checked_at < self.version_ttl
+        ):
+            return
+        try:
+            version = int(redis_client.get(VERSION_KEY) or 0)
+        except RedisError:
+            version = None
+        with self._lock:
+            if version is None or version != self._version:
+                self._items.clear()
+                self._version = version
+            self._version_checked_at = now
+
+    def _lookup(self, key: tuple):
+        self._check_version()
+        with self._lock:
+            item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return item
+
+    def _store(self, key: tuple, row, schema):
+        if row is None:
+            return None
+        return self._put(key, schema.model_validate(row))
+
+    def _put(self, key: tuple, item):
+        with self._lock:
+            if self._version is not None:
+                self._items[key] = item
+        return item
+
+
+metadata_cache = MetadataCache(version_ttl=settings.METADATA_CACHE_VERSION_TTL)
+
+
+class MetadataCacheMixin:
+    """Bumps the metadata cache version after each committed write."""
+
+    def _invalidate_after(self, result, commit: bool = True):
+        if not commit:
+            return result
+        if isawaitable(result):
+
+            async def invalidate_after_async():
+                value = await result
+                metadata_cache.invalidate()
+                return value
+
+            return invalidate_after_async()
+        metadata_cache.invalidate()
+        return result
+
+    def create(self, db, *, obj_in, commit: bool = True):
+        return self._invalidate_after(
+            super().create(db, obj_in=obj_in, commit=commit), commit
+        )
+
+    def create_multi(self, db, *, objs_in, commit: bool = True):
+        return self._invalidate_after(
+            super().create_multi(db, objs_in=objs_in, commit=commit), commit
+        )
+
+    def update(self, db, *, db_obj, obj_in=None, commit: bool = True):
+        return self._invalidate_after(
+            super().update(db, db_obj=db_obj, obj_in=obj_in, commit=commit),
+            commit,
+        )
+
+    def update_multi(self, db, *, db_objs):
+        return self._invalidate_after(
+            super().update_multi(db, db_objs=db_objs)
+        )
@@ -0,0 +1,215 @@
+import logging
+from collections import Counter
+
+from redis.exceptions import RedisError
+from sqlalchemy import event, false, func, inspect
+from sqlalchemy.future import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.record import Record
+from app.schemas.record import StatusRecord
+from cache.redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+# "<status>:<zone_id>" -> records of the zone itself, children not included
+COUNTERS_KEY = "occupancy:zone"
+# set by each reconciliation for a few periods, counters are not trusted
+# before the first one or once the reconciliation stops running
+SYNCED_KEY = "occupancy:synced"
+# drift found by the last reconciliation and not corrected yet
+DRIFT_KEY = "occupancy:drift"
+
+TRACKED_STATUSES = (StatusRecord.unfinished.value, StatusRecord.unknown.value)
+# a change of any of these moves the record to another counter
+COUNTED_ATTRS = ("zone_id", "latest_status", "is_deleted")
+
+
+class OccupancyCounters:
+    """Live unfinished (full) and unknown record counts per zone in redis.
+
+    Every committed insert, update or delete of a record moves its zone and
+    status counters, the transitions are collected on flush and applied
+    only after commit. A soft deleted record leaves its counter like a
+    deleted one. Bulk query updates and deletes are not seen, `reconcile`
+    fixes the counters from the database periodically.
+    """
+
+    def get_counts(self) -> dict[str, Counter] | None:
+        """{status: {zone_id: count}} or None when the counters can't be used."""
+        if settings.OCCUPANCY_RECONCILE_PERIOD <= 0:
+            return None
+        try:
+            with redis_client.pipeline() as pipe:
+                pipe.exists(SYNCED_KEY)
+                pipe.hgetall(COUNTERS_KEY)
+                synced, counters = pipe.execute()
+        except RedisError as e:
+            logger.error(f"occupancy counters unavailable {e}")
+            return None
+        if not synced:
+            return None
+        counts = {status: Counter() for status in TRACKED_STATUSES}
+        for field, value in counters.items():
+            if isinstance(field, bytes):
+                field = field.decode()
+            status, zone_id = field.split(":", 1)
+            if status in counts:
+                zone_id = None if zone_id == "None" else int(zone_id)
+                counts[status][zone_id] = int(value)
+        return counts
+
+    @staticmethod
+    def count(counts: Counter, zone_ids: set[int] | None = None) -> int:
+        if zone_ids is None:
+            return sum(counts.values())
+        return sum(counts[zone_id] for zone_id in zone_ids)
+
+    def reconcile(self, db: Session) -> dict:
+        """Correct the counters from the database and return the drift found.
+
+        A record committed while this runs shows up as drift once, its own
+        increment lands anyway, so only drift seen by two runs in a row is
+        corrected, with HINCRBY to keep concurrent increments. The first
+        run resets the counters, they are not used before it.
+        """
+        with redis_client.pipeline() as pipe:
+            pipe.exists(SYNCED_KEY)
+            pipe.hgetall(COUNTERS_KEY)
+            pipe.hgetall(DRIFT_KEY)
+            synced, current, previous = pipe.execute()
+        rows = db.execute(
+            select(Record.zone_id, Record.latest_status, func.count(Record.id))
+            .filter(
+                Record.is_deleted == false(),
+                Record.latest_status.in_(TRACKED_STATUSES),
+            )
+            .group_by(Record.zone_id, Record.latest_status)
+        ).all()
+        expected = {
+            f"{status}:{zone_id}": count for zone_id, status, count in rows
+        }
+        current, previous = self._decode(current), self._decode(previous)
+        drift = {
+            field: expected.get(field, 0) - current.get(field, 0)
+            for field in expected.keys() | current.keys()
+            if expected.get(field, 0) != current.get(field, 0)
+        }
+        with redis_client.pipeline() as pipe:
+            pipe.delete(DRIFT_KEY)
+            if not synced:
+                pipe.delete(COUNTERS_KEY)
+                if expected:
+                    pipe.hset(COUNTERS_KEY, mapping=expected)
+            else:
+                remaining = {}
+                for field, delta in drift.items():
+                    seen = previous.get(field, 0)
+                    correction = (
+                        min(delta, seen, key=abs) if delta * seen > 0 else 0
+                    )
+                    if correction:
+                        pipe.hincrby(COUNTERS_KEY, field, correction)
+                    if delta != correction:
+                        remaining[field] = delta - correction
+                if remaining:
+                    pipe.hset(DRIFT_KEY, mapping=remaining)
+            pipe.set(
+                SYNCED_KEY,
+                1,
+                ex=3 * max(settings.OCCUPANCY_RECONCILE_PERIOD, 1),
+            )
+            pipe.execute()
+        if drift:
+            logger.warning(f"occupancy counters drifted {drift}")
+        return drift
+
+    @staticmethod
+    def _decode(values: dict) -> dict[str, int]:
+        return {
+            (field.decode() if isinstance(field, bytes) else field): int(value)
+            for field, value in values.items()
+        }
+
+    @staticmethod
+    def _values(record: Record, old: bool) -> tuple | None:
+        state = inspect(record)
+        values = []
+        for attr in COUNTED_ATTRS:
+            history = state.attrs[attr].history
+            if old and history.has_changes():
+                values.append(history.deleted[0] if history.deleted else None)
+            elif attr in state.dict:
+                values.append(state.dict[attr])
+            else:
+                # not loaded, left to the reconciliation
+                return None
+        return tuple(values)
+
+    def collect(self, session: Session) -> None:
+        deltas = session.info.setdefault("occupancy_deltas", Counter())
+        for record in session.new:
+            if isinstance(record, Record):
+                self._add(deltas, self._values(record, old=False), 1)
+        for record in session.dirty:
+            if isinstance(record, Record):
+                state = inspect(record)
+                if not any(
+                    state.attrs[attr].history.has_changes()
+                    for attr in COUNTED_ATTRS
+                ):
+                    continue
+                self._add(deltas, self._values(record, old=True), -1)
+                self._add(deltas, self._values(record, old=False), 1)
+        for record in session.deleted:
+            if isinstance(record, Record):
+                self._add(deltas, self._values(record, old=True), -1)
+
+    @staticmethod
+    def _add(deltas: Counter, values: tuple | None, delta: int) -> None:
+        if values is None:
+            return
+        zone_id, status, is_deleted = values
+        if is_deleted:
+            return
+        if isinstance(status, StatusRecord):
+            status = status.value
+        if status in TRACKED_STATUSES:
+            deltas[f"{status}:{zone_id}"] += delta
+
+    @staticmethod
+    def apply(session: Session) -> None:
+        deltas = session.info.pop("occupancy_deltas", None)
+        if not deltas:
+            return
+        try:
+            with redis_client.pipeline() as pipe:
+                for field, delta in deltas.items():
+                    if delta:
+                        pipe.hincrby(COUNTERS_KEY, field, delta)
+                pipe.execute()
+        except RedisError as e:
+            logger.error(f"occupancy counters update failed {e}")
+
+    @staticmethod
+    def discard(session: Session) -> None:
+        session.info.pop("occupancy_deltas", None)
+
+
+occupancy = OccupancyCounters()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_occupancy(session, flush_context):
+    occupancy.collect(session)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_occupancy(session):
+    occupancy.apply(session)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_occupancy(session, previous_transaction):
+    occupancy.discard(session)
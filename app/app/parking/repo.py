@@ -8,6 +8,7 @@ from sqlalchemy.orm import Session
 
 from app.crud.base import CRUDBase
 from app.db.base_class import Base
+from .cache import MetadataCacheMixin
 from typing import Optional
 from .models import (
     Equipment,
@@ -92,21 +93,25 @@ class SpotRepository(CRUDBase[Spot, SpotCreate, SpotUpdate]):
         return await self._first(db.scalars(query.filter(*filters)))
 
 
-class ParkingRepository(CRUDBase[Parking, ParkingCreate, ParkingUpdate]):
+class ParkingRepository(
+    MetadataCacheMixin, CRUDBase[Parking, ParkingCreate, ParkingUpdate]
+):
     async def get_main_parking(self, db: AsyncSession) -> Parking | None:
-        parkings = await self.get_multi(db)
+        parkings = await self.get_multi(db, limit=1)
         if not parkings:
             return None
         return parkings[0]
 
     def get_main_parking_sync(self, db: Session) -> Parking | None:
-        parkings = self.get_multi(db)
+        parkings = self.get_multi(db, limit=1)
         if not parkings:
             return None
         return parkings[0]
 
 
-class ZoneRepository(CRUDBase[Zone, ZoneCreate, ZoneUpdate]):
+class ZoneRepository(
+    MetadataCacheMixin, CRUDBase[Zone, ZoneCreate, ZoneUpdate]
+):
     async def get_by_name(
         self, db: AsyncSession, name: str, except_id: int = None
     ) -> Zone | None:
@@ -264,7 +269,7 @@ class ZoneRepository(CRUDBase[Zone, ZoneCreate, ZoneUpdate]):
 
 
 class EquipmentRepository(
-    CRUDBase[Equipment, EquipmentCreate, EquipmentUpdate]
+    MetadataCacheMixin, CRUDBase[Equipment, EquipmentCreate, EquipmentUpdate]
 ):
 
     def get_multi_active(
@@ -10,7 +10,7 @@ from app.utils import MessageCodes, PaginatedContent
 from typing import Optional
 from app import models
 from cache.redis import redis_connect_async
-from app.jobs.celery.celeryworker_pre_start import redis_client
+from app.db.outbox import outbox
 import requests
 import rapidjson
 
@@ -222,7 +222,7 @@ async def health_check_equipment(
             type_notice=TypeNotice.equipment,
         ),
     )
-    redis_client.publish(
+    outbox.publish(
         "notifications",
         rapidjson.dumps(f"دوربین {update_equipment.tag} {status} است"),
     )
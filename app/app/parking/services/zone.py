@@ -5,6 +5,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app import utils
 from app.core import exceptions as exc
 from app.parking import repo
+from app.parking.cache import metadata_cache
+from app.parking.occupancy import occupancy
 from app.parking import schemas as parking_schemas
 from app.pricing.repo import price_repo
 from fastapi.encoders import jsonable_encoder
@@ -36,13 +38,20 @@ async def set_children_ancestors_capacity(
     zone.children = await get_children(db, zone)
     zone.ancestors = await get_ancestors(db, zone)
 
-    total_count_full = await curdRecord.get_count_capacity(
-        db,
-        zone=zone,
-        status_in=[
-            StatusRecord.unfinished.value,
-        ],
-    )
+    counts = occupancy.get_counts()
+    if counts is not None:
+        zone_ids = {zone.id} | set(zone.children)
+        total_count_full = occupancy.count(
+            counts[StatusRecord.unfinished.value], zone_ids
+        )
+    else:
+        total_count_full = await curdRecord.get_count_capacity(
+            db,
+            zone=zone,
+            status_in=[
+                StatusRecord.unfinished.value,
+            ],
+        )
     zone.full = total_count_full
     zone.empty = (
         (zone.capacity - total_count_full)
@@ -51,54 +60,27 @@ async def set_children_ancestors_capacity(
     )
     if zone.empty < 0:
         zone.empty = 0
-    zone.unknown = await curdRecord.get_count_capacity(
-        db, zone=zone, status_in=[StatusRecord.unknown.value]
-    )
+    if counts is not None:
+        zone.unknown = occupancy.count(
+            counts[StatusRecord.unknown.value], zone_ids
+        )
+    else:
+        zone.unknown = await curdRecord.get_count_capacity(
+            db, zone=zone, status_in=[StatusRecord.unknown.value]
+        )
     return zone
 
 
-async def get_children(
-    db: AsyncSession, zone: parking_schemas.Zone, max_depth: int = 8
-):
-    all_children = {zone.id}
-
-    to_search = {zone.id}
+async def get_children(db: AsyncSession, zone: parking_schemas.Zone):
+    tree = await metadata_cache.get_zone_tree_async(db)
+    return tree.children(zone.id)
 
-    for _ in range(max_depth):
-        children = await repo.zone_repo.get_multi_child(db, ids=to_search)
-        if all(child.id in all_children for child in children):
-            break
-        to_search = set()
-        for child in children:
-            if child.id not in all_children:
-                to_search.add(child.id)
-                all_children.add(child.id)
-    return all_children - {zone.id}
 
-
-async def get_ancestors(
-    db: AsyncSession, zone: parking_schemas.Zone, max_depth: int = 8
-):
+async def get_ancestors(db: AsyncSession, zone: parking_schemas.Zone):
     if zone.parent_id is None:
         return []
-    all_ancestors = {zone.parent_id}
-
-    to_search = {zone.parent_id}
-
-    for _ in range(max_depth):
-        ancestors = await repo.zone_repo.get_multi_ancestor(db, ids=to_search)
-        if all(ancestor.parent_id in all_ancestors for ancestor in ancestors):
-
-            break
-        to_search = set()
-        for ancestor in ancestors:
-            if (
-                ancestor.parent_id not in all_ancestors
-                and ancestor.parent_id is not None
-            ):
-                to_search.add(ancestor.parent_id)
-                all_ancestors.add(ancestor.parent_id)
-    return all_ancestors
+    tree = await metadata_cache.get_zone_tree_async(db)
+    return tree.ancestors(zone.parent_id)
 
 
 async def create_zone(
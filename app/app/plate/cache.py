@@ -0,0 +1,176 @@
+import logging
+import os
+import threading
+import time
+
+import rapidjson
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.plate.models import PlateList
+from app.plate.schemas import PlateList as PlateListSchema, PlateType
+from cache.redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "plate_list:invalidate"
+
+
+class PlateListCache:
+    """In-process copy of the white, black and phone plate lists.
+
+    plate_repo publishes every created, updated or deleted row on
+    `INVALIDATION_CHANNEL` and each process applies it to its own copy.
+    A full reload runs on first use and every `ttl` seconds in case an
+    invalidation message was lost; `ttl=0` disables the cache.
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._by_id: dict[int, PlateListSchema] = {}
+        self._by_type: dict[PlateType, dict[str, PlateListSchema]] = {
+            type_list: {} for type_list in PlateType
+        }
+        self._pending: list[dict] | None = None
+        self._loaded_at: float | None = None
+        self._updated_at: float | None = None
+        self._pid: int | None = None
+
+    def get(
+        self, db: Session, *, plate: str, type_list: PlateType
+    ) -> PlateListSchema | None:
+        if self.ttl <= 0:
+            self.misses += 1
+            return self._query(db, plate=plate, type_list=type_list)
+        if self._expired():
+            self.misses += 1
+            self.load(db)
+        else:
+            self.hits += 1
+        return self._by_type[type_list].get(plate)
+
+    def load(self, db: Session) -> None:
+        # subscribe before reading so no change is missed during the load
+        self._subscribe()
+        with self._lock:
+            # changes arriving from here on may be missing from the rows
+            # read, they are applied again to the new copy
+            self._pending = []
+        rows = db.query(PlateList).filter(
+            PlateList.is_deleted == False,
+            PlateList.type.in_([type_list.value for type_list in PlateType]),
+        )
+        by_id = {}
+        by_type = {type_list: {} for type_list in PlateType}
+        for row in rows:
+            plate = PlateListSchema.model_validate(row)
+            by_id[plate.id] = plate
+            by_type[plate.type].setdefault(plate.plate, plate)
+        with self._lock:
+            # messages arrive in publish order, replaying them keeps the
+            # latest version of each row
+            for row in self._pending:
+                self._apply(by_id, by_type, row)
+            self._pending = None
+            self._by_id = by_id
+            self._by_type = by_type
+            self._loaded_at = self._updated_at = time.monotonic()
+        logger.info(
+            f"plate list cache loaded {len(by_id)} plates, {self.stats()}"
+        )
+
+    def apply(self, row: dict) -> None:
+        with self._lock:
+            self._apply(self._by_id, self._by_type, row)
+            if self._pending is not None:
+                self._pending.append(row)
+            self._updated_at = time.monotonic()
+            self.invalidations += 1
+
+    @staticmethod
+    def _apply(
+        by_id: dict[int, PlateListSchema],
+        by_type: dict[PlateType, dict[str, PlateListSchema]],
+        row: dict,
+    ) -> None:
+        plate = PlateListSchema.model_validate(row)
+        old = by_id.pop(plate.id, None)
+        if old is not None and old.type is not None:
+            if by_type[old.type].get(old.plate) is old:
+                del by_type[old.type][old.plate]
+        if not row.get("is_deleted") and plate.type is not None:
+            by_id[plate.id] = plate
+            by_type[plate.type][plate.plate] = plate
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._by_id),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+            "invalidations": self.invalidations,
+            "loaded_seconds_ago": (
+                round(now - self._loaded_at) if self._loaded_at else None
+            ),
+            "updated_seconds_ago": (
+                round(now - self._updated_at) if self._updated_at else None
+            ),
+        }
+
+    @staticmethod
+    def publish(plates: list[PlateList]) -> None:
+        if plates:
+            redis_client.publish(
+                INVALIDATION_CHANNEL,
+                rapidjson.dumps(jsonable_encoder(plates)),
+            )
+
+    def _expired(self) -> bool:
+        return (
+            self._pid != os.getpid()
+            or self._loaded_at is None
+            or time.monotonic() - self._loaded_at > self.ttl
+        )
+
+    def _subscribe(self) -> None:
+        # celery forks its pool processes, every child needs its own thread
+        if self._pid == os.getpid():
+            return
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{INVALIDATION_CHANNEL: self._on_message})
+        pubsub.run_in_thread(sleep_time=1, daemon=True)
+        self._pid = os.getpid()
+
+    def _on_message(self, message: dict) -> None:
+        try:
+            for row in rapidjson.loads(message["data"]):
+                self.apply(row)
+        except Exception as e:
+            # force a full reload on the next lookup
+            self._loaded_at = None
+            logger.error(f"plate list cache invalidation failed {e}")
+
+    @staticmethod
+    def _query(
+        db: Session, *, plate: str, type_list: PlateType
+    ) -> PlateListSchema | None:
+        row = (
+            db.query(PlateList)
+            .filter(
+                PlateList.plate == plate,
+                PlateList.type == type_list,
+                PlateList.is_deleted == False,
+            )
+            .first()
+        )
+        return PlateListSchema.model_validate(row) if row else None
+
+
+plate_list_cache = PlateListCache(ttl=settings.PLATE_LIST_CACHE_TTL)
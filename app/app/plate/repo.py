@@ -3,6 +3,7 @@ from sqlalchemy import select, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.crud.base import CRUDBase
+from .cache import plate_list_cache
 from .models.plate import PlateList, AuthOTP
 from .schemas import (
     PlateCreate,
@@ -35,6 +36,48 @@ class CRUDAuthOTP(CRUDBase[AuthOTP, AuthOTPCreate, AuthOTPUpdate]):
 
 
 class CRUDPlate(CRUDBase[PlateList, PlateCreate, PlateUpdate]):
+    # every committed change is published so the plate list cache of
+    # each worker and api process stays in sync, remove goes through update
+    async def create(
+        self,
+        db: AsyncSession,
+        *,
+        obj_in: PlateCreate | dict,
+        commit: bool = True,
+    ) -> PlateList:
+        plate = await super().create(db, obj_in=obj_in, commit=commit)
+        if commit:
+            plate_list_cache.publish([plate])
+        return plate
+
+    async def create_multi(
+        self,
+        db: AsyncSession,
+        *,
+        objs_in: PlateCreate | list,
+        commit: bool = True,
+    ) -> list[PlateList] | None:
+        if not commit:
+            return super().create_multi(db, objs_in=objs_in, commit=commit)
+        plates = await super().create_multi(db, objs_in=objs_in, commit=commit)
+        plate_list_cache.publish(plates)
+        return plates
+
+    async def update(
+        self,
+        db: AsyncSession,
+        *,
+        db_obj: PlateList,
+        obj_in: PlateUpdate | dict | None = None,
+        commit: bool = True,
+    ) -> PlateList:
+        plate = await super().update(
+            db, db_obj=db_obj, obj_in=obj_in, commit=commit
+        )
+        if commit:
+            plate_list_cache.publish([plate])
+        return plate
+
     async def get_multi_by_filter(
         self, db: Session | AsyncSession, *, params: ParamsPlate
     ) -> list[PlateList] | Awaitable[list[PlateList]]:
@@ -4,13 +4,16 @@ from sqlalchemy import false, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from app.crud.base import CRUDBase
+from app.parking.cache import MetadataCacheMixin
 from .models import Price
 from .schemas import PriceCreate, PriceUpdate, ReadPricesParams
 
 logger = logging.getLogger(__name__)
 
 
-class PriceRepository(CRUDBase[Price, PriceCreate, PriceUpdate]):
+class PriceRepository(
+    MetadataCacheMixin, CRUDBase[Price, PriceCreate, PriceUpdate]
+):
 
     async def get_by_name(
         self, db: AsyncSession, name: str, except_id: int = None
@@ -14,14 +14,29 @@ from app import schemas
 from app.acl.role import UserRoles
 from typing import Annotated
 from datetime import datetime
-from app.bill.repo import bill_repo
+from app.report.cache import ReportCachePolicy
+from cache import cache
 
 router = APIRouter()
 namespace = "report"
 logger = logging.getLogger(__name__)
 
+live_report = ReportCachePolicy(end_time=lambda kwargs: None)
+report_by_range = ReportCachePolicy(
+    end_time=lambda kwargs: kwargs.get("end_time_in"),
+    zone_id=lambda kwargs: kwargs.get("zone_id"),
+)
+report_by_camera_zone = ReportCachePolicy(
+    end_time=lambda kwargs: kwargs.get("end_time_in"),
+    zone_id=lambda kwargs: kwargs.get("zone_id_in"),
+)
+report_by_zones = ReportCachePolicy(
+    end_time=lambda kwargs: kwargs.get("end_time")
+)
+
 
 @router.get("/capacity")
+@cache(namespace=live_report.namespace, expire=live_report.expire)
 async def capacity(
     _: Annotated[
         bool,
@@ -46,6 +61,7 @@ async def capacity(
 
 
 @router.get("/effective-utilization-rate")
+@cache(namespace=report_by_range.namespace, expire=report_by_range.expire)
 async def get_effective_utilization_rate(
     _: Annotated[
         bool,
@@ -79,6 +95,7 @@ async def get_effective_utilization_rate(
 
 
 @router.get("/parking-count-occupancy-by-zone")
+@cache(namespace=report_by_range.namespace, expire=report_by_range.expire)
 async def avrage_referred(
     _: Annotated[
         bool,
@@ -116,6 +133,7 @@ async def avrage_referred(
 
 
 @router.get("/referred-by-zone")
+@cache(namespace=report_by_range.namespace, expire=report_by_range.expire)
 async def avrage_referred(
     _: Annotated[
         bool,
@@ -153,6 +171,7 @@ async def avrage_referred(
 
 
 @router.get("/get-count-entry-leave-by-zone")
+@cache(namespace=report_by_range.namespace, expire=report_by_range.expire)
 async def entry(
     _: Annotated[
         bool,
@@ -192,6 +211,7 @@ async def entry(
 
 
 @router.get("/parking-occupancy")
+@cache(namespace=report_by_range.namespace, expire=report_by_range.expire)
 async def avrage_referred(
     _: Annotated[
         bool,
@@ -229,6 +249,7 @@ async def avrage_referred(
 
 
 @router.get("/avg-price-per-referred")
+@cache(namespace=report_by_range.namespace, expire=report_by_range.expire)
 async def avg_price_per_referred(
     _: Annotated[
         bool,
@@ -255,7 +276,7 @@ async def avg_price_per_referred(
 
     return APIResponse(
         {
-            "avg_price": await bill_repo.avg_price_per_referred(
+            "avg_price": await report_services.avg_price_per_referred(
                 db,
                 start_time_in=start_time_in,
                 end_time_in=end_time_in,
@@ -266,6 +287,10 @@ async def avg_price_per_referred(
 
 
 @router.get("/count-entrance-exit-by-zone-camera")
+@cache(
+    namespace=report_by_camera_zone.namespace,
+    expire=report_by_camera_zone.expire,
+)
 async def count_entrance_exit_zone(
     _: Annotated[
         bool,
@@ -301,6 +326,7 @@ async def count_entrance_exit_zone(
 
 
 @router.get("/zones")
+@cache(namespace=report_by_zones.namespace, expire=report_by_zones.expire)
 async def report_zone(
     _: Annotated[
         bool,
@@ -329,6 +355,7 @@ async def report_zone(
 
 
 @router.get("/bill")
+@cache(namespace=report_by_range.namespace, expire=report_by_range.expire)
 async def report_bill(
     _: Annotated[
         bool,
@@ -364,6 +391,7 @@ async def report_bill(
 
 
 @router.get("/bill-by-timing")
+@cache(namespace=report_by_range.namespace, expire=report_by_range.expire)
 async def report_bill_by_timing(
     _: Annotated[
         bool,
@@ -0,0 +1,176 @@
+import logging
+from datetime import datetime, timedelta, UTC
+from typing import Callable
+
+from redis.exceptions import RedisError
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.bill.models import Bill
+from app.core.config import settings
+from app.models.record import Record
+from cache.cache import invalidate_sync
+from cache.redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = "reports"
+ALL_ZONES = "all"
+
+# timestamps a report range is matched against, per model
+TRACKED_TIMES = {
+    Record: ("start_time", "end_time"),
+    Bill: ("start_time", "end_time", "created"),
+}
+
+
+def get_namespace(closed: bool, zone_id: int | str | None) -> str:
+    state = "closed" if closed else "live"
+    return f"{NAMESPACE}:{state}:{ALL_ZONES if zone_id is None else zone_id}"
+
+
+def get_closed_before() -> datetime:
+    """Ranges ending before this time are not expected to change anymore."""
+    return datetime.now(UTC).replace(tzinfo=None) - timedelta(
+        seconds=settings.REPORT_CACHE_CLOSED_GRACE
+    )
+
+
+class ReportCachePolicy:
+    """Namespace and TTL of a cached report or bill listing.
+
+    Responses are split per zone and by their range: a range that ended
+    before `get_closed_before` is closed and kept long, anything else
+    (open ended, or reaching into the last hour) is live and kept a minute.
+    Both read the call's keyword arguments, see `cache`.
+    """
+
+    def __init__(
+        self,
+        end_time: Callable[[dict], datetime | None],
+        zone_id: Callable[[dict], int | None] = lambda kwargs: None,
+    ):
+        self.end_time = end_time
+        self.zone_id = zone_id
+
+    def is_closed(self, kwargs: dict) -> bool:
+        end_time = self.end_time(kwargs)
+        if end_time is None:
+            return False
+        if end_time.tzinfo is not None:
+            end_time = end_time.astimezone(UTC).replace(tzinfo=None)
+        return end_time < get_closed_before()
+
+    def namespace(self, kwargs: dict) -> str:
+        return get_namespace(self.is_closed(kwargs), self.zone_id(kwargs))
+
+    def expire(self, kwargs: dict) -> int:
+        if self.is_closed(kwargs):
+            return settings.REPORT_CACHE_CLOSED_TTL
+        return settings.REPORT_CACHE_LIVE_TTL
+
+
+class ReportCacheInvalidator:
+    """Invalidate the cached reports of the zones of committed changes.
+
+    Like the occupancy counters, inserted, updated and deleted records and
+    bills are collected on flush and the namespaces bumped only after
+    commit: the live ones of each zone (and all zones), plus the closed
+    ones when the change reaches back past the closed grace.
+    """
+
+    def collect(self, session: Session) -> None:
+        zones = session.info.setdefault("report_cache_zones", {})
+        for obj in (*session.new, *session.dirty, *session.deleted):
+            times = TRACKED_TIMES.get(type(obj))
+            if times is None or (
+                obj in session.dirty and not session.is_modified(obj)
+            ):
+                continue
+            state = inspect(obj)
+            zone_ids = self._values(state, ("zone_id",)) or [ALL_ZONES]
+            for zone_id in zone_ids:
+                earliest = min(self._values(state, times), default=None)
+                if earliest is None:
+                    # assume the worst when no timestamp is loaded
+                    earliest = datetime.min
+                current = zones.get(zone_id)
+                zones[zone_id] = (
+                    earliest if current is None else min(current, earliest)
+                )
+
+    @staticmethod
+    def _values(state, attrs: tuple) -> list:
+        """Current and replaced values of the loaded `attrs`."""
+        values = []
+        for attr in attrs:
+            history = state.attrs[attr].history
+            values.extend(history.deleted or ())
+            if attr in state.dict:
+                values.append(state.dict[attr])
+        return [
+            (
+                value.astimezone(UTC).replace(tzinfo=None)
+                if isinstance(value, datetime) and value.tzinfo is not None
+                else value
+            )
+            for value in values
+            if value is not None
+        ]
+
+    @staticmethod
+    def apply(session: Session) -> None:
+        zones = session.info.pop("report_cache_zones", None)
+        if not zones:
+            return
+        closed_before = get_closed_before()
+        namespaces = [get_namespace(False, ALL_ZONES)]
+        if min(zones.values()) < closed_before:
+            namespaces.append(get_namespace(True, ALL_ZONES))
+        for zone_id, earliest in zones.items():
+            namespaces.append(get_namespace(False, zone_id))
+            if earliest < closed_before:
+                namespaces.append(get_namespace(True, zone_id))
+        ReportCacheInvalidator._invalidate(namespaces)
+
+    @staticmethod
+    def apply_rollups() -> None:
+        """Invalidate the reports read from the rollups once rebuilt.
+
+        The rebuilds write through Core statements the flush never sees,
+        and only /report/zones reads them, cached under all zones.
+        """
+        ReportCacheInvalidator._invalidate(
+            [get_namespace(False, ALL_ZONES), get_namespace(True, ALL_ZONES)]
+        )
+
+    @staticmethod
+    def _invalidate(namespaces: list[str]) -> None:
+        try:
+            invalidate_sync(
+                redis_client, settings.api_cache_prefix, namespaces
+            )
+        except RedisError as e:
+            logger.error(f"report cache invalidation failed {e}")
+
+    @staticmethod
+    def discard(session: Session) -> None:
+        session.info.pop("report_cache_zones", None)
+
+
+report_cache = ReportCacheInvalidator()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_report_cache(session, flush_context):
+    report_cache.collect(session)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_report_cache(session):
+    report_cache.apply(session)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_report_cache(session, previous_transaction):
+    report_cache.discard(session)
@@ -0,0 +1 @@
+from .hourly import BillHourly, RecordHourly, RollupStaleHour
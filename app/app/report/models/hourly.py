@@ -0,0 +1,54 @@
+from datetime import datetime
+
+from sqlalchemy import DateTime, Float, Index, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base_class import Base
+
+
+# rows are rebuilt per hour from the raw tables, camera_id is the
+# entrance camera, zone and camera ids are not foreign keys so the
+# history survives cleanup of zones, equipments and records
+class RecordHourly(Base):
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    hour: Mapped[datetime] = mapped_column(
+        DateTime(timezone=False), nullable=False
+    )
+    zone_id: Mapped[int] = mapped_column(Integer, nullable=True)
+    camera_id: Mapped[int] = mapped_column(Integer, nullable=True)
+    camera_exit_id: Mapped[int] = mapped_column(Integer, nullable=True)
+    count_referred: Mapped[int] = mapped_column(Integer, default=0)
+    count_entry: Mapped[int] = mapped_column(Integer, default=0)
+    count_exit: Mapped[int] = mapped_column(Integer, default=0)
+    park_seconds: Mapped[float] = mapped_column(Float, default=0)
+
+    __table_args__ = (
+        Index("ix_recordhourly_hour_zone_id", "hour", "zone_id"),
+    )
+
+
+class BillHourly(Base):
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    hour: Mapped[datetime] = mapped_column(
+        DateTime(timezone=False), nullable=False
+    )
+    zone_id: Mapped[int] = mapped_column(Integer, nullable=True)
+    camera_id: Mapped[int] = mapped_column(Integer, nullable=True)
+    bill_count: Mapped[int] = mapped_column(Integer, default=0)
+    bill_sum: Mapped[float] = mapped_column(Float, default=0)
+    paid_count: Mapped[int] = mapped_column(Integer, default=0)
+    paid_sum: Mapped[float] = mapped_column(Float, default=0)
+    unpaid_count: Mapped[int] = mapped_column(Integer, default=0)
+    unpaid_sum: Mapped[float] = mapped_column(Float, default=0)
+
+    __table_args__ = (Index("ix_billhourly_hour_zone_id", "hour", "zone_id"),)
+
+
+# hours a record or bill was moved out of, written on flush and rebuilt
+# by the next update, kind is "record" or "bill"
+class RollupStaleHour(Base):
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    kind: Mapped[str] = mapped_column(String, nullable=False)
+    hour: Mapped[datetime] = mapped_column(
+        DateTime(timezone=False), nullable=False
+    )
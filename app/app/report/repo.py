@@ -1,3 +1,543 @@
+from datetime import datetime, timedelta
 
+from sqlalchemy import (
+    DateTime,
+    and_,
+    cast,
+    delete,
+    distinct,
+    false,
+    func,
+    insert,
+    literal,
+    or_,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import Session, aliased
 
+from app.bill.models import Bill
+from app.bill.schemas.bill import StatusBill
+from app.models import Record
+from app.parking.models import Equipment
+from app.report.models import BillHourly, RecordHourly, RollupStaleHour
+from app.report.schemas import CountMetric, Timing
+from app.schemas.record import StatusRecord
 
+
+def _bucket_table(buckets: list[dict]):
+    # bucket(start, end, idx) rows, idx starts at 1
+    return (
+        func.unnest(
+            cast(
+                literal([b["start"] for b in buckets], ARRAY(DateTime)),
+                ARRAY(DateTime),
+            ),
+            cast(
+                literal([b["end"] for b in buckets], ARRAY(DateTime)),
+                ARRAY(DateTime),
+            ),
+        )
+        .table_valued("start", "end", with_ordinality="idx")
+        .render_derived(name="bucket")
+    )
+
+
+def _in_ranges(column, ranges: list[tuple[datetime, datetime]]):
+    # ranges are inclusive (start, end) pairs
+    return or_(false(), *[column.between(start, end) for start, end in ranges])
+
+
+class ReportRepository:
+    """Grouped queries computing per zone metrics in one round trip each."""
+
+    async def get_record_stats_by_zone(
+        self,
+        db: AsyncSession,
+        *,
+        ranges: list[tuple[datetime, datetime]],
+    ) -> dict[int | None, dict]:
+        in_range = _in_ranges(Record.start_time, ranges)
+        query = (
+            select(
+                Record.zone_id,
+                func.count(Record.camera_entrance_id)
+                .filter(in_range)
+                .label("count_entry"),
+                func.count(Record.camera_exit_id)
+                .filter(in_range)
+                .label("count_leave"),
+                func.count(Record.id).filter(in_range).label("total_referred"),
+                func.coalesce(
+                    func.sum(
+                        func.extract(
+                            "epoch", Record.end_time - Record.start_time
+                        )
+                    ).filter(
+                        in_range,
+                        Record.latest_status == StatusRecord.finished.value,
+                    ),
+                    0,
+                ).label("park_seconds"),
+                # capacity counts are not limited to the time range
+                func.count(Record.id)
+                .filter(Record.latest_status == StatusRecord.unfinished.value)
+                .label("full"),
+                func.count(Record.id)
+                .filter(Record.latest_status == StatusRecord.unknown.value)
+                .label("unknown"),
+            )
+            .filter(
+                Record.is_deleted == false(),
+                or_(
+                    in_range,
+                    Record.latest_status.in_(
+                        [
+                            StatusRecord.unfinished.value,
+                            StatusRecord.unknown.value,
+                        ]
+                    ),
+                ),
+            )
+            .group_by(Record.zone_id)
+        )
+        rows = (await db.execute(query)).mappings().all()
+        return {row["zone_id"]: row for row in rows}
+
+    async def get_bill_stats_by_zone(
+        self,
+        db: AsyncSession,
+        *,
+        ranges: list[tuple[datetime, datetime]],
+    ) -> dict[int | None, dict]:
+        if not ranges:
+            return {}
+        paid = Bill.status == StatusBill.paid
+        unpaid = Bill.status == StatusBill.unpaid
+        query = (
+            select(
+                Bill.zone_id,
+                func.sum(Bill.price).label("total_price"),
+                func.count(Bill.id).label("bill_count"),
+                func.sum(Bill.price).filter(paid).label("total_income"),
+                func.count(Bill.id).filter(paid).label("paid_count"),
+                func.sum(Bill.price).filter(unpaid).label("unpaid_price"),
+                func.count(Bill.id).filter(unpaid).label("unpaid_count"),
+            )
+            .filter(
+                Bill.is_deleted == false(), _in_ranges(Bill.created, ranges)
+            )
+            .group_by(Bill.zone_id)
+        )
+        rows = (await db.execute(query)).mappings().all()
+        return {row["zone_id"]: row for row in rows}
+
+    async def get_bill_price_by_period(
+        self,
+        db: AsyncSession,
+        *,
+        timing: Timing,
+        ranges: list[tuple[datetime, datetime]],
+        zone_id: int | None = None,
+    ) -> list[tuple[datetime, float]]:
+        """(start of the period, price) of the bills created in ranges."""
+        if not ranges:
+            return []
+        period = func.date_trunc(timing.value, Bill.created)
+        filters = [
+            Bill.is_deleted == false(),
+            _in_ranges(Bill.created, ranges),
+        ]
+        if zone_id is not None:
+            filters.append(Bill.zone_id == zone_id)
+        query = (
+            select(period, func.sum(Bill.price))
+            .filter(*filters)
+            .group_by(period)
+        )
+        return (await db.execute(query)).all()
+
+    async def count_entrance_exit_by_camera(
+        self,
+        db: AsyncSession,
+        *,
+        ranges: list[tuple[datetime, datetime]],
+        zone_id: int | None = None,
+    ) -> tuple[dict[str | None, int], dict[str | None, int]]:
+        """Entrances and exits of the records started in ranges by camera tag."""
+        if not ranges:
+            return {}, {}
+        filters = [
+            Record.is_deleted == false(),
+            _in_ranges(Record.start_time, ranges),
+        ]
+        if zone_id is not None:
+            filters.append(Record.zone_id == zone_id)
+        counts = []
+        for camera_id in (Record.camera_entrance_id, Record.camera_exit_id):
+            camera = aliased(Equipment)
+            query = (
+                select(camera.tag, func.count(camera_id))
+                .outerjoin(camera, camera_id == camera.id)
+                .filter(*filters)
+                .group_by(camera.tag)
+            )
+            counts.append(dict((await db.execute(query)).all()))
+        return counts[0], counts[1]
+
+    async def count_by_zone_buckets(
+        self,
+        db: AsyncSession,
+        *,
+        buckets: list[dict],
+        count_by: CountMetric,
+        zone_ids: list[int],
+    ) -> list[tuple[int, int, int]]:
+        """(zone_id, bucket index starting at 1, count) for all non empty cells."""
+        bucket = _bucket_table(buckets)
+        if count_by == CountMetric.present:
+            in_bucket = and_(
+                Record.end_time >= bucket.c.start,
+                Record.start_time <= bucket.c.end,
+            )
+        else:
+            in_bucket = Record.start_time.between(bucket.c.start, bucket.c.end)
+        counted = {
+            CountMetric.entry: Record.camera_entrance_id,
+            CountMetric.exit: Record.camera_exit_id,
+        }.get(count_by, Record.id)
+
+        query = (
+            select(Record.zone_id, bucket.c.idx, func.count(counted))
+            .select_from(bucket)
+            .join(Record, in_bucket)
+            .filter(Record.is_deleted == false(), Record.zone_id.in_(zone_ids))
+            .group_by(Record.zone_id, bucket.c.idx)
+        )
+        return (await db.execute(query)).all()
+
+    async def get_overlap_by_buckets(
+        self,
+        db: AsyncSession,
+        *,
+        buckets: list[dict],
+        zone_id: int | None = None,
+        by_zone: bool = False,
+    ) -> list[tuple]:
+        """([zone_id,] bucket index, count, overlap seconds) of finished records.
+
+        Every record is clipped to the bucket, so a stay crossing bucket
+        boundaries only counts the part inside each bucket.
+        """
+        bucket = _bucket_table(buckets)
+        overlap = func.least(Record.end_time, bucket.c.end) - func.greatest(
+            Record.start_time, bucket.c.start
+        )
+        columns = [
+            bucket.c.idx,
+            func.count(Record.id),
+            func.coalesce(func.sum(func.extract("epoch", overlap)), 0),
+        ]
+        group_by = [bucket.c.idx]
+        if by_zone:
+            columns.insert(0, Record.zone_id)
+            group_by.insert(0, Record.zone_id)
+
+        filters = [
+            Record.is_deleted == false(),
+            Record.latest_status == StatusRecord.finished.value,
+        ]
+        if zone_id is not None:
+            filters.append(Record.zone_id == zone_id)
+
+        query = (
+            select(*columns)
+            .select_from(bucket)
+            .join(
+                Record,
+                and_(
+                    Record.end_time >= bucket.c.start,
+                    Record.start_time <= bucket.c.end,
+                ),
+            )
+            .filter(*filters)
+            .group_by(*group_by)
+        )
+        return (await db.execute(query)).all()
+
+
+class RollupRepository:
+    """Hourly rollups of records (by start_time) and bills (by created)."""
+
+    def get_touched_hours(
+        self, db: Session, *, since: datetime
+    ) -> tuple[list[datetime], list[datetime]]:
+        # soft deletes set modified too, so deleted rows are rebuilt away
+        record_hours = db.scalars(
+            select(
+                distinct(func.date_trunc("hour", Record.start_time))
+            ).filter(Record.modified >= since, Record.start_time.is_not(None))
+        ).all()
+        bill_hours = db.scalars(
+            select(distinct(func.date_trunc("hour", Bill.created))).filter(
+                Bill.modified >= since, Bill.created.is_not(None)
+            )
+        ).all()
+        return record_hours, bill_hours
+
+    def pop_stale_hours(
+        self, db: Session
+    ) -> tuple[set[datetime], set[datetime]]:
+        """Record and bill hours left by moved or deleted rows, and clear them.
+
+        Rows written by transactions still running stay for the next run.
+        """
+        rows = db.execute(
+            delete(RollupStaleHour).returning(
+                RollupStaleHour.kind, RollupStaleHour.hour
+            )
+        ).all()
+        record_hours = {hour for kind, hour in rows if kind == "record"}
+        bill_hours = {hour for kind, hour in rows if kind == "bill"}
+        return record_hours, bill_hours
+
+    def add_stale_hours(self, db: Session, rows: list[dict]) -> None:
+        if rows:
+            db.execute(insert(RollupStaleHour), rows)
+
+    def get_first_hour(self, db: Session) -> datetime | None:
+        first = [
+            db.scalar(select(func.min(Record.start_time))),
+            db.scalar(select(func.min(Bill.created))),
+        ]
+        first = [time for time in first if time is not None]
+        if not first:
+            return None
+        return min(first).replace(minute=0, second=0, microsecond=0)
+
+    def rebuild_record_hours(self, db: Session, hours: list[datetime]) -> None:
+        if not hours:
+            return
+        hour = func.date_trunc("hour", Record.start_time)
+        db.execute(delete(RecordHourly).where(RecordHourly.hour.in_(hours)))
+        db.execute(
+            insert(RecordHourly).from_select(
+                [
+                    "hour",
+                    "zone_id",
+                    "camera_id",
+                    "camera_exit_id",
+                    "count_referred",
+                    "count_entry",
+                    "count_exit",
+                    "park_seconds",
+                ],
+                select(
+                    hour,
+                    Record.zone_id,
+                    Record.camera_entrance_id,
+                    Record.camera_exit_id,
+                    func.count(Record.id),
+                    func.count(Record.camera_entrance_id),
+                    func.count(Record.camera_exit_id),
+                    func.coalesce(
+                        func.sum(
+                            func.extract(
+                                "epoch", Record.end_time - Record.start_time
+                            )
+                        ).filter(
+                            Record.latest_status == StatusRecord.finished.value
+                        ),
+                        0,
+                    ),
+                )
+                .filter(
+                    Record.is_deleted == false(),
+                    Record.start_time >= min(hours),
+                    Record.start_time < max(hours) + timedelta(hours=1),
+                    hour.in_(hours),
+                )
+                .group_by(
+                    hour,
+                    Record.zone_id,
+                    Record.camera_entrance_id,
+                    Record.camera_exit_id,
+                ),
+            )
+        )
+
+    def rebuild_bill_hours(self, db: Session, hours: list[datetime]) -> None:
+        if not hours:
+            return
+        hour = func.date_trunc("hour", Bill.created)
+        db.execute(delete(BillHourly).where(BillHourly.hour.in_(hours)))
+        db.execute(
+            insert(BillHourly).from_select(
+                [
+                    "hour",
+                    "zone_id",
+                    "camera_id",
+                    "bill_count",
+                    "bill_sum",
+                    "paid_count",
+                    "paid_sum",
+                    "unpaid_count",
+                    "unpaid_sum",
+                ],
+                select(
+                    hour,
+                    Bill.zone_id,
+                    Bill.camera_entrance_id,
+                    func.count(Bill.id),
+                    func.coalesce(func.sum(Bill.price), 0),
+                    func.count(Bill.id).filter(Bill.status == StatusBill.paid),
+                    func.coalesce(
+                        func.sum(Bill.price).filter(
+                            Bill.status == StatusBill.paid
+                        ),
+                        0,
+                    ),
+                    func.count(Bill.id).filter(
+                        Bill.status == StatusBill.unpaid
+                    ),
+                    func.coalesce(
+                        func.sum(Bill.price).filter(
+                            Bill.status == StatusBill.unpaid
+                        ),
+                        0,
+                    ),
+                )
+                .filter(
+                    Bill.is_deleted == false(),
+                    Bill.created >= min(hours),
+                    Bill.created < max(hours) + timedelta(hours=1),
+                    hour.in_(hours),
+                )
+                .group_by(hour, Bill.zone_id, Bill.camera_entrance_id),
+            )
+        )
+
+    async def get_record_stats_by_zone(
+        self, db: AsyncSession, *, start_hour: datetime, end_hour: datetime
+    ) -> dict[int | None, dict]:
+        query = (
+            select(
+                RecordHourly.zone_id,
+                func.sum(RecordHourly.count_entry).label("count_entry"),
+                func.sum(RecordHourly.count_exit).label("count_leave"),
+                func.sum(RecordHourly.count_referred).label("total_referred"),
+                func.sum(RecordHourly.park_seconds).label("park_seconds"),
+            )
+            .filter(
+                RecordHourly.hour >= start_hour, RecordHourly.hour < end_hour
+            )
+            .group_by(RecordHourly.zone_id)
+        )
+        rows = (await db.execute(query)).mappings().all()
+        return {row["zone_id"]: row for row in rows}
+
+    async def get_bill_stats_by_zone(
+        self, db: AsyncSession, *, start_hour: datetime, end_hour: datetime
+    ) -> dict[int | None, dict]:
+        query = (
+            select(
+                BillHourly.zone_id,
+                func.sum(BillHourly.bill_sum).label("total_price"),
+                func.sum(BillHourly.bill_count).label("bill_count"),
+                func.sum(BillHourly.paid_sum).label("total_income"),
+                func.sum(BillHourly.paid_count).label("paid_count"),
+                func.sum(BillHourly.unpaid_sum).label("unpaid_price"),
+                func.sum(BillHourly.unpaid_count).label("unpaid_count"),
+            )
+            .filter(BillHourly.hour >= start_hour, BillHourly.hour < end_hour)
+            .group_by(BillHourly.zone_id)
+        )
+        rows = (await db.execute(query)).mappings().all()
+        return {row["zone_id"]: row for row in rows}
+
+    async def get_bill_price_by_period(
+        self,
+        db: AsyncSession,
+        *,
+        timing: Timing,
+        start_hour: datetime,
+        end_hour: datetime,
+        zone_id: int | None = None,
+    ) -> list[tuple[datetime, float]]:
+        period = func.date_trunc(timing.value, BillHourly.hour)
+        filters = [BillHourly.hour >= start_hour, BillHourly.hour < end_hour]
+        if zone_id is not None:
+            filters.append(BillHourly.zone_id == zone_id)
+        query = (
+            select(period, func.sum(BillHourly.bill_sum))
+            .filter(*filters)
+            .group_by(period)
+        )
+        return (await db.execute(query)).all()
+
+    async def count_entrance_exit_by_camera(
+        self,
+        db: AsyncSession,
+        *,
+        start_hour: datetime,
+        end_hour: datetime,
+        zone_id: int | None = None,
+    ) -> tuple[dict[str | None, int], dict[str | None, int]]:
+        filters = [
+            RecordHourly.hour >= start_hour,
+            RecordHourly.hour < end_hour,
+        ]
+        if zone_id is not None:
+            filters.append(RecordHourly.zone_id == zone_id)
+        counts = []
+        for camera_id, count in (
+            (RecordHourly.camera_id, RecordHourly.count_entry),
+            (RecordHourly.camera_exit_id, RecordHourly.count_exit),
+        ):
+            camera = aliased(Equipment)
+            query = (
+                select(camera.tag, func.sum(count))
+                .outerjoin(camera, camera_id == camera.id)
+                .filter(*filters)
+                .group_by(camera.tag)
+            )
+            counts.append(dict((await db.execute(query)).all()))
+        return counts[0], counts[1]
+
+    async def count_by_zone_buckets(
+        self,
+        db: AsyncSession,
+        *,
+        buckets: list[dict],
+        count_by: CountMetric,
+        zone_ids: list[int],
+    ) -> list[tuple[int, int, int]]:
+        """(zone_id, bucket index starting at 1, count) of [start, end) hours.
+
+        Presence is not kept by hour, count_by present is not supported.
+        """
+        bucket = _bucket_table(buckets)
+        counted = {
+            CountMetric.entry: RecordHourly.count_entry,
+            CountMetric.exit: RecordHourly.count_exit,
+            CountMetric.referred: RecordHourly.count_referred,
+        }[count_by]
+        query = (
+            select(RecordHourly.zone_id, bucket.c.idx, func.sum(counted))
+            .select_from(bucket)
+            .join(
+                RecordHourly,
+                and_(
+                    RecordHourly.hour >= bucket.c.start,
+                    RecordHourly.hour < bucket.c.end,
+                ),
+            )
+            .filter(RecordHourly.zone_id.in_(zone_ids))
+            .group_by(RecordHourly.zone_id, bucket.c.idx)
+        )
+        return (await db.execute(query)).all()
+
+
+report_repo = ReportRepository()
+rollup_repo = RollupRepository()
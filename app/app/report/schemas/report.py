@@ -16,6 +16,13 @@ class DoorType(str, Enum):
     exit = "exit"
 
 
+class CountMetric(str, Enum):
+    present = "present"
+    referred = "referred"
+    entry = "entry"
+    exit = "exit"
+
+
 class Capacity(BaseModel):
     total: int | None = None
     empty: int | None = None
@@ -1,14 +1,20 @@
+from collections import Counter
+
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.bill.repo import bill_repo
 from app import crud, schemas
 from app.parking.repo import zone_repo
 from datetime import datetime, timedelta, UTC
 from dateutil.relativedelta import relativedelta
 from app.report import schemas as report_schemas
+from app.report.repo import report_repo
+from app.report.services import rollup as rollup_services
 from app.parking.repo import zone_repo
+from app.parking.cache import metadata_cache
+from app.parking.occupancy import occupancy
 from app.parking.services import zone as zone_services
 from typing import Any
 from fastapi.encoders import jsonable_encoder
+import pandas as pd
 
 
 # calculate  first date month
@@ -82,6 +88,11 @@ def calculate_percentage(start_time, end_time):
     return round(percentage_difference)
 
 
+def _sum_stats(stats: dict, key: str):
+    # metric of all the zones of get_stats_by_zone
+    return sum(row.get(key) or 0 for row in stats.values())
+
+
 async def capacity(
     db: AsyncSession,
     start_time: datetime | None = None,
@@ -95,36 +106,30 @@ async def capacity(
         end_time = datetime.now(UTC).replace(
             tzinfo=None, hour=23, minute=59, second=59, microsecond=9999
         ) - timedelta(hours=3, minutes=30)
-    count_referred = await crud.record.get_count_referred(
-        db,
-        input_start_create_time=start_time,
-        input_end_create_time=end_time,
-    )
-
-    total_amount_bill = await bill_repo.get_total_amount_bill(
-        db, start_time=start_time
+    record_stats, bill_stats = await rollup_services.get_stats_by_zone(
+        db, start_time=start_time, end_time=end_time
     )
-    if total_amount_bill is None:
-        total_amount_bill = 0
 
-    time_park = await crud.record.get_time_park(
-        db,
-        start_time_in=start_time,
-        end_time_in=end_time,
-    )
-    if time_park:
-        time_park = round(time_park.total_seconds() / 60)
-    else:
-        time_park = 0
+    count_referred = _sum_stats(record_stats, "total_referred")
+    total_amount_bill = _sum_stats(bill_stats, "total_price")
+    time_park = round(float(_sum_stats(record_stats, "park_seconds")) / 60)
 
     capacity_zones, count_zone = await zone_repo.get_capacity_count_zone(db)
 
-    unknown_referred = await crud.record.get_count_unknown_referred(db)
+    counts = occupancy.get_counts()
+    if counts is not None:
+        unknown_referred = occupancy.count(
+            counts[schemas.StatusRecord.unknown.value]
+        )
+        total_count_in_parking = occupancy.count(
+            counts[schemas.StatusRecord.unfinished.value]
+        )
+    else:
+        unknown_referred = await crud.record.get_count_unknown_referred(db)
+        total_count_in_parking = await crud.record.get_total_in_parking(db)
     if unknown_referred is None:
         unknown_referred = 0
 
-    total_count_in_parking = await crud.record.get_total_in_parking(db)
-
     if not total_count_in_parking:
         total_count_in_parking = 0
 
@@ -139,13 +144,8 @@ async def capacity(
     else:
         effective_utilization_rate = 0
 
-    entry, leave = await crud.record.count_entrance_exit_door_zone(
-        db, start_time_in=start_time, end_time_in=end_time
-    )
-    if entry is None:
-        entry = 0
-    if leave is None:
-        leave = 0
+    entry = _sum_stats(record_stats, "count_entry")
+    leave = _sum_stats(record_stats, "count_leave")
     return report_schemas.Capacity(
         total=capacity_zones,
         empty=empty,
@@ -175,37 +175,40 @@ async def report_zone(
             tzinfo=None, hour=23, minute=59, second=59, microsecond=9999
         ) - timedelta(hours=3, minutes=30)
     zones = await zone_repo.get_multi(db, limit=None)
-    for zone in zones:
-        zone_id = {zone.id}
-        entry, leave = await crud.record.count_entrance_exit_door_zone(
-            db,
-            start_time_in=start_time,
-            end_time_in=end_time,
-            zone_id_in=zone.id,
-        )
-        if entry is None:
-            entry = 0
-        if leave is None:
-            leave = 0
-        zone = await zone_services.set_children_ancestors_capacity(db, zone)
-        zone.total_referred = (
-            await crud.record.get_today_count_referred_by_zone(
-                db,
-                zone_id_in=zone.id,
-                start_time_in=start_time,
-                end_time_in=end_time,
+    zone_tree = await metadata_cache.get_zone_tree_async(db)
+    record_stats, bill_stats = await rollup_services.get_stats_by_zone(
+        db, start_time=start_time, end_time=end_time
+    )
+    counts = occupancy.get_counts()
+    if counts is None:
+        counts = {
+            status: Counter(
+                {
+                    zone_id: stats[status]
+                    for zone_id, stats in record_stats.items()
+                    if status in stats
+                }
             )
+            for status in ("full", "unknown")
+        }
+    else:
+        counts = {
+            "full": counts[schemas.StatusRecord.unfinished.value],
+            "unknown": counts[schemas.StatusRecord.unknown.value],
+        }
+    for zone in zones:
+        stats = record_stats.get(zone.id, {})
+        zone_ids = zone_tree.children(zone.id) | {zone.id}
+        zone.full = occupancy.count(counts["full"], zone_ids)
+        zone.empty = (
+            (zone.capacity - zone.full) if zone.full else zone.capacity
         )
-        time_park = await crud.record.get_time_park(
-            db,
-            zone_id_in=zone.id,
-            start_time_in=start_time,
-            end_time_in=end_time,
-        )
+        if zone.empty < 0:
+            zone.empty = 0
+        zone.unknown = occupancy.count(counts["unknown"], zone_ids)
+        zone.total_referred = stats.get("total_referred", 0)
 
-        convert_time = 0
-        if time_park:
-            convert_time = time_park.total_seconds() / 60
+        convert_time = float(stats.get("park_seconds") or 0) / 60
 
         effective_utilization_rate = 0
         if convert_time > 0 and zone.capacity > 0:
@@ -216,18 +219,13 @@ async def report_zone(
 
         zone.time_park_minute_today = round(convert_time)
 
-        total_price, total_income = await bill_repo.get_price_income(
-            db,
-            zone_id=zone_id,
-            start_time_in=start_time,
-            end_time_in=end_time,
-        )
+        bills = bill_stats.get(zone.id, {})
 
-        zone.count_entry = entry
-        zone.count_leave = leave
+        zone.count_entry = stats.get("count_entry", 0)
+        zone.count_leave = stats.get("count_leave", 0)
 
-        zone.avrage_amount_bill_today = round(total_price)
-        zone.income_today_parking = round(total_income)
+        zone.avrage_amount_bill_today = round(bills.get("total_price") or 0)
+        zone.income_today_parking = round(bills.get("total_income") or 0)
         zone.pricings = []
         zone.ancestors = []
         zone.children = []
@@ -240,6 +238,29 @@ async def report_zone(
     return zones
 
 
+async def get_overlap_by_buckets(
+    db: AsyncSession,
+    *,
+    buckets: list[dict],
+    zone_id: int | None = None,
+    by_zone: bool = False,
+) -> dict[tuple[int | None, int], tuple[int, float]]:
+    """{(zone_id or None, bucket index): (count, seconds)} of finished records."""
+    if not buckets:
+        return {}
+    rows = await report_repo.get_overlap_by_buckets(
+        db, buckets=buckets, zone_id=zone_id, by_zone=by_zone
+    )
+    if by_zone:
+        return {
+            (row_zone_id, idx): (count, float(seconds))
+            for row_zone_id, idx, count, seconds in rows
+        }
+    return {
+        (None, idx): (count, float(seconds)) for idx, count, seconds in rows
+    }
+
+
 async def effective_utilization_rate(
     db: AsyncSession,
     *,
@@ -254,48 +275,20 @@ async def effective_utilization_rate(
     if time_difference <= 0:
         time_difference = 1
 
+    overlap = await get_overlap_by_buckets(
+        db,
+        buckets=[{"start": start_time_in, "end": end_time_in}],
+        by_zone=True,
+    )
     for zone in get_zones:
-        capacity_zone = await crud.zone_repo.get_capacity(db, zone_id=zone.id)
-
-        records, toatl_count = await crud.record.get_present_in_parking(
-            db,
-            input_start_create_time=start_time_in,
-            input_end_create_time=end_time_in,
-            input_status=schemas.record.StatusRecord.finished,
-            zone_id=zone.id,
-        )
-        total_park_time = timedelta(hours=0)
-        for record in records:
-            if (
-                record.start_time < start_time_in
-                and record.end_time < end_time_in
-            ):
-                total_park_time += record.end_time - start_time_in
-            elif (
-                record.start_time > start_time_in
-                and record.end_time < end_time_in
-            ):
-                total_park_time += record.end_time - record.start_time
-            elif (
-                record.start_time < start_time_in
-                and record.end_time > end_time_in
-            ):
-                total_park_time += end_time_in - record.start_time
-            elif (
-                record.start_time > start_time_in
-                and record.end_time > end_time_in
-            ):
-                total_park_time += end_time_in - record.start_time
+        capacity_zone = zone.capacity or 0
+        _, park_seconds = overlap.get((zone.id, 1), (0, 0))
         effective_utilization_rate = 0
-        if (
-            capacity_zone > 0
-            and records != None
-            and total_park_time > timedelta(hours=0)
-        ):
+        if capacity_zone > 0 and park_seconds > 0:
             effective_utilization_rate = round(
                 (
                     (
-                        (total_park_time.total_seconds() / 3600)
+                        (park_seconds / 3600)
                         / (capacity_zone * 24 * time_difference)
                     )
                     * 100
@@ -401,10 +394,9 @@ async def get_zone_deta(
     db: AsyncSession,
     start_time_in: datetime,
     end_time_in: datetime,
-    fetch_func,
+    count_by: report_schemas.CountMetric,
     timing: report_schemas.Timing,
     zone_id: int | None = None,
-    door_type: report_schemas.DoorType | None = None,
 ) -> dict:
 
     range_date = create_ranges_datetime(
@@ -417,44 +409,38 @@ async def get_zone_deta(
         if zone_id is None
         else [await crud.zone_repo.get(db, id=zone_id)]
     )
-    total_count = [
-        {"start": dt["start"], "end": dt["start"], "count": 0}
-        for dt in range_date
-    ]
+    zone_ids = [zone.id for zone in get_zones]
+    buckets = range(1, len(range_date) + 1)
+
+    # whole zones x buckets matrix in one query, empty cells are filled here
+    counts = await rollup_services.count_by_zone_buckets(
+        db, buckets=range_date, count_by=count_by, zone_ids=zone_ids
+    )
+    matrix = pd.DataFrame(0, index=zone_ids, columns=buckets)
+    for count_zone_id, idx, count in counts:
+        matrix.at[count_zone_id, idx] = count
 
     result = {}
     for zone in get_zones:
-        zone_data = []
-
-        for date_time in range_date:
-            if fetch_func == crud.record.count_entrance_exit_door:
-                count = await fetch_func(
-                    db,
-                    start_time_in=date_time.get("start"),
-                    end_time_in=date_time.get("end"),
-                    zone_id_in=zone.id,
-                    door_type=door_type,
-                )
-            else:
-                count = await fetch_func(
-                    db,
-                    start_time_in=date_time.get("start"),
-                    end_time_in=date_time.get("end"),
-                    zone_id_in=zone.id,
-                )
-            zone_data.append(
-                {
-                    "start": date_time.get("start"),
-                    "end": date_time.get("end"),
-                    "count": count or 0,
-                }
+        result[zone.name] = [
+            {
+                "start": date_time.get("start"),
+                "end": date_time.get("end"),
+                "count": count,
+            }
+            for date_time, count in zip(
+                range_date, matrix.loc[zone.id].tolist()
             )
-            total_count[range_date.index(date_time)]["count"] += count
-
-        # Append zone data
-        result[zone.name] = zone_data
+        ]
 
-    result["total"] = total_count
+    result["total"] = [
+        {
+            "start": date_time["start"],
+            "end": date_time["start"],
+            "count": count,
+        }
+        for date_time, count in zip(range_date, matrix.sum(axis=0).tolist())
+    ]
 
     return result
 
@@ -471,7 +457,7 @@ async def get_parking_occupancy_by_zone(
         db,
         start_time_in=start_time_in,
         end_time_in=end_time_in,
-        fetch_func=crud.record.get_present_in_parking_count,
+        count_by=report_schemas.CountMetric.present,
         zone_id=zone_id,
         timing=timing,
     )
@@ -489,7 +475,7 @@ async def get_count_referred_by_zone(
         db,
         start_time_in=start_time_in,
         end_time_in=end_time_in,
-        fetch_func=crud.record.get_today_count_referred_by_zone,
+        count_by=report_schemas.CountMetric.referred,
         zone_id=zone_id,
         timing=timing,
     )
@@ -508,10 +494,9 @@ async def get_count_entry_leave_by_zone(
         db,
         start_time_in=start_time_in,
         end_time_in=end_time_in,
-        fetch_func=crud.record.count_entrance_exit_door,
+        count_by=report_schemas.CountMetric(door_type),
         zone_id=zone_id,
         timing=timing,
-        door_type=door_type,
     )
 
 
@@ -608,47 +593,16 @@ async def get_parking_occupancy(
     )
 
     capacity_zone = await crud.zone_repo.get_capacity(db, zone_id=zone_id)
+    overlap = await get_overlap_by_buckets(
+        db, buckets=range_date, zone_id=zone_id
+    )
     resualt = []
-    for date_time in range_date:
-        records, total_count = await crud.record.get_present_in_parking(
-            db,
-            input_start_create_time=date_time.get("start"),
-            input_end_create_time=date_time.get("end"),
-            input_status=schemas.record.StatusRecord.finished,
-            zone_id=zone_id,
-        )
-        total_park_time = timedelta(hours=0)
-        for record in records:
-            if record.start_time < date_time.get(
-                "start"
-            ) and record.end_time < date_time.get("end"):
-                total_park_time += record.end_time - date_time.get("start")
-            elif record.start_time > date_time.get(
-                "start"
-            ) and record.end_time < date_time.get("end"):
-                total_park_time += record.end_time - record.start_time
-            elif record.start_time < date_time.get(
-                "start"
-            ) and record.end_time > date_time.get("end"):
-                total_park_time += date_time.get("end") - record.start_time
-            elif record.start_time > date_time.get(
-                "start"
-            ) and record.end_time > date_time.get("end"):
-                total_park_time += date_time.get("end") - record.start_time
+    for idx, date_time in enumerate(range_date, start=1):
+        total_count, park_seconds = overlap.get((None, idx), (0, 0))
         effective_utilization_rate = 0
-        if (
-            capacity_zone > 0
-            and records != None
-            and total_park_time > timedelta(hours=0)
-        ):
+        if capacity_zone and capacity_zone > 0 and park_seconds > 0:
             effective_utilization_rate = round(
-                (
-                    (
-                        (total_park_time.total_seconds() / 3600)
-                        / (capacity_zone * 24)
-                    )
-                    * 100
-                ),
+                (((park_seconds / 3600) / (capacity_zone * 24)) * 100),
                 2,
             )
         resualt.append(
@@ -686,12 +640,14 @@ async def count_entrance_exit_zone(
     obj_camera_entrance = _initialize_cameras(camera_entrance)
     obj_camera_exit = _initialize_cameras(camera_exit)
 
+    if start_time_in is None or end_time_in is None:
+        start_time_in = end_time_in = None
     count_entrance, count_exit = (
-        await crud.record.count_entrance_exit_door_by_camera_tag(
+        await rollup_services.count_entrance_exit_by_camera(
             db,
-            zone_id_in=zone_id_in,
-            start_time_in=start_time_in,
-            end_time_in=end_time_in,
+            start_time=start_time_in,
+            end_time=end_time_in,
+            zone_id=zone_id_in,
         )
     )
     total_entrance = 0
@@ -724,40 +680,48 @@ async def report_bill(
     end_time_in: datetime,
 ):
 
-    total_bills, bills_paid, bills_unpaid = (
-        await bill_repo.get_total_price_count(
-            db,
-            zone_id=zone_id,
-            start_time_in=start_time_in,
-            end_time_in=end_time_in,
-        )
+    bill_stats = await rollup_services.get_bill_stats_by_zone(
+        db, start_time=start_time_in, end_time=end_time_in
     )
-    total_amount = 0
-    if total_bills[0] is not None:
-        total_amount = round(total_bills[0])
-    total_amount_paid = 0
-    if bills_paid[0] is not None:
-        total_amount_paid = round(bills_paid[0])
-    total_amount_unpaid = 0
-    if bills_unpaid[0] is not None:
-        total_amount_unpaid = round(bills_unpaid[0])
+    if zone_id is not None:
+        bill_stats = {zone_id: bill_stats.get(zone_id, {})}
 
     return {
         "total_bills": {
-            "price": total_amount,
-            "count": total_bills[1],
+            "price": round(_sum_stats(bill_stats, "total_price")),
+            "count": _sum_stats(bill_stats, "bill_count"),
         },
         "bills_paid": {
-            "price": total_amount_paid,
-            "count": bills_paid[1],
+            "price": round(_sum_stats(bill_stats, "total_income")),
+            "count": _sum_stats(bill_stats, "paid_count"),
         },
         "bills_unpaid": {
-            "price": total_amount_unpaid,
-            "count": bills_unpaid[1],
+            "price": round(_sum_stats(bill_stats, "unpaid_price")),
+            "count": _sum_stats(bill_stats, "unpaid_count"),
         },
     }
 
 
+async def avg_price_per_referred(
+    db: AsyncSession,
+    *,
+    start_time_in: datetime | None = None,
+    end_time_in: datetime | None = None,
+    zone_id: int | None = None,
+) -> int:
+    if start_time_in is None or end_time_in is None:
+        start_time_in = end_time_in = None
+    bill_stats = await rollup_services.get_bill_stats_by_zone(
+        db, start_time=start_time_in, end_time=end_time_in
+    )
+    if zone_id is not None:
+        bill_stats = {zone_id: bill_stats.get(zone_id, {})}
+    count = _sum_stats(bill_stats, "bill_count")
+    if count == 0:
+        return 0
+    return round(_sum_stats(bill_stats, "total_price") / count)
+
+
 async def report_bill_by_timing(
     db: AsyncSession,
     *,
@@ -770,7 +734,7 @@ async def report_bill_by_timing(
         start_date=start_time_in, end_date=end_time_in, timing=timing
     )
 
-    total_bills = await bill_repo.get_total_price_by_timing(
+    total_bills = await rollup_services.get_bill_price_by_period(
         db,
         timing=(
             timing
@@ -778,8 +742,8 @@ async def report_bill_by_timing(
             else report_schemas.Timing.day
         ),
         zone_id=zone_id,
-        start_time_in=start_time_in,
-        end_time_in=end_time_in,
+        start_time=start_time_in,
+        end_time=end_time_in,
     )
 
     convert_total_bills = {date.date(): price for date, price in total_bills}
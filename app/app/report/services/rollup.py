@@ -0,0 +1,373 @@
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, UTC
+
+from redis.exceptions import RedisError
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.bill.models import Bill
+from app.core.config import settings
+from app.models.record import Record
+from app.report.cache import report_cache
+from app.report.repo import report_repo, rollup_repo
+from app.report.schemas import CountMetric, Timing
+from cache.redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+# every change made before this time is in the rollups
+SYNCED_AT_KEY = "report:rollup:synced_at"
+
+# kind and hour column of the rollups of each model
+ROLLUP_HOURS = {Record: ("record", "start_time"), Bill: ("bill", "created")}
+
+
+def get_synced_at() -> datetime | None:
+    try:
+        synced_at = redis_client.get(SYNCED_AT_KEY)
+    except RedisError as e:
+        logger.error(f"rollup state unavailable {e}")
+        return None
+    if synced_at is None:
+        return None
+    if isinstance(synced_at, bytes):
+        synced_at = synced_at.decode()
+    return datetime.fromisoformat(synced_at)
+
+
+def set_synced_at(synced_at: datetime) -> None:
+    redis_client.set(SYNCED_AT_KEY, synced_at.isoformat())
+
+
+def get_synced_until() -> datetime:
+    """Watermark of a run starting now.
+
+    `modified` is set on flush, a row committed later carries an older
+    time, the margin makes the next run scan those rows again.
+    """
+    return datetime.now(UTC).replace(tzinfo=None) - timedelta(
+        seconds=settings.ROLLUP_SYNC_MARGIN
+    )
+
+
+def update_rollups(db: Session) -> str:
+    """Rebuild the hours touched by records and bills modified since the last run."""
+    since = get_synced_at()
+    if since is None:
+        return "rollups are not initialized, run backfill_rollups.py"
+    synced_at = get_synced_until()
+    record_hours, bill_hours = rollup_repo.get_touched_hours(db, since=since)
+    # rows moved to another hour are found in it through modified, the
+    # hour they left is recorded on flush
+    stale_record_hours, stale_bill_hours = rollup_repo.pop_stale_hours(db)
+    record_hours = sorted({*record_hours, *stale_record_hours})
+    bill_hours = sorted({*bill_hours, *stale_bill_hours})
+    rollup_repo.rebuild_record_hours(db, record_hours)
+    rollup_repo.rebuild_bill_hours(db, bill_hours)
+    db.commit()
+    set_synced_at(synced_at)
+    if record_hours or bill_hours:
+        report_cache.apply_rollups()
+    return (
+        f"rebuilt {len(record_hours)} record hours and "
+        f"{len(bill_hours)} bill hours changed since {since}"
+    )
+
+
+def backfill_rollups(
+    db: Session,
+    start_time: datetime | None = None,
+    end_time: datetime | None = None,
+) -> int:
+    """Rebuild every hour in [start_time, end_time), one day per transaction."""
+    synced_at = get_synced_until()
+    if start_time is None:
+        start_time = rollup_repo.get_first_hour(db)
+        if start_time is None:
+            set_synced_at(synced_at)
+            return 0
+    if end_time is None:
+        end_time = synced_at
+    hour = start_time.replace(minute=0, second=0, microsecond=0)
+    count = 0
+    while hour < end_time:
+        hours = []
+        while hour < end_time and len(hours) < 24:
+            hours.append(hour)
+            hour += timedelta(hours=1)
+        rollup_repo.rebuild_record_hours(db, hours)
+        rollup_repo.rebuild_bill_hours(db, hours)
+        db.commit()
+        report_cache.apply_rollups()
+        count += len(hours)
+        logger.info(f"rollups rebuilt up to {hour}")
+    # only a full backfill makes the incremental updates safe to start
+    if get_synced_at() is None or end_time >= synced_at:
+        set_synced_at(synced_at)
+        report_cache.apply_rollups()
+    return count
+
+
+def get_stale_hours(session: Session) -> list[dict]:
+    """Previous hour of the records and bills moved to another hour."""
+    rows = []
+    for obj in session.dirty:
+        rollup = ROLLUP_HOURS.get(type(obj))
+        if rollup is None:
+            continue
+        kind, attr = rollup
+        history = inspect(obj).attrs[attr].history
+        current = {_truncate_hour(value) for value in history.added or ()}
+        for value in history.deleted or ():
+            hour = _truncate_hour(value)
+            if hour is not None and hour not in current:
+                rows.append({"kind": kind, "hour": hour})
+    return rows
+
+
+def _truncate_hour(value: datetime | None) -> datetime | None:
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(UTC).replace(tzinfo=None)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _load_previous_hour(target, value, oldvalue, initiator):
+    # nothing to do, `active_history` loads the replaced value of an
+    # expired attribute so the flush still sees the hour it leaves
+    pass
+
+
+for _model, (_, _attr) in ROLLUP_HOURS.items():
+    event.listen(
+        getattr(_model, _attr), "set", _load_previous_hour, active_history=True
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _add_stale_hours(session, flush_context):
+    if settings.ROLLUP_PERIOD > 0:
+        rollup_repo.add_stale_hours(session, get_stale_hours(session))
+
+
+def split_rollup_range(
+    start_time: datetime, end_time: datetime, synced_at: datetime | None
+) -> tuple[tuple[datetime, datetime] | None, list[tuple[datetime, datetime]]]:
+    """Split [start_time, end_time] into whole synced hours and raw edges.
+
+    Returns the [start_hour, end_hour) range readable from the rollups and
+    the inclusive ranges that still need a scan of the raw tables.
+    """
+    if synced_at is None:
+        return None, [(start_time, end_time)]
+    first_hour = start_time.replace(minute=0, second=0, microsecond=0)
+    if first_hour < start_time:
+        first_hour += timedelta(hours=1)
+    last_hour = synced_at.replace(minute=0, second=0, microsecond=0)
+    if end_time < last_hour:
+        last_hour = (end_time + timedelta(microseconds=1)).replace(
+            minute=0, second=0, microsecond=0
+        )
+    if first_hour >= last_hour:
+        return None, [(start_time, end_time)]
+    raw_ranges = []
+    if start_time < first_hour:
+        raw_ranges.append((start_time, first_hour - timedelta(microseconds=1)))
+    if last_hour <= end_time:
+        raw_ranges.append((last_hour, end_time))
+    return (first_hour, last_hour), raw_ranges
+
+
+def split_range(
+    start_time: datetime | None, end_time: datetime | None
+) -> tuple[tuple[datetime, datetime] | None, list[tuple[datetime, datetime]]]:
+    """`split_rollup_range` at the current watermark, None is unbounded."""
+    synced_at = get_synced_at() if settings.ROLLUP_PERIOD > 0 else None
+    return split_rollup_range(
+        start_time or datetime.min, end_time or datetime.max, synced_at
+    )
+
+
+def _merge(stats: dict, rollup_stats: dict) -> dict:
+    merged = {zone_id: dict(row) for zone_id, row in stats.items()}
+    for zone_id, row in rollup_stats.items():
+        merged_row = merged.setdefault(zone_id, {})
+        for key, value in row.items():
+            if key != "zone_id":
+                merged_row[key] = (merged_row.get(key) or 0) + (value or 0)
+    return merged
+
+
+def _merge_counts(*counts: dict) -> dict:
+    merged = Counter()
+    for count in counts:
+        for key, value in count.items():
+            merged[key] += value or 0
+    return dict(merged)
+
+
+async def get_record_stats_by_zone(
+    db: AsyncSession,
+    *,
+    start_time: datetime | None,
+    end_time: datetime | None,
+) -> dict[int | None, dict]:
+    """count_entry, count_leave, total_referred and park_seconds per zone.
+
+    The raw rows also hold the current full and unknown counts.
+    """
+    rollup_range, raw_ranges = split_range(start_time, end_time)
+    stats = await report_repo.get_record_stats_by_zone(db, ranges=raw_ranges)
+    if rollup_range is None:
+        return stats
+    start_hour, end_hour = rollup_range
+    return _merge(
+        stats,
+        await rollup_repo.get_record_stats_by_zone(
+            db, start_hour=start_hour, end_hour=end_hour
+        ),
+    )
+
+
+async def get_bill_stats_by_zone(
+    db: AsyncSession,
+    *,
+    start_time: datetime | None,
+    end_time: datetime | None,
+) -> dict[int | None, dict]:
+    """Sum and count of all, paid and unpaid bills per zone.
+
+    Rows hold total_price, bill_count, total_income, paid_count,
+    unpaid_price and unpaid_count.
+    """
+    rollup_range, raw_ranges = split_range(start_time, end_time)
+    stats = await report_repo.get_bill_stats_by_zone(db, ranges=raw_ranges)
+    if rollup_range is None:
+        return stats
+    start_hour, end_hour = rollup_range
+    return _merge(
+        stats,
+        await rollup_repo.get_bill_stats_by_zone(
+            db, start_hour=start_hour, end_hour=end_hour
+        ),
+    )
+
+
+async def get_stats_by_zone(
+    db: AsyncSession, *, start_time: datetime, end_time: datetime
+) -> tuple[dict, dict]:
+    """Record and bill metrics per zone, from the rollups where possible."""
+    record_stats = await get_record_stats_by_zone(
+        db, start_time=start_time, end_time=end_time
+    )
+    bill_stats = await get_bill_stats_by_zone(
+        db, start_time=start_time, end_time=end_time
+    )
+    return record_stats, bill_stats
+
+
+async def get_bill_price_by_period(
+    db: AsyncSession,
+    *,
+    timing: Timing,
+    start_time: datetime | None,
+    end_time: datetime | None,
+    zone_id: int | None = None,
+) -> list[tuple[datetime, float]]:
+    """(start of the period, price) of the bills created in the range."""
+    rollup_range, raw_ranges = split_range(start_time, end_time)
+    prices = [
+        dict(
+            await report_repo.get_bill_price_by_period(
+                db, timing=timing, ranges=raw_ranges, zone_id=zone_id
+            )
+        )
+    ]
+    if rollup_range is not None:
+        start_hour, end_hour = rollup_range
+        prices.append(
+            dict(
+                await rollup_repo.get_bill_price_by_period(
+                    db,
+                    timing=timing,
+                    start_hour=start_hour,
+                    end_hour=end_hour,
+                    zone_id=zone_id,
+                )
+            )
+        )
+    return sorted(_merge_counts(*prices).items())
+
+
+async def count_entrance_exit_by_camera(
+    db: AsyncSession,
+    *,
+    start_time: datetime | None,
+    end_time: datetime | None,
+    zone_id: int | None = None,
+) -> tuple[dict[str | None, int], dict[str | None, int]]:
+    """Entrances and exits of the records started in the range by camera tag."""
+    rollup_range, raw_ranges = split_range(start_time, end_time)
+    entrances, exits = await report_repo.count_entrance_exit_by_camera(
+        db, ranges=raw_ranges, zone_id=zone_id
+    )
+    if rollup_range is None:
+        return entrances, exits
+    start_hour, end_hour = rollup_range
+    rollup_entrances, rollup_exits = (
+        await rollup_repo.count_entrance_exit_by_camera(
+            db, start_hour=start_hour, end_hour=end_hour, zone_id=zone_id
+        )
+    )
+    return (
+        _merge_counts(entrances, rollup_entrances),
+        _merge_counts(exits, rollup_exits),
+    )
+
+
+async def count_by_zone_buckets(
+    db: AsyncSession,
+    *,
+    buckets: list[dict],
+    count_by: CountMetric,
+    zone_ids: list[int],
+) -> list[tuple[int, int, int]]:
+    """(zone_id, bucket index starting at 1, count) for all non empty cells.
+
+    Presence overlaps the buckets and is always counted from the records.
+    """
+    if count_by == CountMetric.present:
+        return await report_repo.count_by_zone_buckets(
+            db, buckets=buckets, count_by=count_by, zone_ids=zone_ids
+        )
+    # every bucket is split on its own, the parts keep the bucket index
+    rollup_buckets, rollup_idx, raw_buckets, raw_idx = [], [], [], []
+    synced_at = get_synced_at() if settings.ROLLUP_PERIOD > 0 else None
+    for idx, bucket in enumerate(buckets, start=1):
+        rollup_range, raw_ranges = split_rollup_range(
+            bucket["start"], bucket["end"], synced_at
+        )
+        if rollup_range is not None:
+            rollup_buckets.append(
+                {"start": rollup_range[0], "end": rollup_range[1]}
+            )
+            rollup_idx.append(idx)
+        for start, end in raw_ranges:
+            raw_buckets.append({"start": start, "end": end})
+            raw_idx.append(idx)
+
+    counts = Counter()
+    if raw_buckets:
+        for zone_id, idx, count in await report_repo.count_by_zone_buckets(
+            db, buckets=raw_buckets, count_by=count_by, zone_ids=zone_ids
+        ):
+            counts[zone_id, raw_idx[idx - 1]] += count
+    if rollup_buckets:
+        for zone_id, idx, count in await rollup_repo.count_by_zone_buckets(
+            db, buckets=rollup_buckets, count_by=count_by, zone_ids=zone_ids
+        ):
+            counts[zone_id, rollup_idx[idx - 1]] += count
+    return [(zone_id, idx, count) for (zone_id, idx), count in counts.items()]
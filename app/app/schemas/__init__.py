@@ -54,3 +54,4 @@ from .record import (
     RecordUpdatePlate,
     RecordDelete
 )
+from .stream import StreamFilter
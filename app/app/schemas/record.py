@@ -87,6 +87,16 @@ class Record(RecordInDBBase):
     zone_name: str | None = None
     camera_entrance: str | None = None
     camera_exit: str | None = None
+    # presigned image urls, see IMAGE_ACCESS_MODE
+    img_entrance_url: str | None = None
+    img_exit_url: str | None = None
+    img_plate_entrance_url: str | None = None
+    img_plate_exit_url: str | None = None
+    # list size thumbnails, see THUMBNAIL_LIST_SIZE
+    img_entrance_thumbnail_url: str | None = None
+    img_exit_thumbnail_url: str | None = None
+    img_plate_entrance_thumbnail_url: str | None = None
+    img_plate_exit_thumbnail_url: str | None = None
 
 
 class RecordForWS(RecordBase):
@@ -0,0 +1,115 @@
+from decimal import Decimal
+from typing import Any, Callable
+
+import orjson
+from pydantic import BaseModel
+from sqlalchemy import inspect
+
+from .event import TypeEvent
+
+# records are sharded by zone, events and bills by camera
+RECORDS_CHANNELS = "records:zone_*"
+EVENTS_CHANNELS = "events:camera_*"
+BILLS_CHANNELS = "bills:camera_*"
+
+# fields a camera filter is matched against, whatever the feed
+CAMERA_FIELDS = ("camera_id", "camera_entrance_id", "camera_exit_id")
+
+
+def records_channel(zone_id: int | None) -> str:
+    return f"records:zone_{zone_id}"
+
+
+def events_channel(camera_id: int | None) -> str:
+    return f"events:camera_{camera_id}"
+
+
+def bills_channel(camera_id: int | None) -> str:
+    return f"bills:camera_{camera_id}"
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"{type(value).__name__} is not serializable")
+
+
+class WireSchema:
+    """The columns of a model as a realtime message, with a fast encoder.
+
+    Column names are read once from the mapper and values straight from
+    the instance dict, so encoding never loads anything and every message
+    of a feed has the same keys, unset columns as null. orjson writes
+    datetimes and enums like `jsonable_encoder` did.
+    """
+
+    def __init__(self, model: type):
+        self.model = model
+        self._fields: tuple[str, ...] | None = None
+
+    @property
+    def fields(self) -> tuple[str, ...]:
+        if self._fields is None:
+            self._fields = tuple(
+                attr.key for attr in inspect(self.model).column_attrs
+            )
+        return self._fields
+
+    def to_dict(self, obj: Any, **extra: Any) -> dict:
+        values = obj.__dict__
+        data = {field: values.get(field) for field in self.fields}
+        data.update(extra)
+        return data
+
+    def dumps(self, obj: Any, **extra: Any) -> bytes:
+        return orjson.dumps(self.to_dict(obj, **extra), default=_default)
+
+
+class StreamFilter(BaseModel):
+    zone_ids: list[int] | None = None
+    camera_ids: list[int] | None = None
+    plate_prefix: str | None = None
+    type_events: list[TypeEvent] | None = None
+
+    @property
+    def is_empty(self) -> bool:
+        return not (
+            self.zone_ids
+            or self.camera_ids
+            or self.plate_prefix
+            or self.type_events
+        )
+
+    def match(self, message: Any) -> bool:
+        if not isinstance(message, dict):
+            return False
+        if self.zone_ids and message.get("zone_id") not in self.zone_ids:
+            return False
+        if self.camera_ids and not any(
+            message.get(field) in self.camera_ids for field in CAMERA_FIELDS
+        ):
+            return False
+        if self.plate_prefix and not (message.get("plate") or "").startswith(
+            self.plate_prefix
+        ):
+            return False
+        if self.type_events and message.get("type_event") not in {
+            type_event.value for type_event in self.type_events
+        }:
+            return False
+        return True
+
+    def subscription(
+        self, shard_field: str, channel: Callable[[int], str], pattern: str
+    ) -> tuple[list[str], Callable[[Any], bool] | None]:
+        """Channels to subscribe to and what is left to filter per message.
+
+        The filter on `shard_field` is served by subscribing to its shards
+        only, so it is not checked again on each message.
+        """
+        shards = getattr(self, shard_field)
+        channels = (
+            [channel(shard) for shard in shards] if shards else [pattern]
+        )
+        rest = self.model_copy(update={shard_field: None})
+        return channels, None if rest.is_empty else rest.match
@@ -0,0 +1,124 @@
+import time
+from collections import OrderedDict
+from typing import Iterable
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import ImageAccessMode, settings
+from app.models.image import Image
+from app.utils import storage
+
+# image columns of the record and bill views, each gets a `<name>_url`
+# and a `<name>_thumbnail_url`
+RECORD_IMAGE_FIELDS = (
+    "img_entrance_id",
+    "img_exit_id",
+    "img_plate_entrance_id",
+    "img_plate_exit_id",
+)
+BILL_IMAGE_FIELDS = ("img_entrance_id", "img_exit_id")
+
+
+def url_field(field: str) -> str:
+    return f"{field.removesuffix('_id')}_url"
+
+
+def thumbnail_field(field: str) -> str:
+    return f"{field.removesuffix('_id')}_thumbnail_url"
+
+
+def thumbnail_path(id: int) -> str:
+    """Path of the list size thumbnail of an image, see /images/thumbnail."""
+    prefix = f"/{settings.SUB_PATH}" if settings.SUB_PATH else ""
+    return (
+        f"{prefix}{settings.API_V1_STR}/images/thumbnail/{id}"
+        f"?size={settings.THUMBNAIL_LIST_SIZE}"
+        f"&format={settings.THUMBNAIL_FORMAT.value}"
+    )
+
+
+class ImageUrlCache:
+    """Presigned MinIO urls of images, reused until shortly before expiry.
+
+    A url is valid `expiry` seconds and handed out until `margin` seconds
+    are left, so clients always get at least that long to fetch it. The
+    paths of the images missing are read in one query, without their bytes,
+    and signing needs no request to MinIO.
+    """
+
+    def __init__(self, expiry: int, margin: int, max_size: int):
+        self.expiry = expiry
+        self.margin = margin
+        self.max_size = max_size
+        self._urls: "OrderedDict[int, tuple[str, float]]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.IMAGE_ACCESS_MODE == ImageAccessMode.PRESIGNED
+
+    async def get(self, db: AsyncSession, id: int) -> str | None:
+        return (await self.get_many(db, [id])).get(id)
+
+    async def get_many(
+        self, db: AsyncSession, ids: Iterable[int | None]
+    ) -> dict[int, str]:
+        now = time.monotonic()
+        urls, missing = {}, []
+        for id in set(ids) - {None}:
+            entry = self._urls.get(id)
+            if entry is not None and entry[1] > now:
+                self._urls.move_to_end(id)
+                urls[id] = entry[0]
+            else:
+                missing.append(id)
+        if not missing:
+            return urls
+        rows = await db.execute(
+            select(Image.id, Image.path_image).where(
+                Image.id.in_(missing), Image.path_image.is_not(None)
+            )
+        )
+        client = storage.get_minio()
+        reuse_until = now + self.expiry - self.margin
+        for id, path_image in rows:
+            bucket_name, file_name = path_image.split("/", 1)
+            urls[id] = client.presign(bucket_name, file_name, self.expiry)
+            self._urls[id] = (urls[id], reuse_until)
+            self._urls.move_to_end(id)
+        while len(self._urls) > self.max_size:
+            self._urls.popitem(last=False)
+        return urls
+
+    async def attach(
+        self, db: AsyncSession, objs: Iterable, fields: tuple[str, ...]
+    ) -> None:
+        """Set the thumbnail paths of `fields` of `objs`, and their urls."""
+        objs = [obj for obj in objs if obj is not None]
+        if settings.THUMBNAIL_LIST_SIZE:
+            for obj in objs:
+                for field in fields:
+                    id = getattr(obj, field)
+                    setattr(
+                        obj,
+                        thumbnail_field(field),
+                        thumbnail_path(id) if id is not None else None,
+                    )
+        if not self.enabled:
+            return
+        urls = await self.get_many(
+            db, (getattr(obj, field) for obj in objs for field in fields)
+        )
+        for obj in objs:
+            for field in fields:
+                setattr(obj, url_field(field), urls.get(getattr(obj, field)))
+
+    def forget(self, id: int) -> None:
+        self._urls.pop(id, None)
+
+
+image_urls = ImageUrlCache(
+    expiry=settings.IMAGE_URL_EXPIRY,
+    margin=settings.IMAGE_URL_MARGIN,
+    max_size=settings.IMAGE_URL_CACHE_SIZE,
+)
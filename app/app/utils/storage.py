@@ -1,10 +1,18 @@
 import asyncio
 import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import timedelta
+from functools import cached_property
 from io import BytesIO
-from typing import BinaryIO
+from typing import AsyncIterator, BinaryIO
+from urllib.parse import urlsplit
 from app.schemas.image import ImageSaveAs
 from app.core.config import settings
 from minio import Minio
+from minio.datatypes import Object
+from minio.deleteobjects import DeleteObject
 from minio.error import S3Error
 import urllib3
 
@@ -12,58 +20,132 @@ logger = logging.getLogger(__name__)
 
 
 class MinIOAsync:
+    """
+    MinIO client shared by a process, see `get_minio`.
+
+    Blocking calls run in threads, at most `MINIO_MAX_CONNECTIONS` at a
+    time, which is also the size of the connection pool so no connection
+    is opened only to be thrown away.
+    """
+
     def __init__(self):
         self.client = Minio(
             endpoint=settings.MINIO_URL,
             access_key=settings.MINIO_ACCESS_KEY,
             secret_key=settings.MINIO_SECRET_KEY,
-            http_client=urllib3.PoolManager(cert_reqs="CERT_NONE"),
+            http_client=urllib3.PoolManager(
+                maxsize=settings.MINIO_MAX_CONNECTIONS,
+                cert_reqs="CERT_NONE",
+                timeout=urllib3.Timeout(connect=5, read=60),
+                retries=urllib3.Retry(
+                    total=3,
+                    backoff_factor=0.2,
+                    status_forcelist=[500, 502, 503, 504],
+                ),
+            ),
             secure=settings.MINIO_SECURE,
+            region=settings.MINIO_REGION,
         )
         self.bucket_name = settings.MINIO_BUCKET_NAME
+        self._buckets: set[str] = set()
+        self._semaphore = asyncio.Semaphore(settings.MINIO_MAX_CONNECTIONS)
+
+    @cached_property
+    def public_client(self) -> Minio:
+        """
+        Client signing urls for the address clients reach minio at.
+        """
+        if not settings.MINIO_PUBLIC_URL:
+            return self.client
+        public_url = urlsplit(settings.MINIO_PUBLIC_URL)
+        return Minio(
+            endpoint=public_url.netloc,
+            access_key=settings.MINIO_ACCESS_KEY,
+            secret_key=settings.MINIO_SECRET_KEY,
+            secure=public_url.scheme == "https",
+            # signing only, never connects
+            region=settings.MINIO_REGION,
+        )
+
+    async def _run(self, func, *args, **kwargs):
+        """
+        Run a blocking call in a thread, bounded by the semaphore.
+        """
+        async with self._semaphore:
+            return await asyncio.to_thread(func, *args, **kwargs)
 
     async def check_buckt_exist(self, bucket_name: str):
         """
         Checks if the bucket exists and creates it if not.
         """
-        return await asyncio.to_thread(
-            self._sync_check_bucket_exist, bucket_name
-        )
+        if bucket_name in self._buckets:
+            return bucket_name
+        return await self._run(self._sync_check_bucket_exist, bucket_name)
 
     def _sync_check_bucket_exist(self, bucket_name: str):
+        if bucket_name in self._buckets:
+            return bucket_name
         bucket_exist = self.client.bucket_exists(bucket_name)
         if not bucket_exist:
-            self.client.make_bucket(bucket_name)
+            try:
+                self.client.make_bucket(bucket_name)
+            except S3Error as e:
+                # made by another process meanwhile
+                if e.code != "BucketAlreadyOwnedByYou":
+                    raise
+        self._buckets.add(bucket_name)
         return bucket_name
 
     async def upload_files(
-        self, content: BytesIO, name: str, size: int, metadata: dict
+        self,
+        content: BinaryIO,
+        name: str,
+        size: int | None,
+        metadata: dict,
+        content_type: str | None = None,
     ) -> str:
         """
         Upload a file to the MinIO bucket asynchronously.
         """
         try:
 
-            return await asyncio.to_thread(
-                self._sync_upload_file, content, name, size, metadata
+            return await self._run(
+                self.upload_file_sync,
+                content,
+                name,
+                size,
+                metadata,
+                content_type,
             )
 
         except S3Error as e:
             logger.error("MinIO error in upload file:", e)
             raise e
 
-    def _sync_upload_file(
-        self, content: BytesIO, name: str, size: int, metadata: dict
+    def upload_file_sync(
+        self,
+        content: BinaryIO,
+        name: str,
+        size: int | None,
+        metadata: dict | None,
+        content_type: str | None = None,
     ):
         """
-        Synchronous upload operation, offloaded for async usage.
+        Synchronous upload operation, offloaded for async usage and called
+        as is by the celery worker.
+
+        `content` is read a part at a time, files larger than a part (or of
+        unknown size) are sent as a multipart upload.
         """
+        self._sync_check_bucket_exist(self.bucket_name)
         self.client.put_object(
             bucket_name=self.bucket_name,
             data=content,
             object_name=name,
-            length=size,
+            length=size if size is not None else -1,
+            content_type=content_type or "application/octet-stream",
             metadata=metadata,
+            part_size=settings.MINIO_PART_SIZE,
         )
         return f"{self.bucket_name}/{name}"
 
@@ -71,43 +153,128 @@ class MinIOAsync:
         self, bucket_name: str, file_name: str
     ) -> BinaryIO:
         try:
-            return await asyncio.to_thread(
-                self._sync_download_file, bucket_name, file_name
+            return await self._run(
+                self.download_file_sync, bucket_name, file_name
             )
         except S3Error as e:
             logger.error("MinIO error in download file:", e)
             raise e
 
-    def _sync_download_file(self, bucket_name: str, file_name: str):
+    def download_file_sync(self, bucket_name: str, file_name: str):
         """
-        Synchronous download operation, offloaded for async usage.
+        Synchronous download operation, offloaded for async usage and called
+        as is by the celery worker.
         """
         response = self.client.get_object(bucket_name, file_name)
         file = BytesIO()
-        for data in response.stream(1024):
+        for data in response.stream(settings.MINIO_CHUNK_SIZE):
             file.write(data)
         response.close()
         response.release_conn()
         file.seek(0)
         return file
 
+    async def remove_files(self, paths: list[str]) -> int:
+        return await self._run(self.remove_files_sync, paths)
+
+    def remove_files_sync(self, paths: list[str]) -> int:
+        """
+        Remove `bucket/name` files, one batch request per bucket, missing
+        files are ignored. Returns how many could not be removed.
+        """
+        by_bucket = defaultdict(list)
+        for path in paths:
+            bucket_name, file_name = path.split("/", 1)
+            by_bucket[bucket_name].append(DeleteObject(file_name))
+        failed = 0
+        for bucket_name, objects in by_bucket.items():
+            # the requests are sent while the errors are iterated
+            for error in self.client.remove_objects(bucket_name, objects):
+                failed += 1
+                logger.error(f"MinIO error in remove file: {error}")
+        return failed
+
+    async def stat_file(self, bucket_name: str, file_name: str) -> Object:
+        """
+        Size, content type and etag of a file, without reading it.
+        """
+        return await self._run(self.client.stat_object, bucket_name, file_name)
+
+    async def open_file(
+        self,
+        bucket_name: str,
+        file_name: str,
+        offset: int = 0,
+        length: int = 0,
+    ) -> urllib3.BaseHTTPResponse:
+        """
+        Start reading `length` bytes of a file from `offset`, all of it by
+        default, pass the response to `iter_file`.
+        """
+        return await self._run(
+            self.client.get_object, bucket_name, file_name, offset, length
+        )
+
+    async def iter_file(
+        self,
+        response: urllib3.BaseHTTPResponse,
+        chunk_size: int = settings.MINIO_CHUNK_SIZE,
+    ) -> AsyncIterator[bytes]:
+        """
+        Yield the chunks of an opened file as they arrive, each blocking read
+        offloaded, and release the connection however the iteration ends.
+        """
+        chunks = response.stream(chunk_size)
+        try:
+            # the semaphore is taken per chunk, a slow reader holds no slot
+            while (chunk := await self._run(next, chunks, None)) is not None:
+                yield chunk
+        finally:
+            response.close()
+            response.release_conn()
+
     async def generate_presigned_url(
-        self, file_name: str, expiry: int = 3600
+        self, file_name: str, expiry: int = 3600, bucket_name: str = None
     ) -> str:
         """
         Generate a presigned URL for downloading a file asynchronously.
         """
         return await asyncio.to_thread(
-            self.client.presigned_get_object,
-            self.bucket_name,
-            file_name,
-            expiry,
+            self.presign, bucket_name or self.bucket_name, file_name, expiry
         )
 
+    def presign(self, bucket_name: str, file_name: str, expiry: int) -> str:
+        """
+        Presigned URL to download a file for `expiry` seconds, signed
+        locally since the region is known.
+        """
+        return self.public_client.presigned_get_object(
+            bucket_name, file_name, expires=timedelta(seconds=expiry)
+        )
+
+
+_minio: MinIOAsync | None = None
+_minio_pid: int | None = None
+_minio_lock = threading.Lock()
+
+
+def get_minio() -> MinIOAsync:
+    """
+    The MinIO client of this process, celery workers fork after import so
+    each gets its own connection pool.
+    """
+    global _minio, _minio_pid
+    if _minio_pid != os.getpid():
+        with _minio_lock:
+            if _minio_pid != os.getpid():
+                _minio = MinIOAsync()
+                _minio_pid = os.getpid()
+    return _minio
+
 
 async def get_client(name: ImageSaveAs):
     """
     Returns an asynchronous MinIO client based on ImageSaveAs input.
     """
-    if name.minio:
-        return MinIOAsync()
+    if name == ImageSaveAs.minio:
+        return get_minio()
@@ -0,0 +1,34 @@
+import argparse
+import logging
+from datetime import datetime
+
+from app.db.session import SessionLocal
+from app.report.services.rollup import backfill_rollups
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def backfill(start_time: datetime | None, end_time: datetime | None) -> None:
+    db = SessionLocal()
+    try:
+        hours = backfill_rollups(db, start_time=start_time, end_time=end_time)
+    finally:
+        db.close()
+    logger.info(f"{hours} hours rebuilt")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Rebuild the hourly report rollups, everything by default"
+    )
+    parser.add_argument("--start", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--end", type=datetime.fromisoformat, default=None)
+    args = parser.parse_args()
+    logger.info("Backfilling report rollups")
+    backfill(args.start, args.end)
+    logger.info("Report rollups backfilled")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""broadcast.py"""
+
+import asyncio
+import logging
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Optional,
+    Set,
+)
+
+import msgpack
+import rapidjson
+from fastapi import WebSocket, status
+
+from app.core.config import settings
+from cache.redis import redis_connect_async
+
+logger = logging.getLogger(__name__)
+
+# websocket subprotocol a client offers to get binary MessagePack frames
+MSGPACK_SUBPROTOCOL = "msgpack"
+
+
+def is_pattern(channel: str) -> bool:
+    return "*" in channel
+
+
+class Subscriber:
+    """One local client of channels or patterns, fed through a bounded queue.
+
+    `match` gets each message decoded and drops the ones it rejects before
+    they are queued. A message published to several of its channels in a
+    row (a bill to its entrance and exit cameras) is queued once, the same
+    payload published again to a channel it already came from is not a
+    copy and is queued again. A client
+    that falls behind loses its oldest queued messages, and once
+    `max_dropped` are dropped in a row it is marked slow and its stream
+    ends, so it reconnects instead of lagging forever. A `binary` one is
+    queued messages packed with MessagePack instead of the JSON text.
+    """
+
+    def __init__(
+        self,
+        channels: tuple[str, ...],
+        queue_size: int,
+        max_dropped: int,
+        match: Optional[Callable[[Any], bool]] = None,
+        binary: bool = False,
+    ):
+        self.channels = channels
+        self.match = match
+        self.binary = binary
+        self.dedupe = len(channels) > 1 or any(map(is_pattern, channels))
+        # last payload queued and the channels it came from since
+        self.last: Optional[str | bytes] = None
+        self.last_channels: Set[str] = set()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(queue_size, 1))
+        self.max_dropped = max_dropped
+        self.dropped = 0
+        self.slow = asyncio.Event()
+
+    def put(self, message: str | bytes, channel: str = "") -> bool:
+        """Queue `message`, False when it cost an older one or was refused.
+
+        `channel` is the one it was published to, not the pattern.
+        """
+        if self.slow.is_set():
+            return False
+        if self.dedupe:
+            if message == self.last and channel not in self.last_channels:
+                self.last_channels.add(channel)
+                return True
+            self.last = message
+            self.last_channels = {channel}
+        if not self.queue.full():
+            self.queue.put_nowait(message)
+            return True
+        self.queue.get_nowait()
+        self.dropped += 1
+        if self.max_dropped and self.dropped >= self.max_dropped:
+            self.slow.set()
+        else:
+            self.queue.put_nowait(message)
+        return False
+
+    async def get(self) -> str | bytes:
+        message = await self.queue.get()
+        self.dropped = 0
+        return message
+
+
+class Broadcast:
+    """Per-process fan-out of redis channels to local websocket clients.
+
+    One redis connection holds a single subscription per channel (or
+    pattern, when it has a "*") that has local subscribers, whatever their
+    number, and a reader task copies each message to the subscribers'
+    queues without waiting on any of them. A message is decoded at most
+    once, and only when a subscriber of its channel filters or takes
+    MessagePack, then packed at most once for all of the latter.
+    """
+
+    def __init__(self, queue_size: int, max_dropped: int):
+        self.queue_size = queue_size
+        self.max_dropped = max_dropped
+        self._subscribers: Dict[str, Set[Subscriber]] = defaultdict(set)
+        self._stats: Dict[str, Counter] = defaultdict(Counter)
+        self._changed = asyncio.Event()
+        self._reader: Optional[asyncio.Task] = None
+
+    @asynccontextmanager
+    async def subscribe(
+        self,
+        channels: str | Iterable[str],
+        match: Optional[Callable[[Any], bool]] = None,
+        binary: bool = False,
+    ) -> AsyncIterator[Subscriber]:
+        if isinstance(channels, str):
+            channels = (channels,)
+        subscriber = Subscriber(
+            tuple(dict.fromkeys(channels)),
+            self.queue_size,
+            self.max_dropped,
+            match=match,
+            binary=binary,
+        )
+        for channel in subscriber.channels:
+            self._subscribers[channel].add(subscriber)
+            self._stats[channel]["subscribed"] += 1
+        self._changed.set()
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read())
+        try:
+            yield subscriber
+        finally:
+            for channel in subscriber.channels:
+                subscribers = self._subscribers[channel]
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[channel]
+                if subscriber.slow.is_set():
+                    self._stats[channel]["slow_disconnects"] += 1
+            self._changed.set()
+
+    @staticmethod
+    async def accept(websocket: WebSocket) -> bool:
+        """Accept `websocket`, True when it negotiated MessagePack frames."""
+        binary = MSGPACK_SUBPROTOCOL in websocket.scope.get("subprotocols", ())
+        await websocket.accept(
+            subprotocol=MSGPACK_SUBPROTOCOL if binary else None
+        )
+        return binary
+
+    async def stream(
+        self,
+        websocket: WebSocket,
+        channels: str | Iterable[str],
+        send: Optional[Callable[[str], Awaitable]] = None,
+        match: Optional[Callable[[Any], bool]] = None,
+        binary: bool = False,
+    ) -> None:
+        """Forward `channels` to an accepted websocket until a side ends.
+
+        `binary` sends MessagePack frames, see `accept`, `send` is only
+        used for text.
+        """
+        async with self.subscribe(
+            channels, match=match, binary=binary
+        ) as subscriber:
+            if binary:
+                send = websocket.send_bytes
+            forward = asyncio.create_task(
+                self._forward(subscriber, send or websocket.send_text)
+            )
+            receive = asyncio.create_task(self._wait_disconnect(websocket))
+            slow = asyncio.create_task(subscriber.slow.wait())
+            tasks = {forward, receive, slow}
+            try:
+                done, _ = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                for task in tasks:
+                    task.cancel()
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    logger.debug(
+                        f"websocket on {subscriber.channels} ended "
+                        f"{task.exception()}"
+                    )
+            if subscriber.slow.is_set():
+                try:
+                    await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+                except RuntimeError:
+                    pass
+
+    def stats(self) -> dict:
+        channels = {}
+        for channel, counter in self._stats.items():
+            subscribers = self._subscribers.get(channel, ())
+            channels[channel] = {
+                **counter,
+                "subscribers": len(subscribers),
+                "queued": sum(
+                    subscriber.queue.qsize() for subscriber in subscribers
+                ),
+            }
+        return {
+            "reader": self._reader is not None and not self._reader.done(),
+            "subscribers": len(
+                {
+                    subscriber
+                    for subscribers in self._subscribers.values()
+                    for subscriber in subscribers
+                }
+            ),
+            "channels": channels,
+        }
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+            self._reader = None
+
+    def _dispatch(
+        self, channel: str, message: str, source: Optional[str] = None
+    ) -> None:
+        """Copy `message` to the subscribers of `channel`.
+
+        `channel` is what they subscribed to, a channel or a pattern, and
+        `source` the channel a pattern matched.
+        """
+        stats = self._stats[channel]
+        stats["messages"] += 1
+        decoded = packed = None
+        for subscriber in list(self._subscribers.get(channel, ())):
+            if subscriber.match is not None or subscriber.binary:
+                if decoded is None:
+                    try:
+                        decoded = rapidjson.loads(message)
+                    except (rapidjson.JSONDecodeError, TypeError):
+                        decoded = message
+            if subscriber.match is not None and not subscriber.match(decoded):
+                stats["filtered"] += 1
+                continue
+            if subscriber.binary and packed is None:
+                packed = msgpack.packb(decoded)
+            if not subscriber.put(
+                packed if subscriber.binary else message, source or channel
+            ):
+                stats["dropped"] += 1
+
+    async def _read(self):
+        """Keep the redis subscriptions in line with the local subscribers."""
+        while True:
+            connection = None
+            try:
+                connection = await redis_connect_async()
+                async with connection.pubsub(
+                    ignore_subscribe_messages=True
+                ) as pubsub:
+                    subscribed: Set[str] = set()
+                    self._changed.set()
+                    while True:
+                        if self._changed.is_set():
+                            self._changed.clear()
+                            wanted = set(self._subscribers)
+                            await self._update(pubsub, subscribed, wanted)
+                            subscribed = wanted
+                        if not subscribed:
+                            await self._changed.wait()
+                            continue
+                        # short timeout, subscription changes wait for it
+                        message = await pubsub.get_message(timeout=1.0)
+                        if message is None:
+                            continue
+                        if message["type"] == "message":
+                            self._dispatch(message["channel"], message["data"])
+                        elif message["type"] == "pmessage":
+                            self._dispatch(
+                                message["pattern"],
+                                message["data"],
+                                message["channel"],
+                            )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:  # pragma: no cover
+                logger.error(f"broadcast reader failed {e}")
+            finally:
+                if connection is not None:
+                    await connection.aclose()
+            await asyncio.sleep(1)
+
+    @staticmethod
+    async def _update(pubsub, subscribed: Set[str], wanted: Set[str]) -> None:
+        added, removed = wanted - subscribed, subscribed - wanted
+        if channels := [c for c in added if not is_pattern(c)]:
+            await pubsub.subscribe(*channels)
+        if patterns := [c for c in added if is_pattern(c)]:
+            await pubsub.psubscribe(*patterns)
+        if channels := [c for c in removed if not is_pattern(c)]:
+            await pubsub.unsubscribe(*channels)
+        if patterns := [c for c in removed if is_pattern(c)]:
+            await pubsub.punsubscribe(*patterns)
+
+    @staticmethod
+    async def _forward(
+        subscriber: Subscriber, send: Callable[[str | bytes], Awaitable]
+    ) -> None:
+        while True:
+            await send(await subscriber.get())
+
+    @staticmethod
+    async def _wait_disconnect(websocket: WebSocket) -> None:
+        """Drain what the client sends, return once it disconnects."""
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+
+broadcast = Broadcast(
+    queue_size=settings.WS_QUEUE_SIZE, max_dropped=settings.WS_MAX_DROPPED
+)
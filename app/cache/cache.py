@@ -4,48 +4,86 @@ import asyncio
 import os
 from datetime import timedelta
 from functools import partial, update_wrapper, wraps
-from http import HTTPStatus
-from typing import Union
+from inspect import Parameter, Signature, signature
+from typing import Any, Callable, Union
 
-from fastapi import Response
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from redis.exceptions import RedisError
 
 from cache.client import Cache
+from cache.key_gen import (
+    CacheKeyBuilder,
+    get_invalidation_channel,
+    get_namespace_key,
+)
 from cache.util import (
     ONE_DAY_IN_SECONDS,
     ONE_HOUR_IN_SECONDS,
     ONE_MONTH_IN_SECONDS,
     ONE_WEEK_IN_SECONDS,
     ONE_YEAR_IN_SECONDS,
-    deserialize_json,
     serialize_json,
 )
 
+# keyword FastAPI fills with the request when the endpoint has no Request
+CACHE_REQUEST_PARAM = "cache_request_"
+
 
 def cache(
     *,
-    namespace: str | None = None,
-    expire: int | timedelta = ONE_YEAR_IN_SECONDS
+    namespace: str | Callable[[dict], str] | None = None,
+    expire: int | timedelta | Callable[[dict], int] = ONE_YEAR_IN_SECONDS,
+    stale: int = 30,
+    lock_timeout: int = 10,
 ):
     """Enable caching behavior for the decorated function.
 
+    Responses are stored serialized, validated against the function's return
+    annotation like FastAPI's `response_model`, and every hit or miss returns
+    those bytes as is with a content-hash `ETag`, so conditional requests get a
+    304 without any JSON decoding or encoding.
+
+    Concurrent misses of one key are computed once: callers in the same
+    process await the same computation and across processes a Redis lock
+    lets one of them recompute while the others serve the stale value, or
+    wait for the fresh one when there is none.
+
     Args:
         expire (Union[int, timedelta], optional): The number of seconds
             from now when the cached response should expire. Defaults to 31,536,000
-            seconds (i.e., the number of seconds in one year).
-        namespace (str|None, optional): cache namespace for expiration usage
+            seconds (i.e., the number of seconds in one year). A callable
+            gets the call's keyword arguments and returns the seconds.
+        namespace (str|None, optional): cache namespace for expiration usage,
+            or a callable of the call's keyword arguments returning it, to
+            invalidate a subset of the responses of one endpoint.
+        stale (int, optional): Seconds an expired response is kept to be served
+            while another process recomputes it. Defaults to 30.
+        lock_timeout (int, optional): Max seconds a process holds the recompute
+            lock, and other processes wait for it. Defaults to 10.
     """
 
     def outer_wrapper(func):
+        sig = signature(func)
+        request_param = next(
+            (
+                param.name
+                for param in sig.parameters.values()
+                if param.annotation is Request
+            ),
+            None,
+        )
+        response_adapter = get_response_adapter(sig.return_annotation)
+        key_builder = CacheKeyBuilder(func)
+
         @wraps(func)
         async def inner_wrapper(*args, **kwargs):
             """Return cached value if one exists, otherwise evaluate the wrapped function and cache the result."""
 
-            func_kwargs = kwargs.copy()
-            request = func_kwargs.pop("request", None)
-            response = func_kwargs.pop("response", None)
-            create_response_directly = not response
-            if create_response_directly:
-                response = Response()
+            if request_param is None:
+                request = kwargs.pop(CACHE_REQUEST_PARAM, None)
+            else:
+                request = kwargs.get(request_param)
             redis_cache = Cache()
             if (
                 redis_cache.not_connected
@@ -53,64 +91,119 @@ def cache(
             ):
                 # if the redis client is not connected or request is not cacheable, no caching behavior is performed.
                 return await get_api_response_async(func, *args, **kwargs)
-            key = redis_cache.get_cache_key(func, namespace, *args, **kwargs)
+            ns = namespace(kwargs) if callable(namespace) else namespace
+            ttl_seconds = calculate_ttl(
+                expire(kwargs) if callable(expire) else expire
+            )
+            key = await redis_cache.get_cache_key(
+                key_builder, ns, *args, **kwargs
+            )
+            found, body = redis_cache.local.get(ns, key)
+            if found:
+                return redis_cache.build_response(request, body, True)
             ttl, in_cache = await redis_cache.check_cache(key)
-            if in_cache:
-                return deserialize_json(in_cache)
-                redis_cache.set_response_headers(
-                    response, True, deserialize_json(in_cache), ttl
+            if in_cache and ttl > stale:
+                redis_cache.local.record(ns, "redis_hits")
+                redis_cache.local.set(
+                    ns, key, in_cache, len(in_cache), ttl - stale
                 )
-                if redis_cache.requested_resource_not_modified(
-                    request, in_cache
-                ):
-                    response.status_code = int(HTTPStatus.NOT_MODIFIED)
-                    return (
-                        Response(
-                            content=None,
-                            status_code=response.status_code,
-                            media_type="application/json",
-                            headers=response.headers,
-                        )
-                        if create_response_directly
-                        else response
-                    )
-                return (
-                    Response(
-                        content=in_cache,
-                        media_type="application/json",
-                        headers=response.headers,
-                    )
-                    if create_response_directly
-                    else deserialize_json(in_cache)
+                return redis_cache.build_response(request, in_cache, True)
+
+            # miss or stale entry, recompute once across callers
+            async def evaluate():
+                redis_cache.local.record(ns, "misses")
+                response_data = await get_api_response_async(
+                    func, *args, **kwargs
                 )
-            response_data = await get_api_response_async(func, *args, **kwargs)
-            ttl = calculate_ttl(expire)
+                body = serialize_response(response_adapter, response_data)
+                if body is None:
+                    # left to FastAPI, which reports what is wrong with it
+                    return (False, response_data)
+                await redis_cache.add_to_cache(key, body, ttl_seconds + stale)
+                return (False, body)
 
-            cached = await redis_cache.add_to_cache(key, response_data, ttl)
-            return response_data
-            if cached:
-                redis_cache.set_response_headers(
-                    response,
-                    cache_hit=False,
-                    response_data=response_data,
-                    ttl=ttl,
+            async def revalidate():
+                lock = redis_cache.redis.lock(
+                    f"{key}|lock", timeout=lock_timeout, blocking=False
                 )
-                return (
-                    Response(
-                        content=serialize_json(response_data),
-                        media_type="application/json",
-                        headers=response.headers,
-                    )
-                    if create_response_directly
-                    else response_data
+                if await lock.acquire():
+                    try:
+                        return await evaluate()
+                    finally:
+                        try:
+                            await lock.release()
+                        except RedisError:
+                            # expires by its timeout anyway
+                            pass
+                if in_cache:
+                    redis_cache.local.record(ns, "stale_hits")
+                    return (True, in_cache)
+                redis_cache.local.record(ns, "lock_waits")
+                fresh = await redis_cache.wait_for_cache(
+                    key, stale, timeout=lock_timeout
                 )
-            return response_data
+                if fresh is not None:
+                    return (True, fresh)
+                return await evaluate()
+
+            shared, (cache_hit, body) = await single_flight(key, revalidate)
+            if shared:
+                redis_cache.local.record(ns, "coalesced")
+            if not isinstance(body, (bytes, str)):
+                return body
+            return redis_cache.build_response(request, body, cache_hit)
 
+        if request_param is None:
+            # let FastAPI pass the request for the conditional headers
+            params = list(sig.parameters.values())
+            position = len(params)
+            if params and params[-1].kind == Parameter.VAR_KEYWORD:
+                position -= 1
+            params.insert(
+                position,
+                Parameter(
+                    CACHE_REQUEST_PARAM,
+                    Parameter.KEYWORD_ONLY,
+                    annotation=Request,
+                ),
+            )
+            inner_wrapper.__signature__ = sig.replace(parameters=params)
         return inner_wrapper
 
     return outer_wrapper
 
 
+def get_response_adapter(annotation) -> TypeAdapter | None:
+    """TypeAdapter of the return annotation, None when it is not a model type."""
+    if annotation in (Signature.empty, Any, None) or (
+        isinstance(annotation, type) and issubclass(annotation, Response)
+    ):
+        return None
+    try:
+        return TypeAdapter(annotation)
+    except Exception:  # pragma: no cover
+        return None
+
+
+def serialize_response(
+    response_adapter: TypeAdapter | None, response_data
+) -> bytes | None:
+    """Serialize like FastAPI does for a `response_model`."""
+    if isinstance(response_data, Response):
+        return None
+    try:
+        if response_adapter is None:
+            return serialize_json(response_data).encode()
+        return response_adapter.dump_json(
+            response_adapter.validate_python(
+                response_data, from_attributes=True
+            ),
+            by_alias=True,
+        )
+    except (TypeError, ValueError):
+        return None
+
+
 def invalidate(*, namespace: str | None = None):
     """Enable cache invalidating behavior for the decorated function.
 
@@ -121,19 +214,73 @@ def invalidate(*, namespace: str | None = None):
     def outer_wrapper(func):
         @wraps(func)
         async def inner_wrapper(*args, **kwargs):
-            """delete cached namespace."""
+            """bump the namespace version once the write is done."""
+            response_data = await get_api_response_async(func, *args, **kwargs)
             redis_cache = Cache()
             if redis_cache.connected:
                 # if the redis client is not connected no caching behavior is performed.
-                pattern = redis_cache.get_cache_key_pattern(namespace)
-                await redis_cache.invalidate(pattern)
-            return await get_api_response_async(func, *args, **kwargs)
+                await redis_cache.invalidate(namespace)
+            return response_data
 
         return inner_wrapper
 
     return outer_wrapper
 
 
+def invalidate_sync(redis_client, prefix: str, namespaces) -> None:
+    """Invalidate namespaces from sync code such as the celery worker.
+
+    Same as `Cache.invalidate`, with a sync redis client and the cache
+    prefix the api was initialized with.
+    """
+    namespaces = list(dict.fromkeys(namespaces))
+    if not namespaces:
+        return
+    with redis_client.pipeline() as pipe:
+        for namespace in namespaces:
+            pipe.incr(get_namespace_key(prefix, namespace))
+        versions = pipe.execute()
+        for namespace, version in zip(namespaces, versions):
+            pipe.publish(
+                get_invalidation_channel(prefix), f"{namespace}|{version}"
+            )
+        pipe.execute()
+
+
+_in_flight: dict[str, asyncio.Future] = {}
+
+
+async def single_flight(key: str, compute) -> tuple[bool, object]:
+    """Run `compute` once for concurrent callers of `key` in this process.
+
+    Returns whether the result was shared from another caller, and the result.
+    """
+    while (future := _in_flight.get(key)) is not None:
+        try:
+            return (True, await asyncio.shield(future))
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                raise
+            # the caller computing it went away, take over
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[key] = future
+    try:
+        result = await compute()
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # waiters get the exception too, don't log it as never retrieved
+        future.exception()
+        raise
+    else:
+        future.set_result(result)
+        return (False, result)
+    finally:
+        del _in_flight[key]
+
+
 async def get_api_response_async(func, *args, **kwargs):
     """Helper function that allows decorator to work with both async and non-async functions."""
     return (
@@ -1,19 +1,27 @@
+import asyncio
+import hashlib
 import logging
-from datetime import datetime, timedelta, UTC
+from datetime import datetime, UTC
+from http import HTTPStatus
 from typing import Callable, Dict, List, Optional, Tuple, Type, Union
 
 from fastapi import Request, Response
 from redis.asyncio import client
 
 from cache.enums import RedisEvent, RedisStatus
-from cache.key_gen import get_cache_key, get_cache_key_pattern
+from cache.key_gen import (
+    CacheKeyBuilder,
+    get_cache_key_pattern,
+    get_invalidation_channel,
+    get_namespace_key,
+)
+from cache.local import LocalCache
 from cache.redis import redis_connect
 from cache.util import serialize_json
 
 DEFAULT_RESPONSE_HEADER = "X-FastAPI-Cache"
 ALLOWED_HTTP_TYPES = ["GET"]
 LOG_TIMESTAMP = "%m/%d/%Y %I:%M:%S %p"
-HTTP_TIME = "%a, %d %b %Y %H:%M:%S GMT"
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
@@ -39,6 +47,7 @@ class Cache(metaclass=MetaSingleton):
     response_header: str = None
     status: RedisStatus = RedisStatus.NONE
     redis: client.Redis = None
+    local: LocalCache = LocalCache(max_bytes=0, ttl=0)
 
     @property
     def connected(self):
@@ -54,6 +63,8 @@ class Cache(metaclass=MetaSingleton):
         prefix: Optional[str] = None,
         response_header: Optional[str] = None,
         ignore_arg_types: Optional[List[Type[object]]] = None,
+        local_max_bytes: int = 0,
+        local_ttl: int = 5,
     ) -> None:
         """Connect to a Redis database using `host_url` and configure cache settings.
 
@@ -68,12 +79,50 @@ class Cache(metaclass=MetaSingleton):
                 are any arguments that have no effect on the response (such as a
                 `Request` or `Response` object), including their type in this list
                 will ignore those arguments when the key is created. Defaults to None.
+            local_max_bytes (int, optional): Byte budget of the in-process LRU kept
+                in front of Redis, 0 disables it. Defaults to 0.
+            local_ttl (int, optional): Max seconds an entry is served from the
+                in-process LRU. Defaults to 5.
         """
         self.host_url = host_url
         self.prefix = prefix
         self.response_header = response_header or DEFAULT_RESPONSE_HEADER
         self.ignore_arg_types = ignore_arg_types
+        self.local = LocalCache(max_bytes=local_max_bytes, ttl=local_ttl)
         await self._connect()
+        if self.connected and local_max_bytes > 0:
+            self._listener = asyncio.create_task(self._listen_invalidations())
+
+    @property
+    def invalidation_channel(self) -> str:
+        return get_invalidation_channel(self.prefix)
+
+    async def _listen_invalidations(self):
+        """Apply namespace invalidations of every process to the local LRU."""
+        while True:
+            try:
+                async with self.redis.pubsub(
+                    ignore_subscribe_messages=True
+                ) as pubsub:
+                    await pubsub.subscribe(self.invalidation_channel)
+                    self.local.subscribed = True
+                    async for message in pubsub.listen():
+                        data = message["data"]
+                        if isinstance(data, bytes):
+                            data = data.decode()
+                        namespace, _, version = data.rpartition("|")
+                        self.local.set_version(namespace, int(version))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:  # pragma: no cover
+                self.log(
+                    RedisEvent.CONNECT_FAIL, msg=f"invalidation listener: {e}"
+                )
+            finally:
+                # versions may be missed until subscribed again
+                self.local.subscribed = False
+                self.local.clear()
+            await asyncio.sleep(1)
 
     async def _connect(self):
         self.log(
@@ -106,19 +155,46 @@ class Cache(metaclass=MetaSingleton):
             )
         )
 
-    def get_cache_key(
-        self, func: Callable, namespace: str, *args: List, **kwargs: Dict
+    def get_namespace_key(self, namespace: str) -> str:
+        return get_namespace_key(self.prefix, namespace)
+
+    async def get_namespace_version(self, namespace: str) -> int:
+        version = self.local.get_version(namespace)
+        if version is None:
+            version = int(
+                await self.redis.get(self.get_namespace_key(namespace)) or 0
+            )
+            self.local.set_version(namespace, version)
+        return version
+
+    async def get_cache_key(
+        self,
+        func: Union[Callable, CacheKeyBuilder],
+        namespace: str,
+        *args: List,
+        **kwargs: Dict,
     ) -> str:
-        return get_cache_key(
-            f"{self.prefix}|{namespace}",
+        version = await self.get_namespace_version(namespace)
+        if not isinstance(func, CacheKeyBuilder):
+            func = CacheKeyBuilder(func)
+        return func.build(
+            f"{self.prefix}|{namespace}|v{version}",
             self.ignore_arg_types,
-            func,
             *args,
             **kwargs,
         )
 
-    def get_cache_key_pattern(self, namespace: str) -> str:
-        return get_cache_key_pattern(f"{self.prefix}|{namespace}")
+    def get_cache_key_pattern(self, namespace: str | None = None) -> str:
+        """Pattern matching the keys of every version of `namespace` (or all)."""
+        return get_cache_key_pattern(f"{self.prefix}|{namespace or '*'}|v*")
+
+    def parse_cache_key(self, key: str) -> Tuple[str | None, int | None]:
+        """Return the namespace and version a cache key was built with."""
+        namespace, _, rest = key[len(f"{self.prefix}|") :].partition("|v")
+        version = rest.split(":", 1)[0]
+        if not version.isdigit():
+            return (None, None)
+        return (namespace, int(version))
 
     async def check_cache(self, key: str) -> Tuple[int, str]:
         async with self.redis.pipeline() as pipe:
@@ -127,13 +203,27 @@ class Cache(metaclass=MetaSingleton):
                 self.log(RedisEvent.KEY_FOUND_IN_CACHE, key=key)
             return (ttl, in_cache)
 
+    async def wait_for_cache(
+        self, key: str, stale: int, timeout: int, interval: float = 0.05
+    ) -> Optional[str]:
+        """Poll `key` until another process stores a fresh value or `timeout`."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline:
+            await asyncio.sleep(interval)
+            ttl, in_cache = await self.check_cache(key)
+            if in_cache and ttl > stale:
+                return in_cache
+        return None
+
     def requested_resource_not_modified(
         self, request: Request, cached_data: str
     ) -> bool:
         if not request or "If-None-Match" not in request.headers:
             return False
+        # weak comparison, W/"x" matches "x"
         check_etags = [
-            etag.strip()
+            etag.strip().removeprefix("W/")
             for etag in request.headers["If-None-Match"].split(",")
             if etag
         ]
@@ -144,8 +234,8 @@ class Cache(metaclass=MetaSingleton):
     async def add_to_cache(self, key: str, value: Dict, expire: int) -> bool:
         response_data = None
         try:
-            if response_data == List:
-                response_data = value.body
+            if isinstance(value, (bytes, str)):
+                response_data = value
             else:
                 response_data = serialize_json(value)
 
@@ -160,26 +250,90 @@ class Cache(metaclass=MetaSingleton):
             self.log(RedisEvent.FAILED_TO_CACHE_KEY, key=key, value=value)
         return cached
 
-    async def invalidate(self, pattern: str) -> bool:
-        keys_to_delete = await self.redis.keys(pattern=pattern)
-        if keys_to_delete:
-            await self.redis.delete(*keys_to_delete)
-        self.log(RedisEvent.PATTERN_INVALIDATED, pattern=pattern)
+    async def invalidate(self, namespace: str) -> int:
+        """Move `namespace` to a new version, old entries expire by their TTL."""
+        version = await self.redis.incr(self.get_namespace_key(namespace))
+        self.local.set_version(namespace, version)
+        await self.redis.publish(
+            self.invalidation_channel, f"{namespace}|{version}"
+        )
+        self.log(
+            RedisEvent.NAMESPACE_INVALIDATED,
+            msg=f"namespace={namespace}, version={version}",
+        )
+        return version
+
+    async def sweep(self, count: int = 500) -> int:
+        """Delete the entries of old namespace versions before their TTL.
+
+        Uses `SCAN` so Redis is never blocked, returns the number of keys deleted.
+        """
+        versions = {}
+        stale = []
+        deleted = 0
+        async for key in self.redis.scan_iter(
+            match=self.get_cache_key_pattern(), count=count
+        ):
+            if isinstance(key, bytes):
+                key = key.decode()
+            namespace, version = self.parse_cache_key(key)
+            if namespace is None:
+                continue
+            if namespace not in versions:
+                versions[namespace] = await self.get_namespace_version(
+                    namespace
+                )
+            if version != versions[namespace]:
+                stale.append(key)
+            if len(stale) >= count:
+                deleted += await self.redis.unlink(*stale)
+                stale = []
+        if stale:
+            deleted += await self.redis.unlink(*stale)
+        self.log(RedisEvent.STALE_KEYS_SWEPT, msg=f"deleted={deleted}")
+        return deleted
+
+    async def run_sweeper(self, period: int) -> None:
+        """Sweep every `period` seconds, one process at a time."""
+        lock_name = f"{self.prefix}|sweeper_lock"
+        while True:
+            await asyncio.sleep(period)
+            if self.not_connected:
+                continue
+            try:
+                if await self.redis.set(lock_name, 1, nx=True, ex=period):
+                    await self.sweep()
+            except Exception as e:  # pragma: no cover
+                self.log(RedisEvent.STALE_KEYS_SWEPT, msg=f"failed: {e}")
 
     def set_response_headers(
         self,
         response: Response,
         cache_hit: bool,
-        response_data: Dict = None,
-        ttl: int = None,
+        response_data: Union[str, bytes, Dict] = None,
     ) -> None:
         response.headers[self.response_header] = "Hit" if cache_hit else "Miss"
-        expires_at = datetime.now(UTC).replace(tzinfo=None) + timedelta(seconds=ttl)
-        response.headers["Expires"] = expires_at.strftime(HTTP_TIME)
-        response.headers["Cache-Control"] = f"max-age={ttl}"
+        # clients may keep the body but must revalidate it with the ETag,
+        # a namespace invalidation has to reach them on the next request
+        response.headers["Cache-Control"] = "no-cache"
         response.headers["ETag"] = self.get_etag(response_data)
-        # if "last_modified" in response_data:  # pragma: no cover
-        #     response.headers["Last-Modified"] = response_data["last_modified"]
+
+    def build_response(
+        self, request: Request, body: bytes, cache_hit: bool
+    ) -> Response:
+        """Response for a serialized body, 304 when the client has it already."""
+        response = Response(content=body, media_type="application/json")
+        self.set_response_headers(response, cache_hit, body)
+        if self.requested_resource_not_modified(request, body):
+            return Response(
+                status_code=int(HTTPStatus.NOT_MODIFIED),
+                headers={
+                    name: value
+                    for name, value in response.headers.items()
+                    if name.lower() not in ("content-length", "content-type")
+                },
+            )
+        return response
 
     def log(
         self,
@@ -203,11 +357,12 @@ class Cache(metaclass=MetaSingleton):
 
     @staticmethod
     def get_etag(cached_data: Union[str, bytes, Dict]) -> str:
-        if isinstance(cached_data, bytes):
-            cached_data = cached_data.decode()
-        if not isinstance(cached_data, str):
+        """Content hash of the body, the same in every process."""
+        if not isinstance(cached_data, (str, bytes)):
             cached_data = serialize_json(cached_data)
-        return f"W/{hash(cached_data)}"
+        if isinstance(cached_data, str):
+            cached_data = cached_data.encode()
+        return f'"{hashlib.blake2b(cached_data, digest_size=16).hexdigest()}"'
 
     @staticmethod
     def get_log_time():
@@ -20,3 +20,5 @@ class RedisEvent(IntEnum):
     KEY_FOUND_IN_CACHE = 5
     FAILED_TO_CACHE_KEY = 6
     PATTERN_INVALIDATED = 7
+    NAMESPACE_INVALIDATED = 8
+    STALE_KEYS_SWEPT = 9
@@ -1,12 +1,17 @@
 """cache.py"""
 
+import hashlib
+import json
 from collections import OrderedDict
-from inspect import Signature, signature
+from datetime import date, datetime
+from enum import Enum
+from inspect import Parameter, Signature, signature
 from typing import Any, Callable, Dict, List
 
 from fastapi import Request, Response
+from pydantic import BaseModel
 
-from cache.types import ArgType, SigParameters
+from cache.types import ArgType
 
 ALWAYS_IGNORE_ARG_TYPES = [Response, Request]
 
@@ -27,6 +32,70 @@ def get_cache_key_pattern(
     return f"{prefix}*.*(*)"
 
 
+def get_namespace_key(prefix: str, namespace: str) -> str:
+    """Key of the version counter embedded in every key of `namespace`."""
+    return f"{prefix}|{namespace}|version"
+
+
+def get_invalidation_channel(prefix: str) -> str:
+    """Pub/sub channel announcing "<namespace>|<version>" after each invalidation."""
+    return f"{prefix}|invalidate"
+
+
+class CacheKeyBuilder:
+    """Builds the cache keys of one function.
+
+    The signature, the parameters that make up the key and the key template
+    are computed once, when the function is decorated. The key ends with a
+    digest of a canonical JSON encoding of the relevant arguments, so
+    Pydantic params models, enums and dates give the same key however they
+    were passed.
+    """
+
+    def __init__(self, func: Callable):
+        self.sig = signature(func)
+        self.template = f"{func.__module__}.{func.__name__}({{}})"
+        self._defaults = {
+            name: param.default
+            for name, param in self.sig.parameters.items()
+            if param.default is not Parameter.empty
+        }
+        self._names: Dict[tuple, List[str]] = {}
+
+    def get_names(self, ignore_arg_types: List[ArgType]) -> List[str]:
+        """Parameters whose type is not ignored, memoized per ignore list."""
+        ignore_key = tuple(ignore_arg_types or ())
+        names = self._names.get(ignore_key)
+        if names is None:
+            ignored = set(ALWAYS_IGNORE_ARG_TYPES).union(ignore_key)
+            names = [
+                name
+                for name, param in self.sig.parameters.items()
+                if param.annotation not in ignored
+            ]
+            self._names[ignore_key] = names
+        return names
+
+    def build(
+        self,
+        prefix: str,
+        ignore_arg_types: List[ArgType],
+        *args: List,
+        **kwargs: Dict,
+    ) -> str:
+        names = self.get_names(ignore_arg_types)
+        if args:
+            func_args = get_func_args(self.sig, *args, **kwargs)
+        else:
+            # FastAPI passes every parameter by keyword, no binding needed
+            func_args = kwargs
+        values = [
+            func_args.get(name, self._defaults.get(name)) for name in names
+        ]
+        prefix = f"{prefix}:" if prefix else ""
+        return prefix + self.template.format(get_args_digest(names, values))
+
+
 def get_cache_key(
     prefix: str,
     ignore_arg_types: List[ArgType],
@@ -39,8 +108,8 @@ def get_cache_key(
     Args:
         prefix (`str`): Customizable namespace value that will prefix all cache keys.
         ignore_arg_types (`List[ArgType]`): Each argument to the API endpoint function is
-            used to compose the cache key by calling `str(arg)`. If there are any keys that
-            should not be used in this way (i.e., because their value has no effect on the
+            used to compose the cache key. If there are any keys that should not be
+            used in this way (i.e., because their value has no effect on the
             response, such as a `Request` or `Response` object) you can remove them from
             the cache key by including their type as a list item in ignore_key_types.
         func (`Callable`): Path operation function for an API endpoint.
@@ -49,18 +118,9 @@ def get_cache_key(
         `str`: Unique identifier for `func`, `*args` and `**kwargs` that can be used as a
             Redis key to retrieve cached API response data.
     """
-
-    if not ignore_arg_types:
-        ignore_arg_types = []
-    ignore_arg_types.extend(ALWAYS_IGNORE_ARG_TYPES)
-    ignore_arg_types = list(set(ignore_arg_types))
-    prefix = f"{prefix}:" if prefix else ""
-
-    sig = signature(func)
-    sig_params = sig.parameters
-    func_args = get_func_args(sig, *args, **kwargs)
-    args_str = get_args_str(sig_params, func_args, ignore_arg_types)
-    return f"{prefix}{func.__module__}.{func.__name__}({args_str})"
+    return CacheKeyBuilder(func).build(
+        prefix, ignore_arg_types, *args, **kwargs
+    )
 
 
 def get_func_args(
@@ -72,14 +132,32 @@ def get_func_args(
     return func_args.arguments
 
 
-def get_args_str(
-    sig_params: SigParameters,
-    func_args: "OrderedDict[str, Any]",
-    ignore_arg_types: List[ArgType],
-) -> str:
-    """Return a string with the name and value of all args whose type is not included in `ignore_arg_types`"""
-    return ",".join(
-        f"{arg}={val}"
-        for arg, val in func_args.items()
-        if sig_params[arg].annotation not in ignore_arg_types
+def canonical(value: Any) -> Any:
+    """JSON-ready form of an argument, equal for equal values."""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {str(key): canonical(val) for key, val in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = [canonical(val) for val in value]
+        if isinstance(value, (set, frozenset)):
+            items.sort(key=str)
+        return items
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def get_args_digest(names: List[str], values: List[Any]) -> str:
+    """Short hash of the canonical encoding of the named arguments."""
+    encoded = json.dumps(
+        [names, [canonical(value) for value in values]],
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
     )
+    return hashlib.blake2b(encoded.encode(), digest_size=12).hexdigest()
@@ -0,0 +1,116 @@
+"""local.py"""
+
+import time
+from collections import Counter, OrderedDict, defaultdict
+from typing import Any, Dict, Optional, Tuple
+
+
+class LocalCache:
+    """Per-process LRU in front of Redis, bounded by a byte budget and a TTL.
+
+    Entries hold serialized response bodies, sized by their length.
+    Namespace versions are kept here too, but only while the invalidation
+    subscription is up (`subscribed`), otherwise an invalidation made by
+    another process could be missed.
+    """
+
+    def __init__(self, max_bytes: int, ttl: int):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.subscribed = False
+        self.size = 0
+        self._entries: "OrderedDict[str, Tuple[str, float, int, Any]]" = (
+            OrderedDict()
+        )
+        self._versions: Dict[str, int] = {}
+        self._stats: Dict[str, Counter] = defaultdict(Counter)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and self.subscribed
+
+    def get(self, namespace: str, key: str) -> Tuple[bool, Any]:
+        entry = self._entries.get(key) if self.enabled else None
+        if entry is None:
+            return (False, None)
+        if entry[1] < time.monotonic():
+            self._pop(key)
+            return (False, None)
+        self._entries.move_to_end(key)
+        self._stats[namespace]["local_hits"] += 1
+        return (True, entry[3])
+
+    def set(
+        self, namespace: str, key: str, value: Any, size: int, ttl: int
+    ) -> None:
+        if not self.enabled or size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._pop(key)
+        expires_at = time.monotonic() + min(self.ttl, max(ttl, 0))
+        self._entries[key] = (namespace, expires_at, size, value)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (evicted, _, evicted_size, _) = self._entries.popitem(
+                last=False
+            )
+            self.size -= evicted_size
+            self._stats[evicted]["evictions"] += 1
+
+    def get_version(self, namespace: str) -> Optional[int]:
+        return self._versions.get(namespace) if self.enabled else None
+
+    def set_version(self, namespace: str, version: int) -> None:
+        """Keep the highest version seen, a new one drops the namespace."""
+        current = self._versions.get(namespace)
+        if current is not None and current >= version:
+            return
+        self._versions[namespace] = version
+        if current is not None:
+            self._stats[namespace]["invalidations"] += 1
+            for key in [
+                key
+                for key, entry in self._entries.items()
+                if entry[0] == namespace
+            ]:
+                self._pop(key)
+
+    def record(self, namespace: str, event: str) -> None:
+        self._stats[namespace][event] += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._versions.clear()
+        self.size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        namespaces = {}
+        for namespace, counter in self._stats.items():
+            lookups = (
+                counter["local_hits"]
+                + counter["redis_hits"]
+                + counter["misses"]
+            )
+            namespaces[namespace] = {
+                **counter,
+                "entries": sum(
+                    1
+                    for entry in self._entries.values()
+                    if entry[0] == namespace
+                ),
+                "hit_rate": (
+                    round((lookups - counter["misses"]) / lookups, 4)
+                    if lookups
+                    else 0
+                ),
+            }
+        return {
+            "enabled": self.enabled,
+            "size": self.size,
+            "max_bytes": self.max_bytes,
+            "namespaces": namespaces,
+        }
+
+    def _pop(self, key: str) -> None:
+        _, _, size, _ = self._entries.pop(key)
+        self.size -= size
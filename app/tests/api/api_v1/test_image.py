@@ -1,13 +1,86 @@
 import pytest
 from httpx import AsyncClient, ASGITransport
+from minio.datatypes import Object
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import crud
+from app.api.endpoints.images import parse_range
 from app.schemas import ImageCreateBase64
-from app.core.config import settings
+from app.core.config import ImageAccessMode, settings
 from app.main import app
+from app.utils import storage
 
 
 transport = ASGITransport(app=app)
 client = AsyncClient(transport=transport, base_url="http://test")
 
+CONTENT = bytes(range(256)) * 4
+
+
+class StubMinIO:
+    def __init__(self, content: bytes):
+        self.content = content
+        self.opened = []
+
+    async def stat_file(self, bucket_name: str, file_name: str) -> Object:
+        return Object(
+            bucket_name,
+            file_name,
+            etag="abc",
+            size=len(self.content),
+            content_type="image/png",
+        )
+
+    async def open_file(
+        self, bucket_name: str, file_name: str, offset: int, length: int
+    ) -> bytes:
+        self.opened.append((offset, length))
+        return self.content[offset : offset + length]
+
+    async def iter_file(self, response: bytes):
+        yield response
+
+
+@pytest.fixture
+def minio(monkeypatch) -> StubMinIO:
+    stub = StubMinIO(CONTENT)
+    monkeypatch.setattr(storage, "get_minio", lambda: stub)
+    monkeypatch.setattr(settings, "IMAGE_ACCESS_MODE", ImageAccessMode.PROXY)
+    return stub
+
+
+class TestParseRange:
+    def test_no_range(self):
+        assert parse_range(None, 100) is None
+        assert parse_range("bytes=-", 100) is None
+
+    def test_range(self):
+        assert parse_range("bytes=10-19", 100) == (10, 19)
+        assert parse_range("bytes=10-", 100) == (10, 99)
+        assert parse_range("bytes=90-200", 100) == (90, 99)
+
+    def test_suffix(self):
+        assert parse_range("bytes=-10", 100) == (90, 99)
+        assert parse_range("bytes=-200", 100) == (0, 99)
+
+    def test_empty_suffix_is_unsatisfiable(self):
+        with pytest.raises(ValueError):
+            parse_range("bytes=-0", 100)
+        with pytest.raises(ValueError):
+            parse_range("bytes=-10", 0)
+
+    def test_start_past_end_is_unsatisfiable(self):
+        with pytest.raises(ValueError):
+            parse_range("bytes=100-", 100)
+        with pytest.raises(ValueError):
+            parse_range("bytes=150-160", 100)
+
+    def test_reversed_range_is_ignored(self):
+        assert parse_range("bytes=20-10", 100) is None
+
+    def test_multiple_ranges_are_ignored(self):
+        assert parse_range("bytes=0-9,20-29", 100) is None
+        assert parse_range("items=0-9", 100) is None
+
 
 @pytest.mark.asyncio
 class TestImage:
@@ -22,6 +95,67 @@ class TestImage:
 
         assert response.status_code == 200
 
+    async def test_read_minio_range(
+        self, db: AsyncSession, login, minio: StubMinIO
+    ):
+        image = await crud.image.create_path(
+            db, obj_in={"path_image": "bucket/images/range.png"}
+        )
+
+        response = await client.get(
+            f"{settings.SUB_PATH}{settings.API_V1_STR}/images/get-image-minio/{image.id}",
+            headers={
+                "Authorization": f"{login["token_type"]} {login["access_token"]}",
+                "Range": "bytes=100-199",
+            },
+        )
+
+        assert response.status_code == 206
+        assert response.headers["Content-Range"] == "bytes 100-199/1024"
+        assert response.headers["Content-Length"] == "100"
+        assert response.headers["Accept-Ranges"] == "bytes"
+        assert response.content == CONTENT[100:200]
+        assert minio.opened == [(100, 100)]
+
+    async def test_read_minio_unsatisfiable_range(
+        self, db: AsyncSession, login, minio: StubMinIO
+    ):
+        image = await crud.image.create_path(
+            db, obj_in={"path_image": "bucket/images/range.png"}
+        )
+
+        response = await client.get(
+            f"{settings.SUB_PATH}{settings.API_V1_STR}/images/get-image-minio/{image.id}",
+            headers={
+                "Authorization": f"{login["token_type"]} {login["access_token"]}",
+                "Range": "bytes=2000-",
+            },
+        )
+
+        assert response.status_code == 416
+        assert response.headers["Content-Range"] == "bytes */1024"
+        assert minio.opened == []
+
+    @pytest.mark.parametrize("etag", ['"abc"', 'W/"abc"', '"x", W/"abc"'])
+    async def test_read_minio_not_modified(
+        self, db: AsyncSession, login, minio: StubMinIO, etag: str
+    ):
+        image = await crud.image.create_path(
+            db, obj_in={"path_image": "bucket/images/etag.png"}
+        )
+
+        response = await client.get(
+            f"{settings.SUB_PATH}{settings.API_V1_STR}/images/get-image-minio/{image.id}",
+            headers={
+                "Authorization": f"{login["token_type"]} {login["access_token"]}",
+                "If-None-Match": etag,
+            },
+        )
+
+        assert response.status_code == 304
+        assert response.content == b""
+        assert minio.opened == []
+
     # async def test_get_image(self, login):
     #     image_data = ImageCreateBase64(
     #         image="iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAAAXNSR0IArs4c6QAAAA1JREFUGFdjcBOp+A8AA0gB0kAdSDgAAAAASUVORK5CYII="
@@ -0,0 +1,92 @@
+"""Time the cache key build of a zone-list-like endpoint per request.
+
+run it from the app directory:
+
+    python -m tests.benchmarks.bench_cache_key --requests 100000
+
+"before" is the previous key_gen: `inspect.signature` on every call, the
+ignore list extended on every call and `str(arg)` for each argument.
+"after" is `CacheKeyBuilder`, built once at decoration time.
+"""
+
+import argparse
+import timeit
+from inspect import signature
+from typing import Annotated
+
+from fastapi import Depends, Request, Response
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache.key_gen import ALWAYS_IGNORE_ARG_TYPES, CacheKeyBuilder
+
+
+class User:
+    pass
+
+
+class ZoneParams(BaseModel):
+    input_name_zone: str | None = None
+    input_name_floor: str | None = None
+    input_number_floor: int | None = None
+    size: int | None = 100
+    page: int = 1
+    asc: bool = True
+
+
+async def read_zones(
+    *,
+    _: Annotated[bool, Depends(lambda: True)],
+    db: AsyncSession = None,
+    params: ZoneParams = Depends(),
+    current_user: User = None,
+):
+    pass
+
+
+def legacy_cache_key(prefix, ignore_arg_types, func, *args, **kwargs) -> str:
+    ignore_arg_types.extend(ALWAYS_IGNORE_ARG_TYPES)
+    ignore_arg_types = list(set(ignore_arg_types))
+    prefix = f"{prefix}:" if prefix else ""
+    sig = signature(func)
+    func_args = sig.bind(*args, **kwargs)
+    func_args.apply_defaults()
+    args_str = ",".join(
+        f"{arg}={val}"
+        for arg, val in func_args.arguments.items()
+        if sig.parameters[arg].annotation not in ignore_arg_types
+    )
+    return f"{prefix}{func.__module__}.{func.__name__}({args_str})"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=100_000)
+    args = parser.parse_args()
+
+    ignore_arg_types = [Request, Response, AsyncSession, User]
+    kwargs = dict(
+        _=True,
+        db=AsyncSession(),
+        params=ZoneParams(input_name_floor="B1", page=2),
+        current_user=User(),
+    )
+    prefix = "parking-api-cache|zones|v1"
+    builder = CacheKeyBuilder(read_zones)
+
+    timings = {
+        "before": lambda: legacy_cache_key(
+            prefix, list(ignore_arg_types), read_zones, **kwargs
+        ),
+        "after": lambda: builder.build(prefix, ignore_arg_types, **kwargs),
+    }
+    for name, build in timings.items():
+        seconds = timeit.timeit(build, number=args.requests)
+        print(
+            f"{name:>6}: {seconds / args.requests * 1e6:.2f} us/request"
+            f"  {build()}"
+        )
+
+
+if __name__ == "__main__":
+    main()
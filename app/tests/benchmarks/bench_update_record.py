@@ -0,0 +1,161 @@
+"""Replay a burst of mixed-plate events through the update_record task.
+
+run it from the app directory against a disposable database:
+
+    python -m tests.benchmarks.bench_update_record --plates 200 --workers 1 2 4 8
+
+every plate gets an entrance and an exit event, the burst is shuffled so
+plates interleave like they do at rush hour, and a thread pool stands in
+for the celery worker processes. records/sec is reported for each
+RECORD_LOCK_MODE and worker count.
+"""
+
+import argparse
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, UTC
+
+from sqlalchemy import create_engine, delete, update
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from app import models
+from app.core import celery_app as celery_module
+from app.core.config import RecordLockMode, settings
+from app.jobs.celery.worker import update_record
+from app.models.base import EquipmentType, ParkingPaymentType
+from app.schemas import TypeEvent
+from tests.utils.utils import random_lower_string
+
+
+def seed(session, plates: int) -> list[int]:
+    price = models.Price(
+        name=random_lower_string(), entrance_fee=0, hourly_fee=0
+    )
+    session.add(price)
+    session.flush()
+    zone = models.Zone(
+        name=random_lower_string(), capacity=plates, price_id=price.id
+    )
+    session.add(zone)
+    session.flush()
+    if not session.query(models.Parking).first():
+        session.add(
+            models.Parking(
+                name=random_lower_string(),
+                payment_type=ParkingPaymentType.ON_EXIT.value,
+            )
+        )
+    entrance = models.Equipment(
+        ping=0,
+        tag=random_lower_string(),
+        zone_id=zone.id,
+        equipment_type=EquipmentType.CAMERA_ENTRANCE_DOOR.value,
+    )
+    exit_ = models.Equipment(
+        ping=0,
+        tag=random_lower_string(),
+        zone_id=zone.id,
+        equipment_type=EquipmentType.CAMERA_EXIT_DOOR.value,
+    )
+    session.add_all([entrance, exit_])
+    session.flush()
+
+    now = datetime.now(UTC).replace(tzinfo=None)
+    events = []
+    for i in range(plates):
+        plate = f"{i:09d}"
+        events.append(
+            models.Event(
+                plate=plate,
+                zone_id=zone.id,
+                camera_id=entrance.id,
+                record_time=now,
+                type_event=TypeEvent.entranceDoor.value,
+            )
+        )
+        events.append(
+            models.Event(
+                plate=plate,
+                zone_id=zone.id,
+                camera_id=exit_.id,
+                record_time=now + timedelta(minutes=30),
+                type_event=TypeEvent.exitDoor.value,
+            )
+        )
+    session.add_all(events)
+    session.commit()
+    return [event.id for event in events]
+
+
+def reset(session, event_ids: list[int]) -> None:
+    record_ids = (
+        session.query(models.Event.record_id)
+        .filter(models.Event.id.in_(event_ids))
+        .subquery()
+    )
+    session.execute(
+        update(models.Event)
+        .where(models.Event.id.in_(event_ids))
+        .values(record_id=None)
+    )
+    session.execute(
+        delete(models.Bill).where(models.Bill.record_id.in_(record_ids))
+    )
+    session.execute(
+        delete(models.Record).where(models.Record.id.in_(record_ids))
+    )
+    session.commit()
+
+
+def replay(event_ids: list[int], workers: int) -> float:
+    # seed lists each plate's entrance then its exit, keep entrances before
+    # exits but interleave the plates
+    entrances, exits = event_ids[::2], event_ids[1::2]
+    burst = random.sample(entrances, len(entrances)) + random.sample(
+        exits, len(exits)
+    )
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(
+            pool.map(
+                lambda event_id: update_record.apply(args=[event_id]), burst
+            )
+        )
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--plates", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument(
+        "--dsn", default=str(settings.TEST_SQLALCHEMY_DATABASE_URI)
+    )
+    args = parser.parse_args()
+
+    engine = create_engine(
+        args.dsn, pool_size=max(args.workers) + 1, pool_pre_ping=True
+    )
+    celery_module.ScopedSession = scoped_session(
+        sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    )
+    session = sessionmaker(bind=engine)()
+    event_ids = seed(session, args.plates)
+
+    print(f"{'mode':<8}{'workers':>8}{'seconds':>10}{'records/s':>12}")
+    for mode in RecordLockMode:
+        settings.RECORD_LOCK_MODE = mode
+        for workers in args.workers:
+            reset(session, event_ids)
+            elapsed = replay(event_ids, workers)
+            print(
+                f"{mode.value:<8}{workers:>8}{elapsed:>10.2f}"
+                f"{args.plates / elapsed:>12.1f}"
+            )
+    reset(session, event_ids)
+    session.close()
+
+
+if __name__ == "__main__":
+    main()
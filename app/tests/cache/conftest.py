@@ -0,0 +1,22 @@
+import pytest_asyncio
+from fakeredis import aioredis
+
+from cache.client import DEFAULT_RESPONSE_HEADER, Cache
+from cache.enums import RedisStatus
+from cache.local import LocalCache
+
+
+@pytest_asyncio.fixture
+async def redis_cache() -> Cache:
+    """The cache singleton on a fresh fake redis, restored afterwards."""
+    redis_cache = Cache()
+    saved = dict(vars(redis_cache))
+    redis_cache.prefix = "test"
+    redis_cache.response_header = DEFAULT_RESPONSE_HEADER
+    redis_cache.ignore_arg_types = None
+    redis_cache.status = RedisStatus.CONNECTED
+    redis_cache.redis = aioredis.FakeRedis()
+    redis_cache.local = LocalCache(max_bytes=0, ttl=0)
+    yield redis_cache
+    vars(redis_cache).clear()
+    vars(redis_cache).update(saved)
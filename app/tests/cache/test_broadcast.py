@@ -0,0 +1,99 @@
+import pytest
+
+from cache.broadcast import Broadcast, Subscriber
+
+
+def make_subscriber(
+    channels: tuple[str, ...] = ("bills:1", "bills:2"),
+    queue_size: int = 2,
+    max_dropped: int = 0,
+) -> Subscriber:
+    return Subscriber(channels, queue_size, max_dropped)
+
+
+def queued(subscriber: Subscriber) -> list:
+    return [
+        subscriber.queue.get_nowait() for _ in range(subscriber.queue.qsize())
+    ]
+
+
+@pytest.mark.asyncio
+class TestSubscriber:
+    async def test_full_queue_drops_the_oldest(self):
+        subscriber = make_subscriber(queue_size=2)
+
+        assert subscriber.put("1", "bills:1")
+        assert subscriber.put("2", "bills:1")
+        assert not subscriber.put("3", "bills:1")
+
+        assert queued(subscriber) == ["2", "3"]
+        assert not subscriber.slow.is_set()
+
+    async def test_consumer_dropping_in_a_row_is_slow(self):
+        subscriber = make_subscriber(queue_size=1, max_dropped=2)
+        subscriber.put("1", "bills:1")
+        subscriber.put("2", "bills:1")
+        assert await subscriber.get() == "2"
+
+        # a read resets the count
+        subscriber.put("3", "bills:1")
+        subscriber.put("4", "bills:1")
+        assert not subscriber.slow.is_set()
+        subscriber.put("5", "bills:1")
+
+        assert subscriber.slow.is_set()
+        assert not subscriber.put("6", "bills:1")
+
+    async def test_copy_from_another_channel_is_queued_once(self):
+        subscriber = make_subscriber(queue_size=10)
+
+        subscriber.put("bill", "bills:1")
+        subscriber.put("bill", "bills:2")
+
+        assert queued(subscriber) == ["bill"]
+
+    async def test_same_payload_published_again_is_queued(self):
+        subscriber = make_subscriber(queue_size=10)
+
+        for channel in ("bills:1", "bills:2", "bills:1", "bills:2"):
+            subscriber.put("bill", channel)
+        subscriber.put("other", "bills:1")
+        subscriber.put("other", "bills:1")
+
+        assert queued(subscriber) == ["bill", "bill", "other", "other"]
+
+    async def test_single_channel_is_not_deduplicated(self):
+        subscriber = make_subscriber(channels=("bills:1",), queue_size=10)
+
+        subscriber.put("bill", "bills:1")
+        subscriber.put("bill", "bills:1")
+
+        assert queued(subscriber) == ["bill", "bill"]
+
+
+@pytest.mark.asyncio
+class TestDispatch:
+    async def test_pattern_copies_are_deduplicated_by_channel(self):
+        broadcast = Broadcast(queue_size=10, max_dropped=0)
+        subscriber = Subscriber(("bills:*",), 10, 0)
+        broadcast._subscribers["bills:*"].add(subscriber)
+
+        broadcast._dispatch("bills:*", "bill", "bills:1")
+        broadcast._dispatch("bills:*", "bill", "bills:2")
+        broadcast._dispatch("bills:*", "bill", "bills:1")
+
+        assert queued(subscriber) == ["bill", "bill"]
+        assert broadcast.stats()["channels"]["bills:*"]["messages"] == 3
+
+    async def test_filtered_message_is_not_queued(self):
+        broadcast = Broadcast(queue_size=10, max_dropped=0)
+        subscriber = Subscriber(
+            ("bills:1",), 10, 0, match=lambda bill: bill["zone_id"] == 1
+        )
+        broadcast._subscribers["bills:1"].add(subscriber)
+
+        broadcast._dispatch("bills:1", '{"zone_id": 2}')
+        broadcast._dispatch("bills:1", '{"zone_id": 1}')
+
+        assert queued(subscriber) == ['{"zone_id": 1}']
+        assert broadcast.stats()["channels"]["bills:1"]["filtered"] == 1
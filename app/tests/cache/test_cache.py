@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from cache import cache
+from cache.cache import single_flight
+from cache.client import Cache
+
+
+def counting_endpoint(namespace: str):
+    calls = []
+
+    @cache(namespace=namespace, expire=60, stale=30)
+    async def endpoint(item_id: int) -> dict:
+        calls.append(item_id)
+        await asyncio.sleep(0.05)
+        return {"item_id": item_id, "version": len(calls)}
+
+    return endpoint, calls
+
+
+@pytest.mark.asyncio
+class TestSingleFlight:
+    async def test_concurrent_misses_compute_once(self, redis_cache: Cache):
+        endpoint, calls = counting_endpoint("single-flight")
+
+        responses = await asyncio.gather(
+            *[endpoint(item_id=1) for _ in range(5)]
+        )
+
+        assert calls == [1]
+        assert {response.body for response in responses} == {
+            b'{"item_id":1,"version":1}'
+        }
+        assert {response.headers["ETag"] for response in responses} == {
+            Cache.get_etag(responses[0].body)
+        }
+
+    async def test_cancelled_leader_is_taken_over(self):
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.Event().wait()
+
+        async def compute():
+            return "fresh"
+
+        leader = asyncio.create_task(single_flight("take-over", hang))
+        await started.wait()
+        follower = asyncio.create_task(single_flight("take-over", compute))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert await follower == (False, "fresh")
+
+    async def test_failure_reaches_every_caller(self):
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def fail():
+            started.set()
+            await release.wait()
+            raise ValueError("failed")
+
+        leader = asyncio.create_task(single_flight("failure", fail))
+        await started.wait()
+        follower = asyncio.create_task(single_flight("failure", fail))
+        await asyncio.sleep(0)
+        release.set()
+
+        for task in (leader, follower):
+            with pytest.raises(ValueError):
+                await task
+
+
+@pytest.mark.asyncio
+class TestRevalidate:
+    async def test_stale_value_is_served_while_locked(
+        self, redis_cache: Cache
+    ):
+        endpoint, calls = counting_endpoint("revalidate")
+        first = await endpoint(item_id=1)
+        (key,) = await redis_cache.redis.keys(
+            redis_cache.get_cache_key_pattern("revalidate")
+        )
+        # expired but within `stale`, another process recomputes it
+        await redis_cache.redis.expire(key, 10)
+        await redis_cache.redis.set(key + b"|lock", "other", ex=10)
+
+        response = await endpoint(item_id=1)
+
+        assert calls == [1]
+        assert response.body == first.body
+        assert response.headers[redis_cache.response_header] == "Hit"
+
+    async def test_stale_value_is_recomputed_once_unlocked(
+        self, redis_cache: Cache
+    ):
+        endpoint, calls = counting_endpoint("recompute")
+        await endpoint(item_id=1)
+        (key,) = await redis_cache.redis.keys(
+            redis_cache.get_cache_key_pattern("recompute")
+        )
+        await redis_cache.redis.expire(key, 10)
+        # fake redis may not run the release script, the lock expired
+        await redis_cache.redis.delete(key + b"|lock")
+
+        response = await endpoint(item_id=1)
+
+        assert calls == [1, 1]
+        assert response.body == b'{"item_id":1,"version":2}'
+        assert response.headers[redis_cache.response_header] == "Miss"
+        assert await redis_cache.redis.ttl(key) > 30
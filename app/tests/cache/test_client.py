@@ -0,0 +1,72 @@
+from http import HTTPStatus
+
+import pytest
+from fastapi import Request
+
+from cache import cache
+from cache.client import Cache
+
+
+def make_request(headers: dict | None = None) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/",
+            "query_string": b"",
+            "headers": [
+                (name.lower().encode(), value.encode())
+                for name, value in (headers or {}).items()
+            ],
+        }
+    )
+
+
+@cache(namespace="client", expire=60)
+async def endpoint(item_id: int) -> dict:
+    return {"item_id": item_id}
+
+
+@pytest.mark.asyncio
+class TestConditionalResponse:
+    async def test_body_is_the_stored_value(self, redis_cache: Cache):
+        miss = await endpoint(item_id=1, cache_request_=make_request())
+        hit = await endpoint(item_id=1, cache_request_=make_request())
+
+        (key,) = await redis_cache.redis.keys(
+            redis_cache.get_cache_key_pattern("client")
+        )
+        stored = await redis_cache.redis.get(key)
+        assert miss.body == hit.body == stored
+        assert miss.headers[redis_cache.response_header] == "Miss"
+        assert hit.headers[redis_cache.response_header] == "Hit"
+        assert hit.headers["ETag"] == Cache.get_etag(stored)
+
+    @pytest.mark.parametrize("weak", [False, True])
+    async def test_matching_etag_gets_304_without_body(
+        self, redis_cache: Cache, weak: bool
+    ):
+        first = await endpoint(item_id=2, cache_request_=make_request())
+        etag = first.headers["ETag"]
+
+        response = await endpoint(
+            item_id=2,
+            cache_request_=make_request(
+                {"If-None-Match": f"W/{etag}" if weak else etag}
+            ),
+        )
+
+        assert response.status_code == HTTPStatus.NOT_MODIFIED
+        assert response.body == b""
+        assert response.headers["ETag"] == etag
+        assert "content-length" not in response.headers
+
+    async def test_other_etag_gets_the_body(self, redis_cache: Cache):
+        first = await endpoint(item_id=3, cache_request_=make_request())
+
+        response = await endpoint(
+            item_id=3, cache_request_=make_request({"If-None-Match": '"x"'})
+        )
+
+        assert response.status_code == HTTPStatus.OK
+        assert response.body == first.body
@@ -1,10 +1,25 @@
 import pytest
+from io import BytesIO
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import crud
 from app.schemas import ImageCreateBase64
+from app.utils import storage
 import base64
 
+# base 64 image 1px
+IMAGE = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAAAXNSR0IArs4c6QAAAA1JREFUGFdjcBOp+A8AA0gB0kAdSDgAAAAASUVORK5CYII="
+
+
+class StubMinIO:
+    def __init__(self, content: bytes):
+        self.content = content
+        self.downloaded = []
+
+    def download_file_sync(self, bucket_name: str, file_name: str):
+        self.downloaded.append(f"{bucket_name}/{file_name}")
+        return BytesIO(self.content)
+
 
 @pytest.mark.asyncio
 class TestImage:
@@ -29,3 +44,59 @@ class TestImage:
 
         assert image_get.id
         assert image_create.image == base64.b64encode(image_get.image).decode()
+
+    async def test_get_blobs_after_id(self, db: AsyncSession):
+        first = await crud.image.create_base64(
+            db=db, obj_in=ImageCreateBase64(image=IMAGE)
+        )
+        second = await crud.image.create_base64(
+            db=db, obj_in=ImageCreateBase64(image=IMAGE)
+        )
+        moved = await crud.image.create_path(
+            db, obj_in={"path_image": "bucket/db-images/moved.png"}
+        )
+
+        blobs = await db.run_sync(
+            lambda session: crud.image.get_blobs(
+                session, limit=100, after_id=first.id
+            )
+        )
+        await db.commit()
+
+        ids = [image.id for image in blobs]
+        assert second.id in ids
+        assert first.id not in ids
+        assert moved.id not in ids
+        assert ids == sorted(ids)
+
+    async def test_set_paths_keeps_modified(self, db: AsyncSession):
+        created = await crud.image.create_base64(
+            db=db, obj_in=ImageCreateBase64(image=IMAGE)
+        )
+        image = await crud.image.get(db, id=created.id)
+
+        await db.run_sync(
+            lambda session: crud.image.set_paths(
+                session, images=[image], paths=["bucket/db-images/1.png"]
+            )
+        )
+        await db.commit()
+        await db.refresh(image)
+
+        assert image.image is None
+        assert image.path_image == "bucket/db-images/1.png"
+        assert image.modified == created.modified
+
+    async def test_get_image_reads_minio(self, db: AsyncSession, monkeypatch):
+        minio = StubMinIO(base64.b64decode(IMAGE))
+        monkeypatch.setattr(storage, "get_minio", lambda: minio)
+        image = await crud.image.create_path(
+            db, obj_in={"path_image": "bucket/db-images/2.png"}
+        )
+
+        content = await db.run_sync(
+            lambda session: crud.image.get_image(session, id=image.id)
+        )
+
+        assert content == base64.b64decode(IMAGE)
+        assert minio.downloaded == ["bucket/db-images/2.png"]
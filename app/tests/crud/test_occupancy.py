@@ -0,0 +1,71 @@
+from datetime import datetime, UTC
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.parking.occupancy import COUNTERS_KEY, SYNCED_KEY, occupancy
+from app.parking.repo import zone_repo
+from app.parking.schemas import ZoneCreate
+from app.schemas.record import StatusRecord
+from cache.redis import redis_client
+from tests.utils.utils import random_lower_string
+
+
+def get_counter(zone_id: int) -> int:
+    field = f"{StatusRecord.unfinished.value}:{zone_id}"
+    return int(redis_client.hget(COUNTERS_KEY, field) or 0)
+
+
+def create_record(zone_id: int, is_deleted: bool = False) -> models.Record:
+    now = datetime.now(UTC).replace(tzinfo=None)
+    return models.Record(
+        plate=random_lower_string(),
+        zone_id=zone_id,
+        start_time=now,
+        end_time=now,
+        latest_status=StatusRecord.unfinished.value,
+        is_deleted=is_deleted,
+    )
+
+
+@pytest.mark.asyncio
+class TestOccupancyCounters:
+    async def test_soft_deleted_record_leaves_its_counter(
+        self, db: AsyncSession
+    ):
+        zone = await zone_repo.create(
+            db, obj_in=ZoneCreate(name=random_lower_string(), capacity=10)
+        )
+        record = create_record(zone.id)
+        db.add(record)
+        await db.commit()
+        assert get_counter(zone.id) == 1
+
+        record.is_deleted = True
+        await db.commit()
+        assert get_counter(zone.id) == 0
+
+        db.add(create_record(zone.id, is_deleted=True))
+        await db.commit()
+        assert get_counter(zone.id) == 0
+
+    async def test_reconcile_skips_soft_deleted_records(
+        self, db: AsyncSession
+    ):
+        zone = await zone_repo.create(
+            db, obj_in=ZoneCreate(name=random_lower_string(), capacity=10)
+        )
+        db.add_all(
+            [create_record(zone.id), create_record(zone.id, is_deleted=True)]
+        )
+        await db.commit()
+        redis_client.hincrby(
+            COUNTERS_KEY, f"{StatusRecord.unfinished.value}:{zone.id}", 5
+        )
+
+        # the first run resets the counters from the database
+        redis_client.delete(SYNCED_KEY)
+        await db.run_sync(occupancy.reconcile)
+
+        assert get_counter(zone.id) == 1
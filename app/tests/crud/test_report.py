@@ -0,0 +1,446 @@
+from datetime import datetime, timedelta, UTC
+
+import pytest
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.bill.schemas.bill import StatusBill
+from app.core.config import settings
+from app.models.base import EquipmentType
+from app.parking.repo import zone_repo
+from app.parking.schemas import ZoneCreate
+from app.report import schemas as report_schemas
+from app.report.models import RecordHourly
+from app.report.services import report as report_services
+from app.report.services import rollup as rollup_services
+from app.schemas.record import StatusRecord
+from cache.redis import redis_client
+from tests.utils.utils import random_lower_string
+
+
+async def create_zone_with_records(
+    db: AsyncSession, parent_id: int | None = None
+) -> models.Zone:
+    zone = await zone_repo.create(
+        db,
+        obj_in=ZoneCreate(
+            name=random_lower_string(), capacity=10, parent_id=parent_id
+        ),
+    )
+    now = datetime.now(UTC).replace(tzinfo=None)
+    db.add_all(
+        [
+            models.Record(
+                plate=random_lower_string(),
+                zone_id=zone.id,
+                start_time=now - timedelta(hours=2),
+                end_time=now - timedelta(hours=1),
+                latest_status=StatusRecord.finished.value,
+            ),
+            models.Record(
+                plate=random_lower_string(),
+                zone_id=zone.id,
+                start_time=now - timedelta(minutes=30),
+                end_time=now - timedelta(minutes=30),
+                latest_status=StatusRecord.unfinished.value,
+            ),
+        ]
+    )
+    await db.commit()
+    return zone
+
+
+async def count_queries(db: AsyncSession, start_time, end_time):
+    queries = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        queries.append(statement)
+
+    sync_engine = db.bind.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        zones = await report_services.report_zone(db, start_time, end_time)
+    finally:
+        event.remove(
+            sync_engine, "before_cursor_execute", before_cursor_execute
+        )
+    return zones, len(queries)
+
+
+@pytest.mark.asyncio
+class TestReportZone:
+    async def test_report_zone_query_count_constant(self, db: AsyncSession):
+        now = datetime.now(UTC).replace(tzinfo=None)
+        start_time, end_time = now - timedelta(days=1), now + timedelta(days=1)
+
+        parent = await create_zone_with_records(db)
+        await create_zone_with_records(db, parent_id=parent.id)
+        _, queries_few_zones = await count_queries(db, start_time, end_time)
+
+        for _ in range(5):
+            await create_zone_with_records(db)
+        zones, queries_many_zones = await count_queries(
+            db, start_time, end_time
+        )
+
+        assert queries_few_zones == queries_many_zones
+
+        report_parent = next(zone for zone in zones if zone.id == parent.id)
+        assert report_parent.total_referred == 2
+        assert report_parent.time_park_minute_today == 60
+        # unfinished records of the child zone count for the parent
+        assert report_parent.full == 2
+        assert report_parent.empty == 8
+
+    async def test_count_referred_by_zone_buckets(self, db: AsyncSession):
+        zone = await zone_repo.create(
+            db, obj_in=ZoneCreate(name=random_lower_string(), capacity=10)
+        )
+        db.add_all(
+            [
+                models.Record(
+                    plate=random_lower_string(),
+                    zone_id=zone.id,
+                    start_time=start_time,
+                    end_time=start_time + timedelta(hours=1),
+                    latest_status=StatusRecord.finished.value,
+                )
+                for start_time in (
+                    datetime(2024, 1, 1, 10),
+                    datetime(2024, 1, 3, 12),
+                )
+            ]
+        )
+        await db.commit()
+
+        result = await report_services.get_count_referred_by_zone(
+            db,
+            start_time_in=datetime(2024, 1, 1),
+            end_time_in=datetime(2024, 1, 3),
+            timing=report_schemas.Timing.day,
+            zone_id=zone.id,
+        )
+
+        assert [item["count"] for item in result[zone.name]] == [1, 0, 1]
+        assert [item["count"] for item in result["total"]] == [1, 0, 1]
+
+    async def test_effective_utilization_rate_clips_overlap(
+        self, db: AsyncSession
+    ):
+        zone = await zone_repo.create(
+            db, obj_in=ZoneCreate(name=random_lower_string(), capacity=1)
+        )
+        db.add(
+            models.Record(
+                plate=random_lower_string(),
+                zone_id=zone.id,
+                start_time=datetime(2024, 2, 1, 22),
+                end_time=datetime(2024, 2, 2, 2),
+                latest_status=StatusRecord.finished.value,
+            )
+        )
+        await db.commit()
+
+        rates = await report_services.effective_utilization_rate(
+            db,
+            start_time_in=datetime(2024, 2, 2),
+            end_time_in=datetime(2024, 2, 2, 23, 59, 59),
+        )
+        rate = next(item[zone.name] for item in rates if zone.name in item)
+
+        # only the 2 hours inside the range count
+        assert rate["effective_utilization_rate"] == round(2 / 24 * 100, 2)
+
+
+def clip_overlap(intervals: list[tuple], buckets: list[dict]) -> dict:
+    """{bucket index: (count, seconds)}, the overlap computed in python."""
+    overlap = {}
+    for idx, bucket in enumerate(buckets, start=1):
+        touching = [
+            (start, end)
+            for start, end in intervals
+            if end >= bucket["start"] and start <= bucket["end"]
+        ]
+        if touching:
+            overlap[idx] = (
+                len(touching),
+                sum(
+                    (
+                        min(end, bucket["end"]) - max(start, bucket["start"])
+                    ).total_seconds()
+                    for start, end in touching
+                ),
+            )
+    return overlap
+
+
+@pytest.mark.asyncio
+async def test_overlap_by_buckets_matches_python_clipping(db: AsyncSession):
+    zone = await zone_repo.create(
+        db, obj_in=ZoneCreate(name=random_lower_string(), capacity=10)
+    )
+    day = datetime(2024, 5, 1)
+    intervals = [
+        # ends on the first bucket's start, starts on the last bucket's end
+        (day.replace(hour=9), day.replace(hour=10)),
+        (day.replace(hour=12), day.replace(hour=13)),
+        # across the boundary between the buckets
+        (day.replace(hour=10, minute=30), day.replace(hour=11, minute=30)),
+        # around both buckets
+        (day.replace(hour=8), day.replace(hour=13)),
+        # outside
+        (day.replace(hour=14), day.replace(hour=15)),
+    ]
+    db.add_all(
+        [
+            models.Record(
+                plate=random_lower_string(),
+                zone_id=zone.id,
+                start_time=start,
+                end_time=end,
+                latest_status=StatusRecord.finished.value,
+            )
+            for start, end in intervals
+        ]
+    )
+    await db.commit()
+    buckets = [
+        {"start": day.replace(hour=10), "end": day.replace(hour=11)},
+        {"start": day.replace(hour=11), "end": day.replace(hour=12)},
+    ]
+
+    overlap = await report_services.get_overlap_by_buckets(
+        db, buckets=buckets, zone_id=zone.id
+    )
+
+    expected = clip_overlap(intervals, buckets)
+    assert expected == {1: (3, 5400), 2: (3, 5400)}
+    assert {
+        idx: (count, seconds) for (_, idx), (count, seconds) in overlap.items()
+    } == expected
+
+
+def test_split_rollup_range():
+    start_time = datetime(2024, 3, 1, 8, 30)
+    end_time = datetime(2024, 3, 1, 23, 59, 59, 999999)
+
+    rollup_range, raw_ranges = rollup_services.split_rollup_range(
+        start_time, end_time, synced_at=datetime(2024, 3, 1, 12, 10)
+    )
+
+    assert rollup_range == (datetime(2024, 3, 1, 9), datetime(2024, 3, 1, 12))
+    assert raw_ranges == [
+        (start_time, datetime(2024, 3, 1, 8, 59, 59, 999999)),
+        (datetime(2024, 3, 1, 12), end_time),
+    ]
+    assert rollup_services.split_rollup_range(
+        start_time, end_time, synced_at=None
+    ) == (None, [(start_time, end_time)])
+
+
+async def count_rollup(db: AsyncSession, zone_id: int, hour: datetime) -> int:
+    return await db.scalar(
+        select(func.coalesce(func.sum(RecordHourly.count_referred), 0)).filter(
+            RecordHourly.zone_id == zone_id, RecordHourly.hour == hour
+        )
+    )
+
+
+async def update_rollups(db: AsyncSession, since: datetime) -> datetime:
+    rollup_services.set_synced_at(since)
+    await db.run_sync(rollup_services.update_rollups)
+    return rollup_services.get_synced_at()
+
+
+@pytest.mark.asyncio
+class TestRollups:
+    @pytest.fixture(autouse=True)
+    def reset_synced_at(self):
+        yield
+        # the other reports read the raw tables without a watermark
+        redis_client.delete(rollup_services.SYNCED_AT_KEY)
+
+    async def test_update_rebuilds_hour_a_record_moved_out_of(
+        self, db: AsyncSession
+    ):
+        zone = await zone_repo.create(
+            db, obj_in=ZoneCreate(name=random_lower_string(), capacity=10)
+        )
+        record = models.Record(
+            plate=random_lower_string(),
+            zone_id=zone.id,
+            start_time=datetime(2024, 4, 1, 10, 15),
+            end_time=datetime(2024, 4, 1, 10, 45),
+            latest_status=StatusRecord.finished.value,
+        )
+        db.add(record)
+        await db.commit()
+        since = datetime.now(UTC).replace(tzinfo=None) - timedelta(minutes=5)
+        await update_rollups(db, since)
+        assert await count_rollup(db, zone.id, datetime(2024, 4, 1, 10)) == 1
+
+        record.start_time = datetime(2024, 4, 1, 12, 15)
+        record.end_time = datetime(2024, 4, 1, 12, 45)
+        await db.commit()
+        await update_rollups(db, since)
+
+        assert await count_rollup(db, zone.id, datetime(2024, 4, 1, 10)) == 0
+        assert await count_rollup(db, zone.id, datetime(2024, 4, 1, 12)) == 1
+
+    async def test_watermark_rescans_rows_committed_late(
+        self, db: AsyncSession
+    ):
+        zone = await zone_repo.create(
+            db, obj_in=ZoneCreate(name=random_lower_string(), capacity=10)
+        )
+        started = datetime.now(UTC).replace(tzinfo=None)
+        synced_at = await update_rollups(db, started - timedelta(minutes=5))
+        assert synced_at <= started - timedelta(
+            seconds=settings.ROLLUP_SYNC_MARGIN
+        )
+
+        # flushed before the run above, committed after it
+        db.add(
+            models.Record(
+                plate=random_lower_string(),
+                zone_id=zone.id,
+                start_time=datetime(2024, 4, 2, 10, 15),
+                end_time=datetime(2024, 4, 2, 10, 45),
+                latest_status=StatusRecord.finished.value,
+                modified=synced_at + timedelta(microseconds=1),
+            )
+        )
+        await db.commit()
+        await update_rollups(db, synced_at)
+
+        assert await count_rollup(db, zone.id, datetime(2024, 4, 2, 10)) == 1
+
+    async def test_reports_read_rollups_like_raw_tables(
+        self, db: AsyncSession
+    ):
+        zone = await zone_repo.create(
+            db, obj_in=ZoneCreate(name=random_lower_string(), capacity=10)
+        )
+        camera_entrance, camera_exit = [
+            models.Equipment(
+                ping=0,
+                tag=random_lower_string(),
+                equipment_type=equipment_type.value,
+                zone_id=zone.id,
+            )
+            for equipment_type in (
+                EquipmentType.CAMERA_ENTRANCE_DOOR,
+                EquipmentType.CAMERA_EXIT_DOOR,
+            )
+        ]
+        db.add_all([camera_entrance, camera_exit])
+        await db.flush()
+        day = datetime(2023, 5, 10)
+        db.add_all(
+            [
+                models.Record(
+                    plate=random_lower_string(),
+                    zone_id=zone.id,
+                    start_time=day.replace(hour=hour, minute=minute),
+                    end_time=day.replace(hour=hour + 1),
+                    camera_entrance_id=camera_entrance.id,
+                    camera_exit_id=camera_exit.id if finished else None,
+                    latest_status=(
+                        StatusRecord.finished.value
+                        if finished
+                        else StatusRecord.unfinished.value
+                    ),
+                )
+                for hour, minute, finished in (
+                    (8, 20, True),
+                    (8, 40, True),
+                    (9, 10, True),
+                    (10, 45, False),
+                    (12, 10, True),
+                    (12, 50, True),
+                )
+            ]
+        )
+        db.add_all(
+            [
+                models.Bill(
+                    plate=random_lower_string(),
+                    zone_id=zone.id,
+                    created=day.replace(hour=hour, minute=minute),
+                    price=price,
+                    status=status,
+                )
+                for hour, minute, price, status in (
+                    (8, 15, 1000, StatusBill.paid),
+                    (8, 45, 2000, StatusBill.unpaid),
+                    (9, 30, 3000, StatusBill.paid),
+                    (11, 15, 4000, None),
+                    (12, 20, 5000, StatusBill.unpaid),
+                    (12, 40, 6000, StatusBill.paid),
+                )
+            ]
+        )
+        await db.commit()
+        # both edges cut through an hour
+        start_time, end_time = day.replace(hour=8, minute=30), day.replace(
+            hour=12, minute=29, second=59
+        )
+
+        async def reports():
+            return [
+                await report_services.capacity(db, start_time, end_time),
+                await report_services.report_bill(
+                    db,
+                    zone_id=zone.id,
+                    start_time_in=start_time,
+                    end_time_in=end_time,
+                ),
+                await report_services.report_bill_by_timing(
+                    db,
+                    timing=report_schemas.Timing.day,
+                    zone_id=zone.id,
+                    start_time_in=start_time,
+                    end_time_in=end_time,
+                ),
+                await report_services.avg_price_per_referred(
+                    db,
+                    start_time_in=start_time,
+                    end_time_in=end_time,
+                    zone_id=zone.id,
+                ),
+                await report_services.count_entrance_exit_zone(
+                    db,
+                    zone_id_in=zone.id,
+                    start_time_in=start_time,
+                    end_time_in=end_time,
+                ),
+                await report_services.get_count_referred_by_zone(
+                    db,
+                    start_time_in=start_time,
+                    end_time_in=end_time,
+                    timing=report_schemas.Timing.day,
+                    zone_id=zone.id,
+                ),
+                await report_services.get_count_entry_leave_by_zone(
+                    db,
+                    start_time_in=start_time,
+                    end_time_in=end_time,
+                    timing=report_schemas.Timing.day,
+                    door_type=report_schemas.DoorType.exit,
+                    zone_id=zone.id,
+                ),
+            ]
+
+        raw = await reports()
+        await db.run_sync(
+            rollup_services.backfill_rollups, day, day + timedelta(days=1)
+        )
+        rollup_range, _ = rollup_services.split_range(start_time, end_time)
+        assert rollup_range == (day.replace(hour=9), day.replace(hour=12))
+
+        assert await reports() == raw
+        assert raw[1]["total_bills"] == {"price": 14000, "count": 4}
+        assert raw[1]["bills_unpaid"] == {"price": 7000, "count": 2}
+        assert raw[4].count_entrance[zone.name] == {camera_entrance.tag: 4}
+        assert raw[4].count_exit[zone.name] == {camera_exit.tag: 3}
@@ -52,3 +52,34 @@ class TestZone:
             assert zone.name == zone_create.name
             assert zone.floor_number == zone_create.floor_number
             assert zone.floor_name == zone_create.floor_name
+
+    async def test_children_ancestors_follow_parent_update(
+        self, db: AsyncSession
+    ):
+        root = await zone_repo.create(
+            db, obj_in=ZoneCreate(name=random_lower_string())
+        )
+        middle = await zone_repo.create(
+            db,
+            obj_in=ZoneCreate(name=random_lower_string(), parent_id=root.id),
+        )
+        leaf = await zone_repo.create(
+            db,
+            obj_in=ZoneCreate(name=random_lower_string(), parent_id=middle.id),
+        )
+
+        assert await zone_services.get_children(db, root) == {
+            middle.id,
+            leaf.id,
+        }
+        assert await zone_services.get_ancestors(db, leaf) == {
+            root.id,
+            middle.id,
+        }
+
+        leaf = await zone_repo.update(
+            db, db_obj=leaf, obj_in={"parent_id": root.id}
+        )
+
+        assert await zone_services.get_children(db, middle) == set()
+        assert await zone_services.get_ancestors(db, leaf) == {root.id}
@@ -0,0 +1,66 @@
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app import models
+from app.db.outbox import outbox
+from tests.utils.utils import random_lower_string
+
+
+class StubPublisher:
+    def __init__(self):
+        self.messages = []
+
+    def put(self, messages: list[tuple[str, str | bytes]]) -> None:
+        self.messages.extend(messages)
+
+
+@pytest.fixture
+def published(monkeypatch) -> list:
+    stub = StubPublisher()
+    monkeypatch.setattr(outbox, "publisher", stub)
+    return stub.messages
+
+
+@pytest.mark.asyncio
+class TestOutbox:
+    async def test_published_after_commit_with_generated_id(
+        self, db: AsyncSession, published: list
+    ):
+        price = models.Price(name=random_lower_string())
+        db.add(price)
+        outbox.add(db, "test", lambda: f"price {price.id}")
+
+        await db.flush()
+        assert published == []
+
+        await db.commit()
+        assert published == [("test", f"price {price.id}")]
+
+    async def test_dropped_on_rollback(
+        self, db: AsyncSession, published: list
+    ):
+        db.add(models.Price(name=random_lower_string()))
+        outbox.add(db, "test", "rolled back")
+        await db.flush()
+        await db.rollback()
+
+        await db.commit()
+        assert published == []
+
+    async def test_rendered_before_instances_expire(
+        self, db: AsyncSession, published: list
+    ):
+        # expire_on_commit is on, a message rendered after the commit
+        # would need a lazy load, which an AsyncSession can't do there
+        async with async_sessionmaker(bind=db.bind)() as session:
+            price = models.Price(name=random_lower_string())
+            session.add(price)
+            await session.commit()
+
+            await session.refresh(price)
+            price.name = random_lower_string()
+            outbox.add(session, "test", lambda: price.name)
+            name = price.name
+            await session.commit()
+
+        assert published == [("test", name)]